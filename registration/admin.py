@@ -19,6 +19,7 @@ from django.forms import NumberInput, widgets
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html, urlencode
 from django.utils.safestring import mark_safe
 from import_export import fields, resources
@@ -32,7 +33,15 @@ from qrcode.image.svg import SvgPathFillImage
 import registration.emails
 import registration.views.onsite_admin
 import registration.views.printing
-from registration import mqtt, payments
+from registration import (
+    mqtt,
+    payments,
+    pdf_cache,
+    print_jobs,
+    square_devices,
+    webhooks,
+)
+from registration.events import get_default_event
 from registration.forms import FirebaseForm
 from registration.models import *
 
@@ -89,7 +98,13 @@ admin.site.register(User, UserProfileAdmin)
 
 
 class FirebaseAdmin(admin.ModelAdmin):
-    list_display = ("name", "cashdrawer", "print_via_mqtt", "background_color", "webview")
+    list_display = (
+        "name",
+        "cashdrawer",
+        "print_via_mqtt",
+        "background_color",
+        "webview",
+    )
     form = FirebaseForm
 
     def render_change_form(self, request, context, *args, **kwargs):
@@ -97,6 +112,11 @@ class FirebaseAdmin(admin.ModelAdmin):
             request, context, *args, **kwargs
         )
 
+    def get_form(self, request, obj=None, **kwargs):
+        # Keep the Square Terminal choices current without waiting on Square.
+        square_devices.refresh_if_stale()
+        return super(FirebaseAdmin, self).get_form(request, obj, **kwargs)
+
     def get_urls(self):
         urls = super(FirebaseAdmin, self).get_urls()
         my_urls = [
@@ -838,7 +858,7 @@ admin.site.register(Staff, StaffAdmin)
 
 
 def make_staff(modeladmin, request, queryset):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     skipped = 0
     for att in queryset:
         if Staff.objects.filter(attendee=att, event=event).exists():
@@ -899,17 +919,16 @@ resend_confirmation_email.short_description = "Resend confirmation email"
 @transaction.atomic
 def assign_badge_numbers(modeladmin, request, queryset):
     first_badge = queryset[0]
-    event = first_badge.event or Event.objects.get(default=True)
-    badges = Badge.objects.filter(event=event)
+    event = first_badge.event or get_default_event()
     highest = Badge.objects.filter(event=event, badgeNumber__isnull=False).aggregate(
         Max("badgeNumber")
     )["badgeNumber__max"]
     if highest is None:
         highest = 0
 
-    for badge in queryset.order_by("registeredDate"):
+    for badge in queryset.with_status().order_by("registeredDate"):
         # skip assigning to badges not in current event
-        if badge not in badges:
+        if badge.event_id != event.id:
             messages.warning(
                 request,
                 f"skipped assinging {badge} a number beacuse it is outside of current event",
@@ -920,7 +939,7 @@ def assign_badge_numbers(modeladmin, request, queryset):
         if badge.badgeNumber is not None:
             continue
         # Skip badges that are not assigned a registration level
-        level = badge.effectiveLevel()
+        level = badge.effective_level_name
         if level is None or level == Badge.UNPAID:
             messages.warning(
                 request,
@@ -954,35 +973,49 @@ def get_attendee_age(attendee):
 
 
 def print_badges(modeladmin, request, queryset):
+    if print_jobs.use_print_jobs():
+        job = print_jobs.enqueue(queryset, request=request)
+        messages.success(
+            request,
+            format_html(
+                'Queued <a href="{}">{}</a>.',
+                reverse("admin:registration_printjob_change", args=(job.pk,)),
+                job,
+            ),
+        )
+        return HttpResponseRedirect(request.get_full_path())
+
     if getattr(settings, "PRINT_RENDERER", "wkhtmltopdf") == "gotenberg":
         signer = TimestampSigner()
-        data = signer.sign_object({
-            "badge_ids": [badge.id for badge in queryset],
-        })
+        data = signer.sign_object(
+            {
+                "badge_ids": [badge.id for badge in queryset],
+            }
+        )
 
         pdf_path = reverse("registration:pdf") + f"?data={data}"
     else:
         pdf_name = generate_badge_labels(queryset, request)
         pdf_path = reverse("registration:pdf") + f"?file={pdf_name}"
 
-
     response = HttpResponseRedirect(reverse("registration:print"))
     url_params = {"file": pdf_path, "next": request.get_full_path()}
     response["Location"] += "?{}".format(urlencode(url_params))
     return response
 
 
-def generate_badge_labels(queryset, request):
+def generate_badge_labels(queryset, request=None, mark_printed=True):
     con = printing.Main(local=True)
     tags = []
-    for badge in queryset:
+    for badge in queryset.with_status().select_related("attendee", "event"):
         # print the badge
-        level = badge.effectiveLevel()
+        level = badge.effective_level_name
         if level is None or level == Badge.UNPAID:
-            messages.warning(
-                request,
-                f"skipped printing {badge} a number beacuse it's registration level is {level}",
-            )
+            warning = f"skipped printing {badge} a number beacuse it's registration level is {level}"
+            if request is None:
+                logger.warning(warning)
+            else:
+                messages.warning(request, warning)
             continue
         if badge.badgeNumber is None:
             badge_number = ""
@@ -991,7 +1024,7 @@ def generate_badge_labels(queryset, request):
 
         badge_type = get_badge_type(badge)
         if badge_type == "Attendee":
-            printed_badge_level = html.escape(str(badge.effectiveLevel()))
+            printed_badge_level = html.escape(level)
         elif badge_type == "Dealer":
             printed_badge_level = "Dealer"
         elif badge_type == "Staff":
@@ -1007,22 +1040,43 @@ def generate_badge_labels(queryset, request):
             }
         )
 
-        badge.printed = True
-        badge.save()
+        if mark_printed:
+            badge.printed = True
+            badge.save()
 
     if len(tags) == 0:
-        messages.warning(request, "None of the selected badges can be printed.")
+        if request is None:
+            logger.warning("None of the selected badges can be printed.")
+        else:
+            messages.warning(request, "None of the selected badges can be printed.")
         return
-    con.nametags(tags, theme=badge.event.badgeTheme)
+
+    theme = badge.event.badgeTheme
+    if con.tag.uses_clock(theme):
+        con.nametags(tags, theme=theme)
+        return pdf_cache.store_uncached(con.pdf).name
+
+    # Identical reprints are served from the cache without rendering.
+    key = pdf_cache.get_key(theme, con.tag.template_version(theme), tags)
+    pdf = pdf_cache.lookup(key)
+    if pdf is None:
+        con.nametags(tags, theme=theme)
+        pdf = pdf_cache.store_file(key, con.pdf)
     # serve up this file
-    pdf_path = con.pdf.split("/")[-1]
-    return pdf_path
+    return pdf.name
 
 
 print_badges.short_description = "Print Badges"
 
 
 def get_badge_type(badge):
+    # use the with_status() annotations when available
+    if hasattr(badge, "association"):
+        if badge.is_staff:
+            return "Staff"
+        if badge.is_dealer:
+            return "Dealer"
+        return "Attendee"
     # check if staff
     try:
         staff = Staff.objects.get(attendee=badge.attendee, event=badge.event)
@@ -1095,7 +1149,7 @@ class BadgeResource(resources.ModelResource):
     badge_level = fields.Field()
 
     def dehydrate_badge_level(self, badge):
-        return badge.effectiveLevel()
+        return badge.statusEffectiveLevel
 
     class Meta:
         model = Badge
@@ -1165,16 +1219,16 @@ class BadgeAdmin(NestedModelAdmin, ImportExportModelAdmin):
     resource_class = BadgeResource
     save_on_top = True
     list_filter = ("event", "printed", PriceLevelFilter)
-    list_select_related = ("event", "attendee")
+    list_select_related = ("event", "attendee", "statusLevel")
     raw_id_fields = ("attendee",)
     list_display = (
         "attendee",
         "badgeName",
         "badgeNumber",
         "printed",
-        "paidTotal",
-        "effectiveLevel",
-        "abandoned",
+        "statusPaidTotal",
+        "get_effective_level",
+        "statusAssociation",
         "get_age_range",
         "registeredDate",
     )
@@ -1230,8 +1284,15 @@ class BadgeAdmin(NestedModelAdmin, ImportExportModelAdmin):
 
     get_age_range.short_description = "Age Group"
 
+    def get_effective_level(self, obj):
+        return obj.statusEffectiveLevel
+
+    get_effective_level.short_description = "Effective level"
+
     def cull_abandoned_carts(self, request, queryset):
-        abandoned = [x for x in Badge.objects.filter() if x.abandoned == "Abandoned"]
+        # Stored status narrows the candidates; confirm each before deleting.
+        candidates = Badge.objects.filter(statusAssociation=Badge.ABANDONED)
+        abandoned = [x for x in candidates if x.abandoned == Badge.ABANDONED]
         for obj in abandoned:
             obj.delete()
         self.message_user(
@@ -1464,7 +1525,9 @@ class OrderAdmin(ImportExportModelAdmin, NestedModelAdmin):
             form = self.RefundForm(request.POST)
 
             if form.is_valid():
-                amount = Decimal(form.cleaned_data["amount"]).quantize(registration.views.onsite_admin.TWOPLACES)
+                amount = Decimal(form.cleaned_data["amount"]).quantize(
+                    registration.views.onsite_admin.TWOPLACES
+                )
                 reason = form.cleaned_data.get("reason")
 
                 if amount > order.total:
@@ -1512,7 +1575,18 @@ admin.site.register(Order, OrderAdmin)
 
 
 class PriceLevelAdmin(admin.ModelAdmin):
-    list_display = ("name", "basePrice", "get_level_active_status", "min_age", "max_age", "public", "available_to_attendee", "available_to_marketplace", "available_to_staff", "group")
+    list_display = (
+        "name",
+        "basePrice",
+        "get_level_active_status",
+        "min_age",
+        "max_age",
+        "public",
+        "available_to_attendee",
+        "available_to_marketplace",
+        "available_to_staff",
+        "group",
+    )
 
 
 admin.site.register(PriceLevel, PriceLevelAdmin)
@@ -1535,8 +1609,26 @@ class PriceLevelOptionAdmin(admin.ModelAdmin):
 admin.site.register(PriceLevelOption, PriceLevelOptionAdmin)
 
 
+class OptionInventoryAdmin(admin.ModelAdmin):
+    list_display = ("option", "event", "sold")
+    list_filter = ("event",)
+    list_select_related = ("option", "event")
+    readonly_fields = ("option", "event", "sold")
+
+
+admin.site.register(OptionInventory, OptionInventoryAdmin)
+
+
 class DiscountAdmin(admin.ModelAdmin):
-    list_display = ("codeName", "amountOff", "percentOff", "oneTime", "used", "status", "waiveRequiredDonation")
+    list_display = (
+        "codeName",
+        "amountOff",
+        "percentOff",
+        "oneTime",
+        "used",
+        "status",
+        "waiveRequiredDonation",
+    )
     save_on_top = True
 
 
@@ -1609,11 +1701,47 @@ def json_highlight_format_value(value):
 
 
 class PaymentWebhookAdmin(admin.ModelAdmin):
-    list_display = ("event_id", "event_type", "timestamp", "integration", "processed")
+    list_display = (
+        "event_id",
+        "event_type",
+        "timestamp",
+        "integration",
+        "processed",
+        "attempts",
+    )
     list_filter = ("event_type", "processed")
-    search_fields = ["event_id"]
-    readonly_fields = ("processed", "body_highlighted", "headers_highlighted")
+    search_fields = ["event_id", "paymentId"]
+    date_hierarchy = "timestamp"
+    readonly_fields = (
+        "processed",
+        "processedAt",
+        "paymentId",
+        "attempts",
+        "nextAttempt",
+        "error",
+        "body_highlighted",
+        "headers_highlighted",
+    )
     exclude = ("body", "headers")
+    actions = ["replay_webhooks"]
+
+    def replay_webhooks(self, request, queryset):
+        # The changelist filters (eg. processed) may no longer match afterwards.
+        queryset = PaymentWebhookNotification.objects.filter(
+            pk__in=list(queryset.values_list("pk", flat=True))
+        )
+        count = webhooks.replay(queryset)
+        if webhooks.use_queue():
+            messages.success(request, f"Queued {count} webhooks to be replayed.")
+            return
+        # No worker to pick them up, so process them here in order.
+        processed = 0
+        for notification in queryset.order_by("timestamp", "pk"):
+            if webhooks.process_now(notification):
+                processed += 1
+        messages.success(request, f"Replayed {count} webhooks, {processed} processed.")
+
+    replay_webhooks.short_description = "Replay webhooks"
 
     def body_highlighted(self, instance):
         return json_highlight_format_value(instance.body)
@@ -1629,6 +1757,60 @@ class PaymentWebhookAdmin(admin.ModelAdmin):
 admin.site.register(PaymentWebhookNotification, PaymentWebhookAdmin)
 
 
+class PrintJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "status",
+        "terminal",
+        "user",
+        "attempts",
+        "created",
+        "pdf_link",
+    )
+    list_filter = ("status", "terminal")
+    readonly_fields = ("pdf_link", "created", "updated")
+    raw_id_fields = ("badges",)
+    actions = ["retry_jobs"]
+
+    def pdf_link(self, instance):
+        url = print_jobs.get_job_url(instance)
+        if url is None:
+            return "-"
+        return format_html('<a href="{}">{}</a>', url, instance.file)
+
+    pdf_link.short_description = "PDF"
+
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status=PrintJob.RUNNING).update(
+            status=PrintJob.PENDING, attempts=0, nextAttempt=timezone.now()
+        )
+        messages.success(request, f"Requeued {count} print jobs.")
+
+    retry_jobs.short_description = "Retry print jobs"
+
+
+admin.site.register(PrintJob, PrintJobAdmin)
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "template", "status", "attempts", "created", "sent")
+    list_filter = ("status", "template")
+    search_fields = ["subject", "to"]
+    readonly_fields = ("created", "updated", "sent")
+    actions = ["retry_emails"]
+
+    def retry_emails(self, request, queryset):
+        count = queryset.filter(status=QueuedEmail.FAILED).update(
+            status=QueuedEmail.PENDING, attempts=0, nextAttempt=timezone.now()
+        )
+        messages.success(request, f"Requeued {count} emails.")
+
+    retry_emails.short_description = "Retry failed emails"
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
+
+
 class BadgeTemplateAdmin(admin.ModelAdmin):
     list_display = (
         "name",
@@ -1639,7 +1821,7 @@ class BadgeTemplateAdmin(admin.ModelAdmin):
         "marginLeft",
         "marginRight",
         "landscape",
-        "scale"
+        "scale",
     )
 
     fieldsets = (
@@ -1647,7 +1829,7 @@ class BadgeTemplateAdmin(admin.ModelAdmin):
             None,
             {
                 "fields": ("name", "template"),
-            }
+            },
         ),
         (
             "Paper Setup",
@@ -1657,7 +1839,7 @@ class BadgeTemplateAdmin(admin.ModelAdmin):
                     "scale",
                     ("paperWidth", "paperHeight"),
                 )
-            }
+            },
         ),
         (
             "Margins And Padding",
@@ -1666,12 +1848,14 @@ class BadgeTemplateAdmin(admin.ModelAdmin):
                     ("marginTop", "marginBottom"),
                     ("marginLeft", "marginRight"),
                 ),
-            }
+            },
         ),
     )
 
+
 admin.site.register(BadgeTemplate, BadgeTemplateAdmin)
 
+
 class SquareDeviceAdmin(admin.ModelAdmin):
     list_display = ("name", "device_type", "device_id")
     change_list_template = "admin/square_devices_list.html"
@@ -1693,23 +1877,27 @@ class SquareDeviceAdmin(admin.ModelAdmin):
         return my_urls + urls
 
     def sync_view(self, request):
-        existing_devices = SquareDevice.objects.all()
-        current_devices = payments.get_terminals()
-
-        keep_ids = set()
-        for device in current_devices:
-            SquareDevice.objects.update_or_create(
-                device_id=device["id"], defaults={
-                    "name": device["attributes"]["name"],
-                    "device_type": device["attributes"]["type"],
-                },
-            )
-            keep_ids.add(device["id"])
-
-        for existing in existing_devices:
-            if existing.device_id not in keep_ids:
-                existing.delete()
-
+        # Apply the inventory we have now, and fetch a fresh one from Square
+        # in the background.
+        refreshing = square_devices.get_inventory() is not None
+        try:
+            devices = square_devices.get_devices()
+        except Exception as e:
+            logger.exception("Unable to get Square devices")
+            messages.error(request, f"Unable to get Square devices: {e}")
+            return HttpResponseRedirect("../")
+        created, updated, deleted = square_devices.sync(devices)
+        if refreshing:
+            square_devices.start_refresh()
+
+        message = (
+            f"Synced {len(devices)} devices: {created} added, {updated} updated, "
+            f"{deleted} removed."
+        )
+        if refreshing:
+            message += " Refreshing from Square in the background; reload for changes."
+        messages.success(request, message)
         return HttpResponseRedirect("../")
 
+
 admin.site.register(SquareDevice, SquareDeviceAdmin)
@@ -0,0 +1,331 @@
+"""
+Cached price level catalog for the registration forms.
+
+Level lists are cached per event, form type and age, both in process and
+in the Django cache, under a version stamp that is bumped whenever a price
+level, option or shirt size changes.
+
+Limited options are tracked per event in OptionInventory counters, which
+are only changed with conditional UPDATEs so concurrent checkouts can't
+oversell.  Sold counts are cached under their own version stamp, so a sale
+doesn't throw away the rest of the catalog.  Stock goes back when an
+order fails or is refunded, and is taken again if it's reinstated.
+"""
+
+import copy
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from registration.models import (
+    AttendeeOptions,
+    OptionInventory,
+    Order,
+    PriceLevel,
+    PriceLevelOption,
+    ShirtSizes,
+)
+
+CATALOG_VERSION_KEY = "catalog:version"
+INVENTORY_VERSION_KEY = "catalog:inventory:version"
+
+# Upper bound on how long a level list is kept, in seconds.  Entries also
+# expire when the next price level opens or closes.
+CATALOG_TIMEOUT = getattr(settings, "APIS_CATALOG_CACHE_TIMEOUT", 300)
+
+# Orders whose options no longer count against stock.
+RELEASED_STATUSES = (Order.FAILED, Order.REFUNDED)
+
+FORM_TYPE_FLAGS = {
+    "staff": "available_to_staff",
+    "marketplace": "available_to_marketplace",
+}
+
+# key -> (version, expires, value), for this process only.
+_local_cache = {}
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """
+    Invalidate everything cached under a version stamp.  The stamp is bumped
+    again on commit, so a rebuild that raced the write is thrown away too.
+    """
+    cache.set(key, _new_version(), None)
+    transaction.on_commit(lambda: cache.set(key, _new_version(), None))
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_inventory_version():
+    bump_version(INVENTORY_VERSION_KEY)
+
+
+def get_cached(key, version_key, build):
+    """
+    Return the value cached for key under the current version of
+    version_key, calling build() on a miss.  build returns the value and
+    the number of seconds it may be kept for.
+    """
+    version = get_version(version_key)
+    now = time.time()
+    hit = _local_cache.get(key)
+    if hit and hit[0] == version and hit[1] > now:
+        return hit[2]
+
+    versioned_key = f"{key}:{version}"
+    entry = cache.get(versioned_key)
+    if entry is None or entry[1] <= now:
+        value, timeout = build()
+        entry = (value, now + timeout)
+        cache.set(versioned_key, entry, timeout)
+    value, expires = entry
+    _local_cache[key] = (version, expires, value)
+    return value
+
+
+def get_age_at_event(event, dob):
+    start = event.eventStart
+    return start.year - dob.year - ((start.month, start.day) < (dob.month, dob.day))
+
+
+def format_option(option, shirt_sizes):
+    if option.optionExtraType == "ShirtSizes":
+        option_list = shirt_sizes
+    else:
+        option_list = option.getList()
+    return {
+        "name": option.optionName,
+        "value": option.optionPrice,
+        "id": option.id,
+        "required": option.required,
+        "active": option.active,
+        "type": option.optionExtraType,
+        "image": option.getOptionImage(),
+        "description": option.description,
+        "list": option_list,
+        "limited_availability": option.quantity is not None,
+    }
+
+
+def format_level(level, shirt_sizes):
+    return {
+        "name": level.name,
+        "id": level.id,
+        "base_price": str(level.basePrice),
+        "description": level.description,
+        "accompanied": level.accompanied,
+        "is_minor": level.isMinor,
+        "options": [format_option(o, shirt_sizes) for o in level.sorted_options],
+    }
+
+
+def build_price_level_list(form_type, age):
+    """
+    Public levels open to form_type and age, cheapest first, along with the
+    quantity of each limited option and how long the list stays accurate.
+    """
+    now = timezone.now()
+    flag = FORM_TYPE_FLAGS.get(form_type, "available_to_attendee")
+    levels = (
+        PriceLevel.objects.filter(
+            Q(public=True)
+            & Q(endDate__gte=now)
+            & Q(min_age__lte=age)
+            & (Q(max_age__gte=age) | Q(max_age__isnull=True)),
+            **{flag: True},
+        )
+        .prefetch_related(
+            Prefetch(
+                "priceLevelOptions",
+                queryset=PriceLevelOption.objects.order_by("rank", "optionPrice"),
+                to_attr="sorted_options",
+            )
+        )
+        .order_by("basePrice")
+    )
+
+    shirt_sizes = None
+    open_levels = []
+    limits = {}
+    timeout = CATALOG_TIMEOUT
+    for level in levels:
+        # Expire the list as soon as a level opens or closes.
+        boundary = level.startDate if level.startDate > now else level.endDate
+        timeout = min(timeout, (boundary - now).total_seconds())
+        if level.startDate > now:
+            continue
+        if shirt_sizes is None and any(
+            o.optionExtraType == "ShirtSizes" for o in level.sorted_options
+        ):
+            shirt_sizes = [
+                {"name": s.name, "id": s.id} for s in ShirtSizes.objects.all()
+            ]
+        open_levels.append(format_level(level, shirt_sizes))
+        for option in level.sorted_options:
+            if option.quantity is not None:
+                limits[option.id] = option.quantity
+
+    return {"levels": open_levels, "limits": limits}, max(int(timeout), 1)
+
+
+def get_inventory(event_id, option_id):
+    """The counter for an option, seeded from existing sales if it's new."""
+    counter = OptionInventory.objects.filter(
+        event_id=event_id, option_id=option_id
+    ).first()
+    if counter is None:
+        counter, _ = OptionInventory.objects.get_or_create(
+            event_id=event_id,
+            option_id=option_id,
+            defaults={"sold": count_sold(event_id, option_id)},
+        )
+    return counter
+
+
+def count_sold(event_id, option_id):
+    """Units of an option held by orders that haven't failed or been refunded."""
+    return (
+        AttendeeOptions.objects.filter(
+            orderItem__badge__event_id=event_id, option_id=option_id
+        )
+        .exclude(orderItem__order__status__in=RELEASED_STATUSES)
+        .count()
+    )
+
+
+def reserve_option(event_id, option, count=1):
+    """
+    Atomically take count units of option.  Returns False, taking nothing,
+    if that would sell more than the option's quantity.
+    """
+    if option.quantity is None:
+        return True
+    counter = get_inventory(event_id, option.pk)
+    taken = OptionInventory.objects.filter(
+        pk=counter.pk, sold__lte=option.quantity - count
+    ).update(sold=F("sold") + count)
+    if taken:
+        bump_inventory_version()
+    return bool(taken)
+
+
+def take_option(event_id, option, count=1):
+    """
+    Record count units of option as sold, even past its quantity.  Called
+    once the sale is saved, so a counter that doesn't exist yet is seeded
+    with it already counted.
+    """
+    if option.quantity is None:
+        return
+    taken = OptionInventory.objects.filter(
+        event_id=event_id, option_id=option.pk
+    ).update(sold=F("sold") + count)
+    if not taken:
+        get_inventory(event_id, option.pk)
+    bump_inventory_version()
+
+
+def release_option(event_id, option, count=1):
+    """Give back count units of option, taken with reserve_option."""
+    if option.quantity is None:
+        return
+    OptionInventory.objects.filter(event_id=event_id, option_id=option.pk).update(
+        sold=Greatest(F("sold") - count, 0)
+    )
+    bump_inventory_version()
+
+
+def get_order_option_counts(order_id):
+    """(event id, option id, units) for each limited option on an order."""
+    return (
+        AttendeeOptions.objects.filter(
+            orderItem__order_id=order_id, option__quantity__isnull=False
+        )
+        .values_list("orderItem__badge__event_id", "option_id")
+        .annotate(units=Count("pk"))
+        .order_by()
+    )
+
+
+def release_order_options(order_id):
+    """Give back the limited options on an order that failed or was refunded."""
+    counts = list(get_order_option_counts(order_id))
+    for event_id, option_id, units in counts:
+        OptionInventory.objects.filter(event_id=event_id, option_id=option_id).update(
+            sold=Greatest(F("sold") - units, 0)
+        )
+    if counts:
+        bump_inventory_version()
+
+
+def take_order_options(order_id):
+    """Take the limited options on a reinstated order again."""
+    counts = list(get_order_option_counts(order_id))
+    for event_id, option_id, units in counts:
+        # A new counter is seeded from sales, which already include the order.
+        OptionInventory.objects.filter(event_id=event_id, option_id=option_id).update(
+            sold=F("sold") + units
+        )
+    if counts:
+        bump_inventory_version()
+
+
+def get_sold_counts(event):
+    """Units sold of each limited option for event, keyed by option id."""
+
+    def build():
+        counts = OptionInventory.objects.filter(event=event).values_list(
+            "option_id", "sold"
+        )
+        return dict(counts), CATALOG_TIMEOUT
+
+    return get_cached(f"catalog:sold:{event.pk}", INVENTORY_VERSION_KEY, build)
+
+
+def is_sold_out(event, option_id, quantity):
+    sold = get_sold_counts(event).get(option_id)
+    if sold is None:
+        # No counter yet; count sales without creating one.
+        sold = count_sold(event.pk, option_id)
+    return sold >= quantity
+
+
+def get_price_level_list(event, form_type, dob):
+    """Price levels shown to someone born on dob, with sold out flags."""
+    # Ages are whole years; clamp so odd birthdates can't grow the key space.
+    age = max(-1, min(get_age_at_event(event, dob), 150))
+    if form_type not in FORM_TYPE_FLAGS:
+        form_type = "attendee"
+    catalog = get_cached(
+        f"catalog:levels:{event.pk}:{form_type}:{age}",
+        CATALOG_VERSION_KEY,
+        lambda: build_price_level_list(form_type, age),
+    )
+    levels = copy.deepcopy(catalog["levels"])
+    for level in levels:
+        for option in level["options"]:
+            option["sold_out"] = None
+            if option["limited_availability"]:
+                quantity = catalog["limits"][option["id"]]
+                option["sold_out"] = is_sold_out(event, option["id"], quantity)
+    return levels
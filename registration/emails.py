@@ -1,13 +1,14 @@
 import logging
 
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.urls import reverse
 
 import registration.views.common
 import registration.views.dealers
 import registration.views.staff
+from registration import outbox
+from registration.events import get_default_event
 from registration.models import *
 
 logger = logging.getLogger("registration.emails")
@@ -61,6 +62,7 @@ def send_registration_email(order, email, send_vip=True):
                 "{0} Registration Payment".format(oi.badge.event.name),
                 msg_txt,
                 msg_html,
+                template="registration-payment",
             )
         else:
             # send regular emails to everyone else
@@ -78,6 +80,7 @@ def send_registration_email(order, email, send_vip=True):
                 "{0} Registration Confirmation".format(oi.badge.event.name),
                 msg_txt,
                 msg_html,
+                template="registration",
             )
 
         # send vip notification if necessary
@@ -93,11 +96,12 @@ def send_registration_email(order, email, send_vip=True):
                 "{0} VIP Registration".format(oi.badge.event.name),
                 msg_txt,
                 msg_html,
+                template="vip-notification",
             )
 
 
 def send_upgrade_instructions(badge):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     registration_email = registration.views.common.get_registration_email(event)
 
     data = {
@@ -113,11 +117,12 @@ def send_upgrade_instructions(badge):
         "Upgrade Your Registration for {0}".format(event.name),
         msg_txt,
         msg_html,
+        template="upgrade-instructions",
     )
 
 
 def send_upgrade_payment_email(attendee, order):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     order_items = OrderItem.objects.filter(order=order)
     data = {
         "event": event,
@@ -133,6 +138,7 @@ def send_upgrade_payment_email(attendee, order):
         "{0} Upgrade Payment".format(event.name),
         msg_txt,
         msg_html,
+        template="upgrade",
     )
 
     for oi in order_items:
@@ -148,17 +154,18 @@ def send_upgrade_payment_email(attendee, order):
                 "{0} VIP Registration".format(event.name),
                 msg_txt,
                 msg_html,
+                template="vip-notification",
             )
 
 
 def send_staff_registration_email(orderId):
     order = Order.objects.get(id=orderId)
     email = order.billingEmail
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     data = {"reference": order.reference, "event": event}
     msg_txt = render_to_string("registration/emails/staff/registration.txt", data)
     msg_html = render_to_string("registration/emails/staff/registration.html", data)
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     staff_email = registration.views.staff.get_staff_email(event)
     send_email(
         staff_email,
@@ -166,6 +173,7 @@ def send_staff_registration_email(orderId):
         "{0} Staff Registration".format(event.name),
         msg_txt,
         msg_html,
+        template="staff/registration",
     )
 
 
@@ -180,11 +188,12 @@ def send_staff_promotion_email(staff):
         "Welcome to {0} Staff!".format(staff.event.name),
         msg_txt,
         msg_html,
+        template="staff/promotion",
     )
 
 
 def send_new_staff_email(token):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     data = {"registrationToken": token.token, "event": event}
     msg_txt = render_to_string("registration/emails/staff/new.txt", data)
     msg_html = render_to_string("registration/emails/staff/new.html", data)
@@ -195,6 +204,7 @@ def send_new_staff_email(token):
         "Welcome to {0} Staff!".format(event.name),
         msg_txt,
         msg_html,
+        template="staff/new",
     )
 
 
@@ -210,6 +220,7 @@ def send_dealer_application_email(dealerId):
         "{0} Dealer Application".format(dealer.event.name),
         msg_txt,
         msg_html,
+        template="dealer/dealer",
     )
 
     msg_txt = render_to_string("registration/emails/dealer/dealer-notice.txt", data)
@@ -222,6 +233,7 @@ def send_dealer_application_email(dealerId):
         "{0} Dealer Application Received".format(dealer.event.name),
         msg_txt,
         msg_html,
+        template="dealer/dealer-notice",
     )
 
 
@@ -236,6 +248,7 @@ def send_dealer_assistant_form_email(dealer):
         "{0} Dealer Assistant Addition".format(dealer.event.name),
         msg_txt,
         msg_html,
+        template="dealer/assistant-form",
     )
 
 
@@ -251,6 +264,7 @@ def send_dealer_assistant_email(dealer_id):
         "{0} Dealer Assistant Addition".format(dealer.event.name),
         msg_txt,
         msg_html,
+        template="dealer/assistant",
     )
 
 
@@ -269,6 +283,7 @@ def send_dealer_assistant_registration_invite(assistant):
         "{0} Dealer Assistant Addition".format(assistant.event.name),
         msg_txt,
         msg_html,
+        template="dealer/assistant-register",
     )
     assistant.sent = True
     assistant.save()
@@ -294,6 +309,7 @@ def send_dealer_payment_email(dealer, order):
         "{0} Dealer Payment".format(dealer.event.name),
         msg_txt,
         msg_html,
+        template="dealer/payment",
     )
 
 
@@ -313,11 +329,12 @@ def send_dealer_approval_email(dealerQueryset):
             "{0} Dealer Application".format(dealer.event.name),
             msg_txt,
             msg_html,
+            template="dealer/dealer-approval",
         )
 
 
 def send_chargeback_notice_email(order):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     data = {
         "event": event,
         "order": order,
@@ -332,21 +349,30 @@ def send_chargeback_notice_email(order):
         msg_txt,
         msg_html,
         bcc=[registration_email],
+        template="chargeback-notice",
     )
 
 
-def send_email(reply_address, to_address_list, subject, message, html_message, bcc=[]):
+def send_email(
+    reply_address, to_address_list, subject, message, html_message, bcc=[], template=""
+):
     logger.debug("Enter send_email...")
-    mail_message = EmailMultiAlternatives(
-        subject,
-        message,
-        settings.APIS_DEFAULT_EMAIL,
-        to_address_list,
-        reply_to=[reply_address],
-        bcc=bcc,
+    if outbox.use_outbox():
+        email = outbox.enqueue(
+            reply_address,
+            to_address_list,
+            subject,
+            message,
+            html_message,
+            bcc=bcc,
+            template=template,
+        )
+        logger.debug("Queued email {0} to: {1}".format(email.pk, to_address_list))
+        return
+    mail_message = outbox.build_message(
+        reply_address, to_address_list, subject, message, html_message, bcc=bcc
     )
     logger.debug("Message to: {0}".format(to_address_list))
-    mail_message.attach_alternative(html_message, "text/html")
     logger.debug("Sending...")
     mail_message.send()
     logger.debug("Email sent")
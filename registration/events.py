@@ -0,0 +1,142 @@
+"""
+Cached Event lookups.
+
+Nearly every request needs the default event, and carts look events up by
+name.  Events are kept in process under a version stamp that is bumped
+whenever one is saved or deleted, and each request gets its own copy that
+is reused until the request finishes.
+
+A change drops both caches straight away and again once it commits.  Until
+then, the thread that made it keeps its own cache, so other threads never
+see uncommitted events and nothing is kept after a rollback.
+"""
+
+import copy
+import threading
+
+from django.core.signals import request_finished, request_started
+from django.db import connection, transaction
+from django.dispatch import receiver
+
+from registration.catalog import bump_version, get_version
+from registration.models import Event
+
+EVENT_VERSION_KEY = "events:version"
+
+# (version, {key: Event}) for this process.
+_process_cache = (None, {})
+
+# Copies handed out during the current request, and the version they came
+# from.  Unset outside of a request, so commands always check the version.
+_request_cache = threading.local()
+
+# This thread's events while it has uncommitted changes to them, and the
+# on_commit callbacks that mark those changes as committed.
+_uncommitted = threading.local()
+
+
+@receiver(request_started)
+def start_request(**kwargs):
+    _request_cache.version = None
+    _request_cache.events = {}
+
+
+@receiver(request_finished)
+def finish_request(**kwargs):
+    _request_cache.__dict__.clear()
+
+
+def _drop_caches():
+    global _process_cache
+    _process_cache = (None, {})
+    if hasattr(_request_cache, "events"):
+        start_request()
+
+
+def invalidate_events():
+    bump_version(EVENT_VERSION_KEY)
+    _drop_caches()
+    if connection.in_atomic_block:
+
+        def committed():
+            _uncommitted.__dict__.clear()
+            _drop_caches()
+
+        _uncommitted.callbacks = getattr(_uncommitted, "callbacks", []) + [committed]
+        _uncommitted.events = {}
+        transaction.on_commit(committed)
+
+
+def _uncommitted_events():
+    """
+    This thread's own cache while its event changes are uncommitted, or
+    None.  Rolling back a change drops its on_commit callback, which is how
+    the rollback is noticed.
+    """
+    callbacks = getattr(_uncommitted, "callbacks", None)
+    if not callbacks:
+        return None
+    pending = {id(func) for _, func in connection.run_on_commit}
+    alive = [func for func in callbacks if id(func) in pending]
+    if len(alive) < len(callbacks):
+        _uncommitted.callbacks = alive
+        _uncommitted.events = {}
+        _drop_caches()
+    return _uncommitted.events if alive else None
+
+
+def _current_version():
+    if getattr(_request_cache, "version", None) is None:
+        version = get_version(EVENT_VERSION_KEY)
+        if hasattr(_request_cache, "events"):
+            _request_cache.version = version
+        return version
+    return _request_cache.version
+
+
+def _lookup(key, **filters):
+    global _process_cache
+    # Checked first, as it drops the request's copies after a rollback.
+    events = _uncommitted_events()
+
+    request_events = getattr(_request_cache, "events", None)
+    if request_events is not None and key in request_events:
+        return request_events[key]
+
+    if events is None:
+        version = _current_version()
+        cached_version, events = _process_cache
+        if cached_version != version:
+            events = {}
+            _process_cache = (version, events)
+
+    event = events.get(key)
+    if event is None:
+        # Misses aren't cached, so this raises just like a plain get().
+        event = Event.objects.get(**filters)
+        events[key] = event
+        events[("id", event.pk)] = event
+        events[("name", event.name)] = event
+
+    # Callers may modify or follow relations on what they get back, so
+    # never hand out the shared instance.
+    event = copy.copy(event)
+    event._state.fields_cache = {}
+    if request_events is not None:
+        request_events[key] = event
+        request_events[("id", event.pk)] = event
+        request_events[("name", event.name)] = event
+    return event
+
+
+def get_default_event():
+    """The current event, as Event.objects.get(default=True)."""
+    return _lookup(("default",), default=True)
+
+
+def get_event_by_name(name):
+    return _lookup(("name", name), name=name)
+
+
+def get_event(pk):
+    return _lookup(("id", int(pk)), pk=pk)
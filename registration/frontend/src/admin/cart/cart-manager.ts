@@ -5,6 +5,9 @@ import MqttClient from "../mqtt";
 
 const LOCK_NAME = "onsite-cart-update";
 
+const PRINT_JOB_POLL_INTERVAL = 5000;
+const PRINT_JOB_TIMEOUT = 120000;
+
 export class CartManager {
   private urls: ApisUrls;
   private mqtt: MqttClient;
@@ -15,6 +18,15 @@ export class CartManager {
   public pendingTransfers: Accessor<number[][]>;
   private setPendingTransfers: Setter<number[][]>;
 
+  // The cart as last sent by the server, which updates are applied to.
+  // It's kept after the cart is cleared from view.
+  private cart?: CartResponse;
+  private version?: number;
+
+  private onRefresh: () => Promise<void>;
+  private onCartUpdate: (payload: object | null) => Promise<void>;
+  private onTransfer: (payload: object | null) => void;
+
   constructor(urls: ApisUrls, mqtt: MqttClient) {
     this.urls = urls;
     this.mqtt = mqtt;
@@ -26,13 +38,71 @@ export class CartManager {
       equals: false,
     });
 
-    this.mqtt.emitter.on("refresh", this.refreshCart.bind(this));
-    this.mqtt.emitter.on("transfer", this.addPendingTransfer.bind(this));
+    this.onRefresh = this.refreshCart.bind(this);
+    this.onCartUpdate = (payload) => this.applyUpdate(payload as CartUpdate);
+    this.onTransfer = this.addPendingTransfer.bind(this);
+
+    this.mqtt.emitter.on("refresh", this.onRefresh);
+    this.mqtt.emitter.on("cart", this.onCartUpdate);
+    this.mqtt.emitter.on("transfer", this.onTransfer);
   }
 
   close() {
-    this.mqtt.emitter.off("refresh", this.refreshCart.bind(this));
-    this.mqtt.emitter.off("transfer", this.addPendingTransfer.bind(this));
+    this.mqtt.emitter.off("refresh", this.onRefresh);
+    this.mqtt.emitter.off("cart", this.onCartUpdate);
+    this.mqtt.emitter.off("transfer", this.onTransfer);
+  }
+
+  /**
+   * Apply a cart update pushed by the server, or returned from a request
+   * that changed the cart.  Updates are diffs against the version named in
+   * `base`, so if that isn't the version we have the whole cart is fetched
+   * again instead.  An update without a base is the whole cart, and always
+   * replaces ours.
+   */
+  public async applyUpdate(update?: CartUpdate | null) {
+    if (!update) return;
+    if (update.base === null) {
+      this.setCart(update.version, update.changes as CartResponse);
+      return;
+    }
+    if (this.version !== undefined && update.version <= this.version) return;
+
+    const current = this.cart;
+    if (!current || update.base !== this.version) {
+      console.debug("Cart version gap, refetching", this.version, update);
+      await this.refreshCart();
+      return;
+    }
+
+    const badges = new Map(current.result.map((badge) => [badge.id, badge]));
+    for (const changed of update.badges) {
+      badges.set(changed.id, { ...badges.get(changed.id), ...changed } as Badge);
+    }
+
+    this.setCart(update.version, {
+      ...current,
+      ...update.changes,
+      result: update.order.map((id) => badges.get(id)!),
+    });
+  }
+
+  private setCart(version: number | undefined, cart: CartResponse) {
+    this.version = version;
+    this.cart = cart;
+    this.setCartEntries(cart);
+  }
+
+  /**
+   * Bring the cart up to date after a request that changed it, fetching it
+   * only if the response didn't include an update.
+   */
+  public async syncCart(data: FallibleRequest<{ update?: CartUpdate | null }>) {
+    if (data.success && data.update) {
+      await this.applyUpdate(data.update);
+    } else {
+      await this.refreshCart();
+    }
   }
 
   private addPendingTransfer(payload: object | null) {
@@ -77,18 +147,24 @@ export class CartManager {
     let url = new URL(this.urls.onsite_add_to_cart, window.location.href);
     url.searchParams.set("id", id.toString());
 
-    await this.makeRequest(url, {
+    const data = await this.makeRequest<{ update?: CartUpdate | null }>(url, {
       method: "POST",
     });
 
-    await this.refreshCart();
+    await this.syncCart(data);
   }
 
   public async clearCart() {
-    await this.makeRequest(this.urls.onsite_admin_clear_cart, {
-      method: "POST",
-    });
+    const data = await this.makeRequest<{ update?: CartUpdate | null }>(
+      this.urls.onsite_admin_clear_cart,
+      {
+        method: "POST",
+      }
+    );
 
+    if (data.success) {
+      await this.applyUpdate(data.update);
+    }
     this.setCartEntries(undefined);
   }
 
@@ -104,14 +180,14 @@ export class CartManager {
       return;
     }
 
-    this.setCartEntries(data);
+    this.setCart(data.version, data);
   }
 
   public async removeBadge(id: number) {
     let url = new URL(this.urls.onsite_remove_from_cart, window.location.href);
     url.searchParams.set("id", id.toString());
 
-    const data = await this.makeRequest(url, {
+    const data = await this.makeRequest<{ update?: CartUpdate | null }>(url, {
       method: "POST",
     });
 
@@ -120,14 +196,14 @@ export class CartManager {
       return;
     }
 
-    await this.refreshCart();
+    await this.syncCart(data);
   }
 
   public async applyCashPayment(
     reference: string,
     total: string,
     tendered: string
-  ): Promise<FallibleRequest<void>> {
+  ): Promise<FallibleRequest<{ update?: CartUpdate | null }>> {
     let url = new URL(
       this.urls.complete_cash_transaction,
       window.location.href
@@ -187,7 +263,9 @@ export class CartManager {
     mqttPrint: boolean = false,
     beforeClearingCart?: () => void
   ): Promise<FallibleRequest<BadgePrintResponse>> {
-    const assignData = await this.makeRequest(this.urls.assign_badge_number, {
+    const assignData = await this.makeRequest<{
+      update?: CartUpdate | null;
+    }>(this.urls.assign_badge_number, {
       method: "POST",
       body: JSON.stringify(
         ids.map((id) => {
@@ -201,12 +279,34 @@ export class CartManager {
     if (!assignData.success) {
       return { success: false };
     }
+    await this.applyUpdate(assignData.update);
 
     let url = new URL(this.urls.onsite_print_badges, window.location.href);
     ids.forEach((id) => url.searchParams.append("id", id.toString()));
 
     const printData = await this.makeRequest<BadgePrintResponse>(url);
 
+    if (printData.success && printData.job) {
+      // Queued for the print worker, which sends it to our printer itself.
+      const job = await this.waitForPrintJob(
+        printData.job,
+        printData.status_url
+      );
+      if (job.status !== "Complete" || !job.file) {
+        return {
+          success: false,
+          reason: job.error || `print job ${job.status.toLowerCase()}`,
+        };
+      }
+
+      if (clearCart) {
+        beforeClearingCart?.();
+        await this.clearCart();
+      }
+
+      return { ...printData, file: job.file, url: job.file };
+    }
+
     if (printData.success && mqttPrint) {
       const url = new URL(printData.file, window.location.href);
 
@@ -226,7 +326,46 @@ export class CartManager {
     return printData;
   }
 
-  public async clearBadgePrinted(id: number): Promise<FallibleRequest<void>> {
+  /**
+   * Resolve once a print job has finished, as announced over MQTT.  The
+   * status URL is polled as well in case a message is missed, and the wait
+   * gives up after PRINT_JOB_TIMEOUT.
+   */
+  private waitForPrintJob(
+    job: PrintJob,
+    statusUrl: string
+  ): Promise<PrintJob> {
+    return new Promise((resolve) => {
+      const finish = (next: PrintJob) => {
+        this.mqtt.emitter.off("print_job", onMessage);
+        clearInterval(poll);
+        clearTimeout(timeout);
+        resolve(next);
+      };
+      const isDone = (next: PrintJob) =>
+        next.status === "Complete" || next.status === "Failed";
+
+      const onMessage = (payload: object | null) => {
+        const next = payload as PrintJob | null;
+        if (next?.id === job.id && isDone(next)) finish(next);
+      };
+      const poll = setInterval(async () => {
+        const resp = await fetch(statusUrl);
+        const data = await resp.json();
+        if (data.success && isDone(data.job)) finish(data.job);
+      }, PRINT_JOB_POLL_INTERVAL);
+      const timeout = setTimeout(
+        () => finish({ ...job, error: "timed out waiting for the printer" }),
+        PRINT_JOB_TIMEOUT
+      );
+
+      this.mqtt.emitter.on("print_job", onMessage);
+    });
+  }
+
+  public async clearBadgePrinted(
+    id: number
+  ): Promise<FallibleRequest<{ update?: CartUpdate | null }>> {
     let url = new URL(this.urls.onsite_print_clear, window.location.href);
     url.searchParams.set("id", id.toString());
 
@@ -252,7 +391,7 @@ export class CartManager {
 
   public async createAndApplyDiscount(
     amount: string
-  ): Promise<FallibleRequest<void>> {
+  ): Promise<FallibleRequest<{ update?: CartUpdate | null }>> {
     const formData = new FormData();
     formData.set("amount", amount);
 
@@ -316,6 +455,17 @@ export interface CartResponse {
   total: string;
   total_discount: string;
   result: Badge[];
+  version?: number;
+}
+
+export interface CartUpdate {
+  version: number;
+  // The version this update was diffed against, or null for a whole cart.
+  base: number | null;
+  changes: Partial<CartResponse>;
+  // Badges that were added or changed; changed ones only carry new fields.
+  badges: (Partial<Badge> & { id: number })[];
+  order: number[];
 }
 
 export interface Badge {
@@ -372,6 +522,16 @@ export interface BadgePrintResponse {
   file: string;
   next: string;
   url: string;
+  job?: PrintJob;
+  status_url: string;
+}
+
+export interface PrintJob {
+  id: number;
+  status: "Pending" | "Running" | "Complete" | "Failed";
+  attempts: number;
+  error: string | null;
+  file: string | null;
 }
 
 export interface CheckedInResponse {
@@ -312,7 +312,7 @@ async function attemptCashPayment(
 
   const resp = await manager.applyCashPayment(reference, total, tendered);
   if (resp.success) {
-    manager.refreshCart();
+    manager.syncCart(resp);
   } else {
     alert(`Error posting cash transaction: ${resp.reason}`);
     return;
@@ -329,7 +329,7 @@ async function createAndApplyDiscount(manager: CartManager) {
 
   const resp = await manager.createAndApplyDiscount(discountAmount);
   if (resp.success) {
-    manager.refreshCart();
+    manager.syncCart(resp);
   } else {
     alert(`Error creating discount: ${resp.reason}`);
   }
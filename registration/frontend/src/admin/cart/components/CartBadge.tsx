@@ -10,7 +10,7 @@ export const CartBadge: Component<{ manager: CartManager; badge: Badge }> = (
   const [clearPrint] = createResource(clearPrintBadgeId, async (id) => {
     const resp = await props.manager.clearBadgePrinted(id);
     if (resp.success) {
-      await props.manager.refreshCart();
+      await props.manager.syncCart(resp);
     } else {
       alert("Unable to clear badge print flag.");
     }
@@ -7,8 +7,10 @@ import { ApisMqttConfig } from "../entrypoints/admin";
 export type MqttTopic =
   | "alert"
   | "authorize_terminal"
+  | "cart"
   | "notification"
   | "open"
+  | "print_job"
   | "refresh"
   | "scan/id"
   | "scan/shc"
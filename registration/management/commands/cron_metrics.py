@@ -1,16 +1,16 @@
-from datetime import datetime
 from abc import ABCMeta, abstractmethod
+from collections import Counter
+from datetime import datetime
 
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Q, Sum
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 from influxdb import InfluxDBClient
 
 from registration.models import *
 
-
 """
 There's a few options for where these metrics could end up.  These should eventually be configurable:
  - built-in database metrics table: (simplest, no external dependency).
@@ -62,10 +62,22 @@ class Command(BaseCommand):
             total_count = order_items.count()
 
             # Bin by registration level
-            level_bins = {}
             price_levels = PriceLevel.objects.filter()
-            for level in price_levels:
-                level_bins[level.id] = order_items.filter(priceLevel=level).count()
+            level_bins = {level.id: 0 for level in price_levels}
+            level_counts = (
+                order_items.order_by()
+                .values("priceLevel")
+                .annotate(count=Count("id"))
+                .values_list("priceLevel", "count")
+            )
+            level_bins.update(level_counts)
+
+            # Badges by association (staff, dealer, paid, comp, ...)
+            association_counts = Counter(
+                Badge.objects.filter(event=event)
+                .with_status()
+                .values_list("association", flat=True)
+            )
 
             # Staff counts
             staff = Staff.objects.filter(event=event).select_related("attendee")
@@ -115,6 +127,11 @@ class Command(BaseCommand):
             print(
                 "Staff: {0} ({1} active)".format(total_staff_count, active_staff_count)
             )
+            for association, count in association_counts.items():
+                backend_writer(
+                    event, "badge_association", count, association=association
+                )
+
             backend_writer(event, "staff_total", total_staff_count)
             backend_writer(event, "staff_active", active_staff_count)
             backend_writer(event, "orders", total_count)
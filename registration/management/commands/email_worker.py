@@ -0,0 +1,19 @@
+from registration import outbox
+from registration.management.worker import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = (
+        "Sends email queued in the outbox, in batches over a single mail server "
+        "connection.  Runs until interrupted unless --once is given."
+    )
+    setting = "EMAIL_OUTBOX"
+    interval = 5.0
+    once_help = "Send the email that is currently due, then exit."
+    result = "Sent {count} emails"
+
+    def enabled(self):
+        return outbox.use_outbox()
+
+    def run_pending(self):
+        return outbox.run_pending()
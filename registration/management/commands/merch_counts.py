@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 
+from registration.events import get_default_event, get_event
 from registration.models import (
     AttendeeOptions,
     Event,
@@ -21,7 +22,7 @@ class Command(BaseCommand):
             return None
 
     def handle(self, *args, **options):
-        default_event = Event.objects.get(default=True)
+        default_event = get_default_event()
         SHIRT_SIZES = {
             str(shirt.id): shirt.name for shirt in ShirtSizes.objects.filter()
         }
@@ -34,7 +35,7 @@ class Command(BaseCommand):
         if selection is None:
             event = default_event
         else:
-            event = Event.objects.get(id=selection)
+            event = get_event(selection)
         options = PriceLevelOption.objects.filter()
         for oc, option in enumerate(options):
             print(("{0} - {1}".format(oc, option)))
@@ -0,0 +1,19 @@
+from registration import print_jobs
+from registration.management.worker import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = (
+        "Renders queued badge print jobs and sends them to their terminals' "
+        "printers.  Runs until interrupted unless --once is given."
+    )
+    setting = "PRINT_JOBS"
+    interval = 1.0
+    once_help = "Run the jobs that are currently queued, then exit."
+    result = "Ran {count} print jobs"
+
+    def enabled(self):
+        return print_jobs.use_print_jobs()
+
+    def run_pending(self):
+        return print_jobs.run_pending()
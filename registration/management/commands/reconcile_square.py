@@ -0,0 +1,97 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from registration import reconcile
+
+
+def parse_time(value):
+    """A date or ISO datetime, in the current timezone if none is given."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        parsed = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconciles orders against Square payments and refunds made in a date "
+        "range, updating order statuses and writing a CSV report of missing "
+        "orders, total mismatches and payments with no order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("begin", help="Start of the range (date or ISO datetime).")
+        parser.add_argument("end", help="End of the range, exclusive.")
+        parser.add_argument(
+            "--location",
+            help="Square location id (default: SQUARE_LOCATION_ID).",
+        )
+        parser.add_argument(
+            "--report",
+            help="Write the discrepancy report to this file instead of stdout.",
+        )
+        parser.add_argument(
+            "--state",
+            help=(
+                "Save progress to this file after every page, and resume from it "
+                "if it exists."
+            ),
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=reconcile.PAGE_SIZE,
+            help="Payments or refunds to fetch per request (at most 100).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report discrepancies without updating any orders.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            begin = parse_time(options["begin"])
+            end = parse_time(options["end"])
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+        if end <= begin:
+            raise CommandError("The end of the range must be after the beginning.")
+
+        report = self.stdout
+        if options["report"]:
+            # Resumed runs add to the report they started.
+            resuming = options["state"] and os.path.exists(options["state"])
+            mode = "a" if resuming else "w"
+            report = open(options["report"], mode, newline="")
+
+        try:
+            reconciliation = reconcile.Reconciliation(
+                begin,
+                end,
+                report,
+                location_id=options["location"],
+                state_path=options["state"],
+                dry_run=options["dry_run"],
+                page_size=min(options["page_size"], 100),
+            )
+            counts = reconciliation.run()
+        except reconcile.StateMismatch as e:
+            raise CommandError(str(e))
+        except reconcile.ReconcileError as e:
+            raise CommandError(f"Square returned an error: {e}")
+        finally:
+            if report is not self.stdout:
+                report.close()
+
+        summary = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+        self.stderr.write(f"Reconciled {begin} to {end}: {summary or 'no changes'}")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from registration.events import get_event_by_name
+from registration.models import Badge, Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stored badge status columns (effective level, paid total "
+        "and association).  Run after upgrading, or after bulk edits that bypass "
+        "model save signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            type=str,
+            help="Only refresh badges for the named event (default: all events).",
+        )
+
+    def handle(self, *args, **options):
+        badges = Badge.objects.select_related("attendee", "event").order_by("pk")
+
+        if options["event"]:
+            try:
+                event = get_event_by_name(options["event"])
+            except Event.DoesNotExist:
+                raise CommandError("Event not found.")
+            badges = badges.filter(event=event)
+
+        count = 0
+        for badge in badges.iterator():
+            badge.refreshStatus()
+            count += 1
+
+        self.stdout.write(f"Refreshed status for {count} badges")
@@ -0,0 +1,19 @@
+from registration import webhooks
+from registration.management.worker import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = (
+        "Processes queued payment webhook notifications, in order for each "
+        "payment.  Runs until interrupted unless --once is given."
+    )
+    setting = "WEBHOOK_QUEUE"
+    interval = 2.0
+    once_help = "Process the notifications that are currently due, then exit."
+    result = "Processed {count} webhooks"
+
+    def enabled(self):
+        return webhooks.use_queue()
+
+    def run_pending(self):
+        return webhooks.run_pending()
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class WorkerCommand(BaseCommand):
+    """
+    Runs a queue's run_pending() until interrupted, or once with --once.
+    Subclasses name the setting that turns the queue on and say what a run
+    did.
+    """
+
+    setting = None
+    interval = 1.0
+    once_help = "Run what is currently queued, then exit."
+    result = "Ran {count}"
+
+    def enabled(self):
+        raise NotImplementedError
+
+    def run_pending(self):
+        raise NotImplementedError
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help=self.once_help)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=self.interval,
+            help="Seconds to wait between checks when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            count = self.run_pending()
+            self.stdout.write(self.result.format(count=count))
+            return
+
+        if not self.enabled():
+            raise CommandError(
+                f"{self.setting} is off, so there is nothing for this worker to do."
+            )
+        while True:
+            if self.run_pending() == 0:
+                time.sleep(options["interval"])
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0112_auto_20250531_0051"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="badge",
+            name="statusAssociation",
+            field=models.CharField(
+                choices=[
+                    ("Abandoned", "Abandoned"),
+                    ("Comp", "Comp"),
+                    ("Dealer", "Dealer"),
+                    ("Paid", "Paid"),
+                    ("Staff", "Staff"),
+                    ("Unpaid", "Unpaid"),
+                ],
+                default="Abandoned",
+                editable=False,
+                max_length=20,
+                verbose_name="Association",
+            ),
+        ),
+        migrations.AddField(
+            model_name="badge",
+            name="statusLevel",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="registration.pricelevel",
+            ),
+        ),
+        migrations.AddField(
+            model_name="badge",
+            name="statusPaidTotal",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=8,
+                verbose_name="Paid total",
+            ),
+        ),
+        migrations.AddField(
+            model_name="badge",
+            name="statusUnpaid",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0113_badge_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="reference",
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+    ]
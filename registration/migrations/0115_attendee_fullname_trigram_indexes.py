@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-18 01:28
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat
+
+
+def populate_full_name(apps, schema_editor):
+    Attendee = apps.get_model("registration", "Attendee")
+    Attendee.objects.update(fullName=Concat("firstName", Value(" "), "lastName"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0114_order_reference_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attendee",
+            name="fullName",
+            field=models.CharField(blank=True, editable=False, max_length=401),
+        ),
+        migrations.RunPython(populate_full_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="attendee",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["fullName"],
+                name="attendee_fullname_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="badge",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["badgeName"],
+                name="badge_badgename_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_sold_options(apps, schema_editor):
+    AttendeeOptions = apps.get_model("registration", "AttendeeOptions")
+    OptionInventory = apps.get_model("registration", "OptionInventory")
+    sold = (
+        AttendeeOptions.objects.filter(
+            option__quantity__isnull=False, orderItem__badge__isnull=False
+        )
+        # As catalog.count_sold, leaving out orders that failed or were refunded.
+        .exclude(orderItem__order__status__in=["Failed", "Refunded"])
+        .values_list("orderItem__badge__event_id", "option_id")
+        .annotate(sold=Count("id"))
+    )
+    OptionInventory.objects.bulk_create(
+        OptionInventory(event_id=event_id, option_id=option_id, sold=count)
+        for event_id, option_id, count in sold
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0115_attendee_fullname_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OptionInventory",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sold", models.PositiveIntegerField(default=0)),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="registration.event",
+                    ),
+                ),
+                (
+                    "option",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="registration.priceleveloption",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Option inventory",
+                "db_table": "registration_option_inventory",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="optioninventory",
+            constraint=models.UniqueConstraint(
+                fields=("event", "option"), name="option_inventory_event_option"
+            ),
+        ),
+        migrations.RunPython(count_sold_options, migrations.RunPython.noop),
+    ]
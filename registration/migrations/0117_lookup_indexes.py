@@ -0,0 +1,86 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:12
+
+import uuid
+
+from django.db import migrations, models
+
+import registration.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0116_option_inventory"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="badge",
+            name="registrationToken",
+            field=models.CharField(
+                db_index=True,
+                default=registration.models.getRegistrationToken,
+                max_length=200,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dealer",
+            name="registrationToken",
+            field=models.CharField(
+                db_index=True,
+                default=registration.models.getRegistrationToken,
+                max_length=200,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="dealerasst",
+            name="registrationToken",
+            field=models.CharField(
+                db_index=True,
+                default=registration.models.getRegistrationToken,
+                max_length=200,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="discount",
+            name="codeName",
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name="firebase",
+            name="token",
+            field=models.CharField(default=uuid.uuid4, max_length=500, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="staff",
+            name="registrationToken",
+            field=models.CharField(
+                db_index=True,
+                default=registration.models.getRegistrationToken,
+                max_length=200,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="temptoken",
+            name="token",
+            field=models.CharField(
+                default=registration.models.getRegistrationToken,
+                max_length=200,
+                unique=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="badge",
+            index=models.Index(
+                condition=models.Q(("badgeNumber__isnull", False)),
+                fields=["event", "badgeNumber"],
+                name="badge_event_number",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="banlist",
+            index=models.Index(
+                fields=["firstName", "lastName", "email"], name="ban_list_name_email"
+            ),
+        ),
+    ]
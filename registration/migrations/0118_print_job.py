@@ -0,0 +1,87 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:47
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("registration", "0117_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PrintJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "baseUrl",
+                    models.CharField(
+                        blank=True,
+                        help_text="Site URL as seen by the requester, used for links sent to printers.",
+                        max_length=500,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Pending", "Pending"),
+                            ("Running", "Running"),
+                            ("Complete", "Complete"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                (
+                    "nextAttempt",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("file", models.CharField(blank=True, max_length=200)),
+                ("error", models.TextField(blank=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                ("badges", models.ManyToManyField(blank=True, to="registration.Badge")),
+                (
+                    "terminal",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Terminal that requested the job, which is notified when it finishes.",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="registration.firebase",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="printjob",
+            index=models.Index(
+                fields=["status", "nextAttempt"], name="print_job_queue"
+            ),
+        ),
+    ]
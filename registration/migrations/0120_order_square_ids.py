@@ -0,0 +1,79 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:04
+
+import json
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def get_square_ids(api_data):
+    if isinstance(api_data, str):
+        try:
+            api_data = json.loads(api_data)
+        except ValueError:
+            api_data = None
+    if not isinstance(api_data, dict):
+        return None, []
+    payment = api_data.get("payment")
+    payment_id = payment.get("id") if isinstance(payment, dict) else None
+    refund_ids = [
+        refund["id"]
+        for refund in api_data.get("refunds") or []
+        if isinstance(refund, dict) and refund.get("id")
+    ]
+    return payment_id, refund_ids
+
+
+def populate_square_ids(apps, schema_editor):
+    Order = apps.get_model("registration", "Order")
+    batch = []
+    for order in Order.objects.exclude(apiData=None).only("apiData").iterator():
+        order.squarePaymentId, order.squareRefundIds = get_square_ids(order.apiData)
+        if order.squarePaymentId or order.squareRefundIds:
+            batch.append(order)
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, ["squarePaymentId", "squareRefundIds"])
+            batch = []
+    Order.objects.bulk_update(batch, ["squarePaymentId", "squareRefundIds"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0119_queued_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="squarePaymentId",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=100,
+                null=True,
+                verbose_name="Square payment ID",
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="squareRefundIds",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=100),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+                verbose_name="Square refund IDs",
+            ),
+        ),
+        migrations.RunPython(populate_square_ids, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="order",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["squareRefundIds"], name="order_square_refund_ids"
+            ),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def get_payment_id(body):
+    data = body.get("data") or {}
+    data_object = data.get("object") or {}
+    if data.get("type") == "payment":
+        return data.get("id") or ""
+    if "refund" in data_object:
+        return data_object["refund"].get("payment_id") or ""
+    if "dispute" in data_object:
+        disputed = data_object["dispute"].get("disputed_payment") or {}
+        return disputed.get("payment_id") or ""
+    return ""
+
+
+def populate_queue_fields(apps, schema_editor):
+    # Notifications already handled inline aren't queued; replay them from
+    # the admin if needed.
+    PaymentWebhookNotification = apps.get_model(
+        "registration", "PaymentWebhookNotification"
+    )
+    PaymentWebhookNotification.objects.update(nextAttempt=None)
+    batch = []
+    for notification in PaymentWebhookNotification.objects.only("body").iterator():
+        notification.paymentId = get_payment_id(notification.body)
+        if notification.paymentId:
+            batch.append(notification)
+        if len(batch) >= 500:
+            PaymentWebhookNotification.objects.bulk_update(batch, ["paymentId"])
+            batch = []
+    PaymentWebhookNotification.objects.bulk_update(batch, ["paymentId"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0120_order_square_ids"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentwebhooknotification",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooknotification",
+            name="error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooknotification",
+            name="nextAttempt",
+            field=models.DateTimeField(
+                blank=True, default=django.utils.timezone.now, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooknotification",
+            name="paymentId",
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="paymentwebhooknotification",
+            name="processedAt",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_queue_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="paymentwebhooknotification",
+            index=models.Index(
+                condition=models.Q(("processed", False)),
+                fields=["nextAttempt", "timestamp"],
+                name="webhook_queue",
+            ),
+        ),
+    ]
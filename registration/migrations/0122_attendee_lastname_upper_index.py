@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:19
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0121_webhook_queue"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attendee",
+            index=models.Index(
+                django.db.models.functions.text.Upper("lastName"),
+                name="attendee_lastname_upper",
+            ),
+        ),
+    ]
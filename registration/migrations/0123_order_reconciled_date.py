@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0122_attendee_lastname_upper_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="reconciledDate",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Reconciled Date"
+            ),
+        ),
+    ]
@@ -1,11 +1,15 @@
+import json
 import random
 import string
-from decimal import Decimal
-from datetime import datetime
 import uuid
+from datetime import datetime
+from decimal import Decimal
 
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models.functions import Coalesce, Upper
 from django.utils import timezone
 
 
@@ -40,7 +44,7 @@ class ShirtSizes(LookupTable):
 
 
 class Discount(models.Model):
-    codeName = models.CharField(max_length=100)
+    codeName = models.CharField(max_length=100, db_index=True)
     percentOff = models.IntegerField(null=True)
     amountOff = models.DecimalField(max_digits=6, decimal_places=2, null=True)
     startDate = models.DateTimeField()
@@ -84,7 +88,12 @@ class PriceLevelOption(models.Model):
     optionExtraType = models.CharField(
         max_length=100,
         blank=True,
-        choices=[("int", "Quantity"), ("bool", "Yes/No"), ("ShirtSizes", "Shirt Size"), ("string", "String")],
+        choices=[
+            ("int", "Quantity"),
+            ("bool", "Yes/No"),
+            ("ShirtSizes", "Shirt Size"),
+            ("string", "String"),
+        ],
     )
     optionExtraType2 = models.CharField(max_length=100, blank=True)
     optionExtraType3 = models.CharField(max_length=100, blank=True)
@@ -97,7 +106,7 @@ class PriceLevelOption(models.Model):
     displayFreeLabel = models.BooleanField(
         default=True,
         verbose_name="Display free text",
-        help_text="Disable if the \"Free\" label should not be shown.",
+        help_text='Disable if the "Free" label should not be shown.',
     )
     quantity = models.IntegerField(
         null=True,
@@ -152,11 +161,14 @@ class PriceLevel(models.Model):
     isVendor = models.BooleanField(default=False)
     minimumOrgDonation = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     min_age = models.IntegerField(default=0)
-    max_age = models.IntegerField(blank=True, null=True,
-                                  help_text="Leave blank for no limit")
+    max_age = models.IntegerField(
+        blank=True, null=True, help_text="Leave blank for no limit"
+    )
     accompanied = models.BooleanField(default=False)
     available_to_attendee = models.BooleanField(default=False, verbose_name="Attendee")
-    available_to_marketplace = models.BooleanField(default=False, verbose_name="Marketplace")
+    available_to_marketplace = models.BooleanField(
+        default=False, verbose_name="Marketplace"
+    )
     available_to_staff = models.BooleanField(default=False, verbose_name="Staff")
 
     class Meta:
@@ -171,6 +183,7 @@ class PriceLevel(models.Model):
         if self.startDate <= today <= self.endDate:
             return True
         return False
+
     get_level_active_status.boolean = True
     get_level_active_status.short_description = "Active"
 
@@ -207,11 +220,17 @@ class BadgeTemplate(models.Model):
     name = models.CharField(max_length=100)
     template = models.TextField()
     paperWidth = models.CharField(max_length=10, null=True, verbose_name="Paper Width")
-    paperHeight = models.CharField(max_length=10, null=True, verbose_name="Paper Height")
-    marginTop = models.CharField(max_length=10, null=True, verbose_name = "Margin Top")
-    marginBottom = models.CharField(max_length=10, null=True, verbose_name = "Margin Bottom")
+    paperHeight = models.CharField(
+        max_length=10, null=True, verbose_name="Paper Height"
+    )
+    marginTop = models.CharField(max_length=10, null=True, verbose_name="Margin Top")
+    marginBottom = models.CharField(
+        max_length=10, null=True, verbose_name="Margin Bottom"
+    )
     marginLeft = models.CharField(max_length=10, null=True, verbose_name="Margin Left")
-    marginRight = models.CharField(max_length=10, null=True, verbose_name = "Margin Right")
+    marginRight = models.CharField(
+        max_length=10, null=True, verbose_name="Margin Right"
+    )
     landscape = models.BooleanField(default=True)
     scale = models.FloatField(default=1.0)
 
@@ -315,22 +334,22 @@ class Event(LookupTable):
     hasBadges = models.BooleanField(
         default=True,
         verbose_name="Produce attendee badge",
-        help_text="Disable if your event does not include attendee badges."
+        help_text="Disable if your event does not include attendee badges.",
     )
     hasVolunteering = models.BooleanField(
         default=True,
         verbose_name="Accept volunteers",
-        help_text="Disable if your event does not accept public volunteers requests."
+        help_text="Disable if your event does not accept public volunteers requests.",
     )
     emailOptions = models.BooleanField(
         default=True,
         verbose_name="Email options",
-        help_text="Disable to remove the post-con survey and newsletter checkboxes."
+        help_text="Disable to remove the post-con survey and newsletter checkboxes.",
     )
     multiAttendeeCarts = models.BooleanField(
         default=True,
         verbose_name="Multiple attendees in cart",
-        help_text="Disable if your event only supports single attendees per order."
+        help_text="Disable if your event only supports single attendees per order.",
     )
     registrationEmail = models.CharField(
         max_length=200,
@@ -438,7 +457,7 @@ def getRegistrationToken():
 
 
 class TempToken(models.Model):
-    token = models.CharField(max_length=200, default=getRegistrationToken)
+    token = models.CharField(max_length=200, default=getRegistrationToken, unique=True)
     email = models.CharField(max_length=200)
     ignore_time_window = models.BooleanField(
         default=False,
@@ -484,6 +503,26 @@ class Attendee(models.Model):
     parentPhone = models.CharField(max_length=50, blank=True)
     parentEmail = models.CharField(max_length=200, blank=True)
     aslRequest = models.BooleanField(default=False)
+    # "firstName lastName", stored so that onsite search can use a trigram index.
+    fullName = models.CharField(max_length=401, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=["fullName"],
+                name="attendee_fullname_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+            # Serves lastName__iexact, which compares UPPER(lastName).
+            models.Index(Upper("lastName"), name="attendee_lastname_upper"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.fullName = f"{self.firstName} {self.lastName}"
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"firstName", "lastName"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"fullName"}
+        return super(Attendee, self).save(*args, **kwargs)
 
     def getFirst(self):
         if not self.preferredName:
@@ -511,6 +550,91 @@ def badge_signature_bitmap_path(instance, filename):
     )
 
 
+class BadgeQuerySet(models.QuerySet):
+    def with_status(self):
+        """
+        Annotates each badge with the values of effectiveLevel(), paidTotal(),
+        getDiscount() and abandoned, computed in SQL so listing badges does not
+        cost several queries per row:
+
+        effective_level_id -- highest priced level ordered, or None
+        has_unpaid_order -- effectiveLevel() would return Badge.UNPAID
+        effective_level_name -- str(effectiveLevel()), or None
+        paid_total, discount_code -- as paidTotal() and getDiscount()
+        is_staff, is_dealer, association -- as abandoned
+        """
+        order_items = OrderItem.objects.filter(
+            badge=models.OuterRef("pk"), order__isnull=False
+        )
+        effective_item = order_items.filter(priceLevel__isnull=False).order_by(
+            "-priceLevel__basePrice", "pk"
+        )
+        paid_total = (
+            order_items.exclude(order__billingType=Order.UNPAID)
+            .order_by()
+            .values("badge")
+            .annotate(total=models.Sum("order__total"))
+            .values("total")
+        )
+        discount_item = order_items.filter(order__discount__isnull=False).order_by(
+            "-pk"
+        )
+        same_person = dict(
+            attendee=models.OuterRef("attendee"), event=models.OuterRef("event")
+        )
+
+        return self.annotate(
+            effective_level_id=models.Subquery(effective_item.values("priceLevel")[:1]),
+            has_unpaid_order=models.Exists(
+                order_items.filter(order__billingType=Order.UNPAID)
+            ),
+            paid_total=Coalesce(
+                models.Subquery(paid_total, output_field=models.DecimalField()),
+                models.Value(Decimal(0)),
+            ),
+            discount_code=Coalesce(
+                models.Subquery(discount_item.values("order__discount__codeName")[:1]),
+                models.Value(""),
+                output_field=models.CharField(),
+            ),
+            is_staff=models.Exists(Staff.objects.filter(**same_person)),
+            is_dealer=models.Exists(Dealer.objects.filter(**same_person)),
+        ).annotate(
+            effective_level_name=models.Case(
+                models.When(has_unpaid_order=True, then=models.Value(Badge.UNPAID)),
+                default=models.Subquery(effective_item.values("priceLevel__name")[:1]),
+                output_field=models.CharField(),
+            ),
+            association=models.Case(
+                models.When(is_staff=True, then=models.Value(Badge.STAFF)),
+                models.When(is_dealer=True, then=models.Value(Badge.DEALER)),
+                models.When(paid_total__gt=0, then=models.Value(Badge.PAID)),
+                models.When(has_unpaid_order=True, then=models.Value(Badge.UNPAID)),
+                models.When(
+                    effective_level_id__isnull=False, then=models.Value(Badge.COMP)
+                ),
+                default=models.Value(Badge.ABANDONED),
+                output_field=models.CharField(),
+            ),
+        )
+
+    def refresh_status(self):
+        """
+        Badge.refreshStatus() for every badge here, computed with with_status()
+        and written with one bulk_update.  Returns the number refreshed.
+        """
+        badges = list(self.with_status().only("pk"))
+        for badge in badges:
+            badge.statusUnpaid = badge.has_unpaid_order
+            badge.statusLevel_id = (
+                None if badge.has_unpaid_order else badge.effective_level_id
+            )
+            badge.statusPaidTotal = badge.paid_total
+            badge.statusAssociation = badge.association
+        Badge.objects.bulk_update(badges, Badge.STATUS_FIELDS)
+        return len(badges)
+
+
 class Badge(models.Model):
     ABANDONED = "Abandoned"
     COMP = "Comp"
@@ -518,18 +642,70 @@ class Badge(models.Model):
     PAID = "Paid"
     STAFF = "Staff"
     UNPAID = "Unpaid"
+    ASSOCIATION_CHOICES = (
+        (ABANDONED, "Abandoned"),
+        (COMP, "Comp"),
+        (DEALER, "Dealer"),
+        (PAID, "Paid"),
+        (STAFF, "Staff"),
+        (UNPAID, "Unpaid"),
+    )
+    STATUS_FIELDS = (
+        "statusLevel",
+        "statusUnpaid",
+        "statusPaidTotal",
+        "statusAssociation",
+    )
     attendee = models.ForeignKey(
         Attendee, null=True, blank=True, on_delete=models.CASCADE
     )
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     registeredDate = models.DateTimeField(null=True)
-    registrationToken = models.CharField(max_length=200, default=getRegistrationToken)
+    registrationToken = models.CharField(
+        max_length=200, default=getRegistrationToken, db_index=True
+    )
     badgeName = models.CharField(max_length=200, blank=True)
     badgeNumber = models.IntegerField(null=True, blank=True)
     printed = models.BooleanField(default=False)
     printCount = models.IntegerField(default=0)
     signature_svg = models.TextField(null=True, blank=True)
     signature_bitmap = models.TextField(null=True, blank=True)
+    objects = BadgeQuerySet.as_manager()
+    # Denormalized copies of effectiveLevel(), paidTotal() and abandoned,
+    # maintained by registration.signals.  Use these when listing many badges.
+    statusLevel = models.ForeignKey(
+        PriceLevel,
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    statusUnpaid = models.BooleanField(default=False, editable=False)
+    statusPaidTotal = models.DecimalField(
+        "Paid total", max_digits=8, decimal_places=2, default=0, editable=False
+    )
+    statusAssociation = models.CharField(
+        "Association",
+        max_length=20,
+        choices=ASSOCIATION_CHOICES,
+        default=ABANDONED,
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                fields=["badgeName"],
+                name="badge_badgename_trgm",
+                opclasses=["gin_trgm_ops"],
+            ),
+            models.Index(
+                fields=["event", "badgeNumber"],
+                name="badge_event_number",
+                condition=models.Q(badgeNumber__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         if self.badgeNumber is not None or self.badgeNumber == "":
@@ -572,19 +748,44 @@ class Badge(models.Model):
 
     @property
     def abandoned(self):
+        return self._association(self.paidTotal(), self.effectiveLevel())
+
+    def _association(self, paid_total, level):
         if Staff.objects.filter(attendee=self.attendee, event=self.event).exists():
             return Badge.STAFF
         if Dealer.objects.filter(attendee=self.attendee, event=self.event).exists():
             return Badge.DEALER
-        if self.paidTotal() > 0:
+        if paid_total > 0:
             return Badge.PAID
-        level = self.effectiveLevel()
         if level == Badge.UNPAID:
             return Badge.UNPAID
         if level:
             return Badge.COMP
         return Badge.ABANDONED
 
+    @property
+    def statusEffectiveLevel(self):
+        """Stored counterpart of effectiveLevel()."""
+        if self.statusUnpaid:
+            return Badge.UNPAID
+        return self.statusLevel
+
+    def refreshStatus(self):
+        """
+        Recomputes the stored status columns from the related Order, OrderItem,
+        Staff and Dealer rows.  Writes with an UPDATE so that no save signals
+        are fired for the badge itself.
+        """
+        level = self.effectiveLevel()
+        paid_total = self.paidTotal()
+        self.statusUnpaid = level == Badge.UNPAID
+        self.statusLevel = None if self.statusUnpaid else level
+        self.statusPaidTotal = paid_total
+        self.statusAssociation = self._association(paid_total, level)
+        Badge.objects.filter(pk=self.pk).update(
+            **{name: getattr(self, name) for name in self.STATUS_FIELDS}
+        )
+
     def effectiveLevel(self):
         level = None
         orderItems = OrderItem.objects.filter(badge=self, order__isnull=False)
@@ -608,6 +809,15 @@ class Badge(models.Model):
     def save(self, *args, **kwargs):
         if not self.id and not self.registeredDate:
             self.registeredDate = timezone.now()
+        if not (self._state.adding or args or kwargs.get("force_insert")) and (
+            "update_fields" not in kwargs
+        ):
+            # Don't clobber status columns refreshed since this instance was loaded.
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STATUS_FIELDS
+            ]
         return super(Badge, self).save(*args, **kwargs)
 
 
@@ -615,7 +825,9 @@ class Staff(models.Model):
     attendee = models.ForeignKey(
         Attendee, null=True, blank=True, on_delete=models.CASCADE
     )
-    registrationToken = models.CharField(max_length=200, default=getRegistrationToken)
+    registrationToken = models.CharField(
+        max_length=200, default=getRegistrationToken, db_index=True
+    )
     department = models.ForeignKey(
         Department, null=True, blank=True, on_delete=models.SET_NULL
     )
@@ -663,7 +875,9 @@ class Dealer(models.Model):
     attendee = models.ForeignKey(
         Attendee, null=True, blank=True, on_delete=models.SET_NULL
     )
-    registrationToken = models.CharField(max_length=200, default=getRegistrationToken)
+    registrationToken = models.CharField(
+        max_length=200, default=getRegistrationToken, db_index=True
+    )
     approved = models.BooleanField(default=False)
     tableNumber = models.IntegerField(null=True, blank=True)
     notes = models.TextField(blank=True)
@@ -731,7 +945,9 @@ class DealerAsst(models.Model):
     attendee = models.ForeignKey(
         Attendee, null=True, blank=True, on_delete=models.CASCADE
     )
-    registrationToken = models.CharField(max_length=200, default=getRegistrationToken)
+    registrationToken = models.CharField(
+        max_length=200, default=getRegistrationToken, db_index=True
+    )
     name = models.CharField(max_length=400)
     email = models.CharField(max_length=200)
     license = models.CharField(max_length=50)
@@ -824,7 +1040,7 @@ class Order(models.Model):
     }
     total = models.DecimalField(max_digits=8, decimal_places=2)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default=PENDING)
-    reference = models.CharField(max_length=50)
+    reference = models.CharField(max_length=50, db_index=True)
     createdDate = models.DateTimeField(
         auto_now_add=True, null=True, verbose_name="Created Date"
     )
@@ -873,6 +1089,26 @@ class Order(models.Model):
     )
     lastFour = models.CharField(max_length=4, blank=True, verbose_name="Last 4")
     apiData = models.JSONField(null=True)
+    # Copied out of apiData on save so webhooks can find orders by index.
+    squarePaymentId = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        verbose_name="Square payment ID",
+    )
+    squareRefundIds = ArrayField(
+        models.CharField(max_length=100),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name="Square refund IDs",
+    )
+    # Set by reconcile_square when a Square payment matches the order.
+    reconciledDate = models.DateTimeField(
+        null=True, blank=True, editable=False, verbose_name="Reconciled Date"
+    )
     onsite_reference = models.UUIDField(null=True, blank=True)
     checkedInDate = models.DateTimeField(
         null=True,
@@ -924,7 +1160,36 @@ class Order(models.Model):
             self.total, self.billingType, self.status, self.reference
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        order = super().from_db(db, field_names, values)
+        # Compared on save, to give back stock when an order fails.
+        order._loaded_status = order.__dict__.get("status")
+        return order
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        if fields is None or "status" in fields:
+            self._loaded_status = self.status
+
+    def save(self, *args, **kwargs):
+        self.refreshSquareIds()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "apiData" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {
+                "squarePaymentId",
+                "squareRefundIds",
+            }
+        return super(Order, self).save(*args, **kwargs)
+
+    def refreshSquareIds(self):
+        """Sets squarePaymentId and squareRefundIds from apiData."""
+        self.squarePaymentId, self.squareRefundIds = get_square_ids(self.apiData)
+
     class Meta:
+        indexes = [
+            GinIndex(fields=["squareRefundIds"], name="order_square_refund_ids"),
+        ]
         permissions = (
             ("issue_refund", "Can create refunds"),
             ("cash", "Can handle cash transactions"),
@@ -933,6 +1198,33 @@ class Order(models.Model):
         )
 
 
+def load_api_data(api_data):
+    """An order's apiData as a dict, or None if it doesn't hold one."""
+    if isinstance(api_data, str):
+        # Some onsite payments store their data pre-serialized.
+        try:
+            api_data = json.loads(api_data)
+        except ValueError:
+            return None
+    return api_data if isinstance(api_data, dict) else None
+
+
+def get_square_ids(api_data):
+    """The Square payment id and list of refund ids in an order's apiData."""
+    api_data = load_api_data(api_data)
+    if api_data is None:
+        return None, []
+
+    payment = api_data.get("payment")
+    payment_id = payment.get("id") if isinstance(payment, dict) else None
+    refund_ids = [
+        refund["id"]
+        for refund in api_data.get("refunds") or []
+        if isinstance(refund, dict) and refund.get("id")
+    ]
+    return payment_id, refund_ids
+
+
 class PaymentWebhookNotification(models.Model):
     integration = models.CharField(max_length=50, default="square")
     event_id = models.UUIDField(unique=True)
@@ -941,10 +1233,25 @@ class PaymentWebhookNotification(models.Model):
     processed = models.BooleanField(default=False)
     body = models.JSONField("Webhook body")
     headers = models.JSONField("Webhook headers")
+    # Notifications for the same payment are processed in the order received.
+    paymentId = models.CharField(max_length=100, blank=True, db_index=True)
+    attempts = models.IntegerField(default=0)
+    nextAttempt = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    processedAt = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
 
     def __str__(self):
         return f"{self.integration} {self.event_type} {self.event_id}"
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["nextAttempt", "timestamp"],
+                name="webhook_queue",
+                condition=models.Q(processed=False),
+            ),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, null=True, on_delete=models.CASCADE)
@@ -1001,6 +1308,29 @@ class AttendeeOptions(models.Model):
         return "[{0}] - {1}".format(str(self.orderItem), self.option)
 
 
+class OptionInventory(models.Model):
+    """
+    Units of a limited PriceLevelOption taken for an event.  Only ever
+    changed with conditional UPDATEs, see registration.catalog.
+    """
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    option = models.ForeignKey(PriceLevelOption, on_delete=models.CASCADE)
+    sold = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "registration_option_inventory"
+        verbose_name_plural = "Option inventory"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "option"], name="option_inventory_event_option"
+            ),
+        ]
+
+    def __str__(self):
+        return "{0} - {1}: {2}".format(self.event, self.option, self.sold)
+
+
 class BanList(models.Model):
     firstName = models.CharField(max_length=200, blank=True)
     lastName = models.CharField(max_length=200, blank=True)
@@ -1010,6 +1340,11 @@ class BanList(models.Model):
     class Meta:
         db_table = "registration_ban_list"
         verbose_name_plural = "Ban list"
+        indexes = [
+            models.Index(
+                fields=["firstName", "lastName", "email"], name="ban_list_name_email"
+            ),
+        ]
 
 
 class SquareDevice(models.Model):
@@ -1028,7 +1363,7 @@ class Firebase(models.Model):
         (MQTT_REGISTER_APP, "iPad"),
         (SQUARE_TERMINAL, "Square Terminal"),
     )
-    token = models.CharField(max_length=500, default=uuid.uuid4)
+    token = models.CharField(max_length=500, default=uuid.uuid4, unique=True)
     name = models.CharField(max_length=100)
     closed = models.BooleanField(default=False)
     cashdrawer = models.BooleanField(default=False, verbose_name="Cash drawer")
@@ -1038,7 +1373,7 @@ class Firebase(models.Model):
         blank=True,
         on_delete=models.SET_NULL,
         verbose_name="Print via MQTT",
-        help_text="Which terminal to use for printing via MQTT, if it should be used at this terminal."
+        help_text="Which terminal to use for printing via MQTT, if it should be used at this terminal.",
     )
     printer_url = models.CharField(max_length=500, null=True, blank=True)
     background_color = models.CharField(max_length=10, default="#0099cc")
@@ -1048,16 +1383,18 @@ class Firebase(models.Model):
         null=True,
         blank=True,
         default=settings.REGISTER_DEFAULT_WEBVIEW,
-        verbose_name="Web view URL"
+        verbose_name="Web view URL",
     )
     square_terminal_id = models.ForeignKey(
         SquareDevice,
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
-        verbose_name="Square Terminal"
+        verbose_name="Square Terminal",
+    )
+    payment_type = models.CharField(
+        max_length=20, choices=PAYMENT_CHOICES, null=True, blank=True
     )
-    payment_type = models.CharField(max_length=20, choices=PAYMENT_CHOICES, null=True, blank=True)
 
     def __str__(self):
         return str(self.name)
@@ -1103,6 +1440,90 @@ class Cashdrawer(models.Model):
     )
 
 
+class PrintJob(models.Model):
+    """A batch of badges queued for the print worker."""
+
+    PENDING = "Pending"
+    RUNNING = "Running"
+    COMPLETE = "Complete"
+    FAILED = "Failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (COMPLETE, "Complete"),
+        (FAILED, "Failed"),
+    )
+    badges = models.ManyToManyField(Badge, blank=True)
+    terminal = models.ForeignKey(
+        Firebase,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text="Terminal that requested the job, which is notified when it finishes.",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    baseUrl = models.CharField(
+        max_length=500,
+        blank=True,
+        help_text="Site URL as seen by the requester, used for links sent to printers.",
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    nextAttempt = models.DateTimeField(default=timezone.now)
+    file = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Print job {self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "nextAttempt"], name="print_job_queue"),
+        ]
+
+
+class QueuedEmail(models.Model):
+    """An email waiting in the outbox for the email worker."""
+
+    PENDING = "Pending"
+    SENDING = "Sending"
+    SENT = "Sent"
+    FAILED = "Failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    )
+    template = models.CharField(max_length=100, blank=True)
+    replyTo = models.CharField(max_length=254)
+    to = models.JSONField()
+    bcc = models.JSONField(default=list, blank=True)
+    subject = models.CharField(max_length=998)
+    text = models.TextField()
+    html = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    nextAttempt = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "nextAttempt"], name="queued_email_queue"),
+            models.Index(fields=["template", "sent"], name="queued_email_rate"),
+        ]
+
+
 class ReservedBadgeNumbers(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     badgeNumber = models.IntegerField()
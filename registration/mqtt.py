@@ -1,19 +1,47 @@
+import atexit
 import base64
 import json
 import logging
+import os
+import queue
 import re
+import threading
+import time
+import uuid
 from datetime import datetime, timezone
 from decimal import Decimal
 
 import jwt
 from django.conf import settings
-from paho.mqtt import publish as mqtt
+from paho.mqtt import client as mqtt
+from prometheus_client import Counter, Gauge, Histogram
 
 FORMAT_TOPIC_SYS_RE = re.compile(r"^\$")
 FORMAT_TOPIC_WILDCARD_RE = re.compile(r"[\#\+ /]")
 
 logger = logging.getLogger(__name__)
 
+MQTT_PUBLISH_SECONDS = Histogram(
+    "mqtt_publish_seconds", "Time from queueing an MQTT message to publishing it"
+)
+MQTT_PUBLISH_FAILURES = Counter(
+    "mqtt_publish_failures", "MQTT messages that could not be published", ["reason"]
+)
+MQTT_OUTBOX_SIZE = Gauge("mqtt_outbox_size", "MQTT messages waiting to be published")
+
+# Messages waiting to be published, per worker.  Beyond this they're dropped.
+OUTBOX_SIZE = getattr(settings, "MQTT_OUTBOX_SIZE", 1000)
+
+# Messages that can't be delivered within this many seconds are dropped;
+# they're UI nudges and terminal commands that are useless once stale.
+MESSAGE_TTL = getattr(settings, "MQTT_MESSAGE_TTL", 30)
+
+# How long the server's own broker credentials are valid for.
+SERVER_TOKEN_LIFETIME = 60 * 60
+SERVER_TOKEN_REFRESH = 5 * 60
+
+MAX_RECONNECT_DELAY = 30
+
 TOPICS = [
     "receipts",
     "admin",
@@ -52,7 +80,9 @@ def get_onsite_admin_token(firebase):
     topics = [f"{base_topic}/#"]
     print_topic = None
     if firebase.print_via_mqtt and firebase.print_via_mqtt.id != firebase.id:
-        print_topic = f"{get_topic('admin')}/{format_topic(firebase.print_via_mqtt.name)}/action"
+        print_topic = (
+            f"{get_topic('admin')}/{format_topic(firebase.print_via_mqtt.name)}/action"
+        )
         topics.append(print_topic)
     token = get_token(user, subs=topics, publ=topics)
     return {
@@ -98,21 +128,153 @@ def format_topic(topic):
     return topic.lower()
 
 
+class MQTTPublisher:
+    """
+    Publishes messages from a background thread over one long-lived broker
+    connection, so a slow or missing broker never holds up a request.
+
+    The connection is opened on first use and reopened after any failure,
+    with a fresh server token whenever the cached one is close to expiring.
+    """
+
+    def __init__(self, broker=None, client_factory=mqtt.Client):
+        self._broker = broker
+        self._client_factory = client_factory
+        self._client = None
+        self._client_expires = 0
+        self._token = None
+        self._token_expires = 0
+        self._reconnect_delay = 1
+        self._outbox = queue.Queue(maxsize=OUTBOX_SIZE)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def broker(self):
+        return self._broker or settings.MQTT_BROKER
+
+    def publish(self, topic, payload_json, retain=False):
+        self._ensure_thread()
+        try:
+            self._outbox.put_nowait((topic, payload_json, retain, time.monotonic()))
+        except queue.Full:
+            MQTT_PUBLISH_FAILURES.labels("outbox_full").inc()
+            logger.warning(f"MQTT outbox full, dropping message to {topic}")
+            return False
+        MQTT_OUTBOX_SIZE.set(self._outbox.qsize())
+        return True
+
+    def flush(self, timeout=5):
+        """Wait up to timeout seconds for queued messages to be sent."""
+        deadline = time.monotonic() + timeout
+        while self._outbox.unfinished_tasks and time.monotonic() < deadline:
+            if self._thread is None or not self._thread.is_alive():
+                break
+            time.sleep(0.05)
+        return not self._outbox.unfinished_tasks
+
+    def _ensure_thread(self):
+        # Forked workers inherit the object but not the thread or socket.
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._client = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="mqtt-publisher", daemon=True
+            )
+            self._thread.start()
+
+    def _server_token(self):
+        now = time.time()
+        if self._token is None or self._token_expires - now < SERVER_TOKEN_REFRESH:
+            self._token_expires = int(now) + SERVER_TOKEN_LIFETIME
+            topics = [f"{get_topic(t)}/#" for t in TOPICS]
+            self._token = get_token("apis_server", exp=self._token_expires, publ=topics)
+        return self._token
+
+    def _connect(self):
+        broker = self.broker
+        client = self._client_factory(client_id=f"apis_server-{uuid.uuid4().hex[:12]}")
+        client.username_pw_set("apis_server", self._server_token())
+        tls = broker.get("tls")
+        if tls is not None:
+            if isinstance(tls, dict):
+                tls = dict(tls)
+                insecure = tls.pop("insecure", False)
+                client.tls_set(**tls)
+                if insecure:
+                    client.tls_insecure_set(insecure)
+            else:
+                client.tls_set_context(tls)
+        client.connect(broker["host"], broker["port"], broker.get("keepalive", 60))
+        client.loop_start()
+        self._client = client
+        self._client_expires = self._token_expires
+
+    def _disconnect(self):
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.disconnect()
+                client.loop_stop()
+            except Exception:
+                pass
+
+    def _send(self, topic, payload_json, retain):
+        if (
+            self._client is not None
+            and self._client_expires - time.time() < SERVER_TOKEN_REFRESH
+        ):
+            # The broker only checks credentials on connect.
+            self._disconnect()
+        if self._client is None:
+            self._connect()
+        info = self._client.publish(topic, payload_json, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise OSError(f"publish failed: {mqtt.error_string(info.rc)}")
+
+    def _run(self):
+        while True:
+            message = self._outbox.get()
+            topic, payload_json, retain, queued_at = message
+            try:
+                while True:
+                    if time.monotonic() - queued_at > MESSAGE_TTL:
+                        MQTT_PUBLISH_FAILURES.labels("expired").inc()
+                        logger.warning(f"Dropping stale MQTT message to {topic}")
+                        break
+                    try:
+                        self._send(topic, payload_json, retain)
+                    except Exception as e:
+                        MQTT_PUBLISH_FAILURES.labels("error").inc()
+                        logger.warning(
+                            f"Unable to publish MQTT message to {topic}: {e}"
+                        )
+                        self._disconnect()
+                        time.sleep(self._reconnect_delay)
+                        self._reconnect_delay = min(
+                            self._reconnect_delay * 2, MAX_RECONNECT_DELAY
+                        )
+                        continue
+                    self._reconnect_delay = 1
+                    MQTT_PUBLISH_SECONDS.observe(time.monotonic() - queued_at)
+                    break
+            finally:
+                self._outbox.task_done()
+                MQTT_OUTBOX_SIZE.set(self._outbox.qsize())
+
+
+publisher = MQTTPublisher()
+atexit.register(publisher.flush)
+
+
 def send_mqtt_message(topic, payload={}, retain=False):
+    """Queues a message for the broker, returning False if it was dropped."""
     payload_json = json.dumps(payload, cls=JSONDecimalEncoder)
 
     logger.info(f"Sending MQTT message: {topic} ({payload_json})")
-    auth = {
-        "username": "apis_server",
-        "password": get_token("apis_server", publ=[topic]),
-    }
-    tls = settings.MQTT_BROKER.get("tls")
-    mqtt.single(
-        topic,
-        payload_json,
-        retain=retain,
-        hostname=settings.MQTT_BROKER["host"],
-        port=settings.MQTT_BROKER["port"],
-        auth=auth,
-        tls=tls,
-    )
+    return publisher.publish(topic, payload_json, retain=retain)
@@ -0,0 +1,194 @@
+"""
+Outbox for outgoing email.
+
+With EMAIL_OUTBOX on, send_email() only records a QueuedEmail, in the same
+transaction as whatever caused it, so a slow or unreachable mail server
+can't hold up checkout.  The email_worker command sends queued mail in
+batches over one SMTP connection, retrying failures with backoff and
+holding back templates that are over their EMAIL_RATE_LIMITS.
+"""
+
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from registration import queues
+from registration.models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+EMAIL_SEND_SECONDS = Histogram(
+    "email_send_seconds", "Time spent handing an email to the mail server", ["template"]
+)
+EMAIL_QUEUE_SECONDS = Histogram(
+    "email_queue_seconds", "Time from queueing an email to sending it", ["template"]
+)
+EMAIL_RESULTS = Counter("email_results", "Outbox send attempts", ["template", "status"])
+
+BATCH_SIZE = getattr(settings, "EMAIL_BATCH_SIZE", 50)
+
+# Attempts before an email is marked failed, and the delay before the first
+# retry, which doubles each time.
+MAX_ATTEMPTS = getattr(settings, "EMAIL_ATTEMPTS", 5)
+RETRY_DELAY = getattr(settings, "EMAIL_RETRY_DELAY", 30)
+
+# Emails claimed but not updated for this long belong to a worker that died.
+STALE_AFTER = getattr(settings, "EMAIL_SEND_TIMEOUT", 600)
+
+# Most emails sent per template in RATE_LIMIT_WINDOW seconds, eg.
+# {"dealer/dealer-approval": 30}.  Templates not listed aren't limited.
+RATE_LIMIT_WINDOW = 60
+
+
+def use_outbox():
+    return getattr(settings, "EMAIL_OUTBOX", False)
+
+
+def get_rate_limits():
+    return getattr(settings, "EMAIL_RATE_LIMITS", {})
+
+
+def enqueue(
+    reply_address, to_address_list, subject, message, html_message, bcc=(), template=""
+):
+    return QueuedEmail.objects.create(
+        template=template,
+        replyTo=reply_address,
+        to=list(to_address_list),
+        bcc=list(bcc),
+        subject=subject,
+        text=message,
+        html=html_message,
+    )
+
+
+def build_message(
+    reply_address,
+    to_address_list,
+    subject,
+    message,
+    html_message,
+    bcc=(),
+    connection=None,
+):
+    mail_message = EmailMultiAlternatives(
+        subject,
+        message,
+        settings.APIS_DEFAULT_EMAIL,
+        to_address_list,
+        reply_to=[reply_address],
+        bcc=list(bcc),
+        connection=connection,
+    )
+    mail_message.attach_alternative(html_message, "text/html")
+    return mail_message
+
+
+def claim_batch(size=BATCH_SIZE):
+    """
+    Marks up to size due emails as sending and returns them.  Emails whose
+    template is over its rate limit are pushed back instead.
+    """
+    now = timezone.now()
+    limits = get_rate_limits()
+    allowance = {}
+    batch = []
+    with transaction.atomic():
+        candidates = queues.get_claimable(
+            QueuedEmail.objects, QueuedEmail.PENDING, QueuedEmail.SENDING, STALE_AFTER
+        )[:size]
+        for email in candidates:
+            limit = limits.get(email.template)
+            if limit is not None:
+                if email.template not in allowance:
+                    recent = QueuedEmail.objects.filter(
+                        template=email.template,
+                        sent__gte=now - timedelta(seconds=RATE_LIMIT_WINDOW),
+                    ).count()
+                    allowance[email.template] = limit - recent
+                if allowance[email.template] <= 0:
+                    email.status = QueuedEmail.PENDING
+                    email.nextAttempt = now + timedelta(
+                        seconds=RATE_LIMIT_WINDOW / limit
+                    )
+                    email.save(update_fields=["status", "nextAttempt", "updated"])
+                    continue
+                allowance[email.template] -= 1
+            email.status = QueuedEmail.SENDING
+            email.attempts += 1
+            email.save(update_fields=["status", "attempts", "updated"])
+            batch.append(email)
+    return batch
+
+
+def send_batch(batch):
+    """Sends claimed emails over a single connection to the mail server."""
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.exception("Unable to connect to the mail server")
+        for email in batch:
+            failed(email, e)
+        return
+
+    try:
+        for email in batch:
+            mail_message = build_message(
+                email.replyTo,
+                email.to,
+                email.subject,
+                email.text,
+                email.html,
+                bcc=email.bcc,
+                connection=connection,
+            )
+            start = time.monotonic()
+            try:
+                mail_message.send()
+            except Exception as e:
+                logger.exception(f"Unable to send email {email.pk}")
+                failed(email, e)
+                continue
+            EMAIL_SEND_SECONDS.labels(email.template).observe(time.monotonic() - start)
+            email.status = QueuedEmail.SENT
+            email.sent = timezone.now()
+            email.error = ""
+            email.save(update_fields=["status", "sent", "error", "updated"])
+            EMAIL_QUEUE_SECONDS.labels(email.template).observe(
+                (email.sent - email.created).total_seconds()
+            )
+            EMAIL_RESULTS.labels(email.template, email.status).inc()
+    finally:
+        connection.close()
+
+
+def failed(email, error):
+    email.error = str(error)
+    next_attempt = queues.get_next_attempt(email.attempts, MAX_ATTEMPTS, RETRY_DELAY)
+    if next_attempt is None:
+        email.status = QueuedEmail.FAILED
+    else:
+        email.status = QueuedEmail.PENDING
+        email.nextAttempt = next_attempt
+    email.save(update_fields=["status", "error", "nextAttempt", "updated"])
+    EMAIL_RESULTS.labels(email.template, email.status).inc()
+
+
+def run_batch(size=BATCH_SIZE):
+    """Claims and sends up to size due emails, returning how many there were."""
+    batch = claim_batch(size)
+    if batch:
+        send_batch(batch)
+    return len(batch)
+
+
+def run_pending(limit=None):
+    """Sends due emails in batches until none are left, returning the count."""
+    return queues.run_until_empty(run_batch, BATCH_SIZE, limit)
@@ -1,25 +1,76 @@
 import logging
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from typing import Any, List, Optional
 
+import requests
 from django.conf import settings
 from prometheus_client import Histogram
+from requests.adapters import HTTPAdapter
 from square.client import Client
 
 from . import emails
+from .events import get_default_event
 from .models import *
 
-SQUARE_REQUESTS = Histogram("square_requests", "HTTP requests to Square API", ["endpoint"])
+SQUARE_REQUESTS = Histogram(
+    "square_requests", "HTTP requests to Square API", ["endpoint"]
+)
 
-client = Client(
-    timeout=10,
-    max_retries=5,
-    retry_methods=["GET", "POST"],
-    access_token=settings.SQUARE_ACCESS_TOKEN,
-    environment=settings.SQUARE_ENVIRONMENT,
+# Refunds fetched at once (across all requests) by refresh_payment, and the
+# seconds to wait for all of an order's refunds.  Each request also has the
+# client's own timeout.
+SQUARE_WORKERS = getattr(settings, "SQUARE_WORKERS", 4)
+SQUARE_REFUND_TIMEOUT = getattr(settings, "SQUARE_REFUND_TIMEOUT", 30)
+SQUARE_DEVICES_TIMEOUT = getattr(settings, "SQUARE_DEVICES_TIMEOUT", 30)
+
+
+def get_http_session():
+    """A session whose keep-alive pool is shared by every Square API call."""
+    session = requests.Session()
+    pool_size = max(10, SQUARE_WORKERS * 2)
+    session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+    session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+    return session
+
+
+def build_client():
+    return Client(
+        http_client_instance=get_http_session(),
+        override_http_client_configuration=True,
+        timeout=10,
+        max_retries=5,
+        retry_methods=["GET", "POST"],
+        access_token=settings.SQUARE_ACCESS_TOKEN,
+        environment=settings.SQUARE_ENVIRONMENT,
+    )
+
+
+client = build_client()
+
+# Runs concurrent Square lookups; the pool is shared so a burst of requests
+# can't start more than SQUARE_WORKERS threads between them.
+square_pool = ThreadPoolExecutor(
+    max_workers=SQUARE_WORKERS, thread_name_prefix="square"
 )
 
+_thread_clients = threading.local()
+
+
+def get_thread_client():
+    """
+    A Square client for the current pool thread.  The SDK changes its
+    session's adapters on every request, so threads can't share a client.
+    """
+    thread_client = getattr(_thread_clients, "client", None)
+    if thread_client is None:
+        thread_client = _thread_clients.client = build_client()
+    return thread_client
+
+
 devices_api = client.devices
 orders_api = client.orders
 payments_api = client.payments
@@ -150,10 +201,6 @@ def refresh_payment(order, store_api_data=None):
     else:
         return False, format_errors(payments_response.errors)
 
-    # FIXME: Payments API call includes references to any refunds associated with that payment in `refund_ids`
-    # We should use that here instead.
-    refunds = []
-    refund_errors = []
     refunded_money = payment.get("refunded_money")
 
     if refunded_money:
@@ -168,21 +215,13 @@ def refresh_payment(order, store_api_data=None):
         ]
         refund_ids.extend(stored_refund_ids)
 
-    for refund_id in refund_ids:
-        with SQUARE_REQUESTS.labels(endpoint="get_payment_refund").time():
-            refunds_response = refunds_api.get_payment_refund(refund_id)
-
-        if refunds_response.is_success():
-            refund = refunds_response.body.get("refund")
-            if refund:
-                refunds.append(refund)
-                status = refund.get("status")
-                if status == "COMPLETED":
-                    order.status = Order.REFUNDED
-                elif status == "PENDING":
-                    order.status = Order.REFUND_PENDING
-        else:
-            refund_errors.append(format_errors(payments_response.errors))
+    refunds, refund_errors = get_refunds(refund_ids)
+    for refund in refunds:
+        status = refund.get("status")
+        if status == "COMPLETED":
+            order.status = Order.REFUNDED
+        elif status == "PENDING":
+            order.status = Order.REFUND_PENDING
 
     api_data["refunds"] = refunds
 
@@ -205,6 +244,47 @@ def refresh_payment(order, store_api_data=None):
     return True, None
 
 
+def get_refund(refund_id):
+    """Fetches a refund; runs on square_pool, with that thread's client."""
+    with SQUARE_REQUESTS.labels(endpoint="get_payment_refund").time():
+        return get_thread_client().refunds.get_payment_refund(refund_id)
+
+
+def get_refunds(refund_ids):
+    """
+    Fetches refunds from Square concurrently, returning the refunds (in
+    refund_ids order) and a list of errors.
+    """
+    if not refund_ids:
+        return [], []
+    futures = [square_pool.submit(get_refund, refund_id) for refund_id in refund_ids]
+    done, not_done = wait(futures, timeout=SQUARE_REFUND_TIMEOUT)
+    # Lookups already running finish within the client's own timeout.
+    for future in not_done:
+        future.cancel()
+
+    refunds = []
+    errors = []
+    for refund_id, future in zip(refund_ids, futures):
+        if future not in done:
+            logger.warning(f"Timed out fetching refund {refund_id}")
+            errors.append(f"Timed out fetching refund {refund_id}")
+            continue
+        try:
+            refunds_response = future.result()
+        except Exception as e:
+            logger.exception(f"Unable to fetch refund {refund_id}")
+            errors.append(str(e))
+            continue
+        if refunds_response.is_success():
+            refund = refunds_response.body.get("refund")
+            if refund:
+                refunds.append(refund)
+        else:
+            errors.append(format_errors(refunds_response.errors))
+    return refunds, errors
+
+
 def update_order_payment_data(order, order_total, payment):
     try:
         order.lastFour = payment["card_details"]["card"]["last_4"]
@@ -230,7 +310,7 @@ def process_webhook_refund_updated(notification):
     # Find matching order, if any:
     payment_id = notification.body["data"]["object"]["payment_id"]
     try:
-        order = Order.objets.get(apiData__payment__id=payment_id)
+        order = Order.objects.get(squarePaymentId=payment_id)
     except Order.DoesNotExist:
         logger.warning(
             f"Got webhook for refund.update on payment.id = {payment_id}, but found no corresponding payment."
@@ -343,7 +423,7 @@ def process_webhook_refund_update(notification) -> bool:
     # Find matching order based on refund ID:
     refund_id = notification.body["data"]["id"]
     try:
-        order = Order.objects.get(apiData__refunds__contains=[{"id": refund_id}])
+        order = Order.objects.get(squareRefundIds__contains=[refund_id])
     except Order.DoesNotExist:
         logger.warning(
             f"Got refund.updated webhook update for a refund id not found: {refund_id}"
@@ -371,7 +451,7 @@ def process_webhook_refund_update(notification) -> bool:
 def process_webhook_payment_updated(notification: PaymentWebhookNotification) -> bool:
     payment_id = notification.body["data"]["id"]
     try:
-        order = Order.objects.get(apiData__payment__id=payment_id)
+        order = Order.objects.get(squarePaymentId=payment_id)
     except Order.DoesNotExist:
         logger.warning(
             f"Got payment.updated webhook update for a payment id not found: {payment_id}"
@@ -392,7 +472,7 @@ def process_webhook_refund_created(notification: PaymentWebhookNotification) ->
     webhook_refund = notification.body["data"]["object"]["refund"]
     payment_id = webhook_refund["payment_id"]
     try:
-        order = Order.objects.get(apiData__payment__id=payment_id)
+        order = Order.objects.get(squarePaymentId=payment_id)
     except Order.DoesNotExist:
         logger.warning(
             f"Got refund.created webhook update for a payment id not found: {payment_id}"
@@ -400,8 +480,7 @@ def process_webhook_refund_created(notification: PaymentWebhookNotification) ->
         return False
 
     # Skip processing if we already have this refund id stored:
-    refund_exists = Order.objects.filter(apiData__refunds__contains=[{"id": refund_id}])
-    if len(refund_exists) > 0:
+    if Order.objects.filter(squareRefundIds__contains=[refund_id]).exists():
         logger.info(f"Refund {refund_id} already exists, skipping processing...")
         return True
 
@@ -439,7 +518,7 @@ def process_webhook_dispute_created_or_updated(
     webhook_dispute = notification.body["data"]["object"]["dispute"]
     payment_id = webhook_dispute["disputed_payment"]["payment_id"]
     try:
-        order = Order.objects.get(apiData__payment__id=payment_id)
+        order = Order.objects.get(squarePaymentId=payment_id)
     except Order.DoesNotExist:
         logger.warning(
             f"Got dispute.created webhook update for a payment id not found: {payment_id}"
@@ -500,68 +579,80 @@ def create_square_order(terminal_name: str, data: dict) -> Optional[str]:
             uid = f"discount-{badge['id']}"
 
             if discount["percent_off"] > 0:
-                discounts.append({
-                    "uid": uid,
-                    "name": f"Discount {discount['name']}",
-                    "type": "FIXED_PERCENTAGE",
-                    "scope": "LINE_ITEM",
-                    "percentage": str(discount["percent_off"]),
-                })
+                discounts.append(
+                    {
+                        "uid": uid,
+                        "name": f"Discount {discount['name']}",
+                        "type": "FIXED_PERCENTAGE",
+                        "scope": "LINE_ITEM",
+                        "percentage": str(discount["percent_off"]),
+                    }
+                )
             elif discount["amount_off"] > 0:
-                discounts.append({
-                    "uid": uid,
-                    "name": f"Discount {discount['name']}",
-                    "type": "FIXED_AMOUNT",
-                    "scope": "LINE_ITEM",
-                    "amount_money": {
-                        "amount": int(discount["amount_off"] * 100),
-                        "currency": settings.SQUARE_CURRENCY,
-                    },
-                })
-
-            badge_applied_discounts.append({
-                "discount_uid": uid,
-            })
-
-        line_items.append({
-            "uid": f"badge-{badge['id']}",
-            "name": f"{badge['effectiveLevel']['name']} Badge",
-            "note": f"Badge Name - {badge['badgeName']}",
-            "quantity": "1",
-            "item_type": "ITEM",
-            "base_price_money": {
-                "amount": int(badge['level_subtotal'] * 100),
-                "currency": settings.SQUARE_CURRENCY,
-            },
-            "applied_discounts": badge_applied_discounts,
-        })
-
-    if data["charityDonation"] > 0 or data["orgDonation"] > 0:
-        event = Event.objects.get(default=True)
+                discounts.append(
+                    {
+                        "uid": uid,
+                        "name": f"Discount {discount['name']}",
+                        "type": "FIXED_AMOUNT",
+                        "scope": "LINE_ITEM",
+                        "amount_money": {
+                            "amount": int(discount["amount_off"] * 100),
+                            "currency": settings.SQUARE_CURRENCY,
+                        },
+                    }
+                )
+
+            badge_applied_discounts.append(
+                {
+                    "discount_uid": uid,
+                }
+            )
 
-        if data["charityDonation"] > 0:
-            line_items.append({
-                "uid": "donation-charity",
-                "name": f"Donation to {{ event.charity }}",
+        line_items.append(
+            {
+                "uid": f"badge-{badge['id']}",
+                "name": f"{badge['effectiveLevel']['name']} Badge",
+                "note": f"Badge Name - {badge['badgeName']}",
                 "quantity": "1",
                 "item_type": "ITEM",
                 "base_price_money": {
-                    "amount": int(data["charityDonation"] * 100),
+                    "amount": int(badge["level_subtotal"] * 100),
                     "currency": settings.SQUARE_CURRENCY,
+                },
+                "applied_discounts": badge_applied_discounts,
+            }
+        )
+
+    if data["charityDonation"] > 0 or data["orgDonation"] > 0:
+        event = get_default_event()
+
+        if data["charityDonation"] > 0:
+            line_items.append(
+                {
+                    "uid": "donation-charity",
+                    "name": f"Donation to {{ event.charity }}",
+                    "quantity": "1",
+                    "item_type": "ITEM",
+                    "base_price_money": {
+                        "amount": int(data["charityDonation"] * 100),
+                        "currency": settings.SQUARE_CURRENCY,
+                    },
                 }
-            })
+            )
 
         if data["orgDonation"] > 0:
-            line_items.append({
-                "uid": "donation-organization",
-                "name": f"Donation to {{ event }}",
-                "quantity": "1",
-                "item_type": "ITEM",
-                "base_price_money": {
-                    "amount": int(data["orgDonation"] * 100),
-                    "currency": settings.SQUARE_CURRENCY,
+            line_items.append(
+                {
+                    "uid": "donation-organization",
+                    "name": f"Donation to {{ event }}",
+                    "quantity": "1",
+                    "item_type": "ITEM",
+                    "base_price_money": {
+                        "amount": int(data["orgDonation"] * 100),
+                        "currency": settings.SQUARE_CURRENCY,
+                    },
                 }
-            })
+            )
 
     order_data = {
         "order": {
@@ -572,7 +663,7 @@ def create_square_order(terminal_name: str, data: dict) -> Optional[str]:
             },
             "discounts": discounts,
             "line_items": line_items,
-            "note": f"Reference: {data['reference']}"
+            "note": f"Reference: {data['reference']}",
         }
     }
 
@@ -586,7 +677,9 @@ def create_square_order(terminal_name: str, data: dict) -> Optional[str]:
         return None
 
 
-def print_payment_receipt(request, square_device: SquareDevice, payment_id: str) -> bool:
+def print_payment_receipt(
+    request, square_device: SquareDevice, payment_id: str
+) -> bool:
     data = {
         "idempotency_key": get_idempotency_key(request),
         "action": {
@@ -611,24 +704,34 @@ def print_payment_receipt(request, square_device: SquareDevice, payment_id: str)
 def get_terminals() -> List[dict]:
     terminals = []
 
+    # Each request has the client's timeout; this bounds the whole listing.
+    deadline = time.monotonic() + SQUARE_DEVICES_TIMEOUT
     cursor = None
     while True:
-        result = devices_api.list_devices(cursor=cursor)
+        with SQUARE_REQUESTS.labels(endpoint="list_devices").time():
+            result = devices_api.list_devices(cursor=cursor)
         if result.is_error():
             raise Exception("Unable to get Square devices")
 
-        for device in result.body["devices"]:
-            terminals.append(device)
+        terminals.extend(result.body.get("devices", []))
 
-        if "cursor" in result.body:
-            cursor = result.body["cursor"]
-        else:
+        cursor = result.body.get("cursor")
+        if not cursor:
             break
+        if time.monotonic() > deadline:
+            raise Exception("Timed out listing Square devices")
 
     return terminals
 
 
-def prompt_terminal_payment(request, device_id: str, total: int, reference: str, note: str, order_id: Optional[str]) -> Any:
+def prompt_terminal_payment(
+    request,
+    device_id: str,
+    total: int,
+    reference: str,
+    note: str,
+    order_id: Optional[str],
+) -> Any:
     data = {
         "idempotency_key": get_idempotency_key(request),
         "checkout": {
@@ -640,7 +743,7 @@ def prompt_terminal_payment(request, device_id: str, total: int, reference: str,
             "device_options": {
                 "device_id": device_id,
             },
-        }
+        },
     }
 
     if order_id:
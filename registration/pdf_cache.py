@@ -0,0 +1,135 @@
+"""
+Content-addressed cache of rendered badge PDFs.
+
+Reprints are common (lost badges, printer jams), so rendered PDFs are kept
+under a hash of everything that goes into them: the template and its
+version, and the values filled in for each badge.  Files live in
+PDF_DIRECTORY as badge-<hash>.pdf so pdfFromDisk serves them like any other
+print, and are pruned by idle time (PDF_CACHE_TTL) and total size
+(PDF_CACHE_MAX_BYTES).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_LOOKUPS = Counter(
+    "badge_pdf_cache_lookups", "Badge PDF cache lookups", ["result"]
+)
+
+PREFIX = "badge-"
+
+
+def get_directory():
+    return Path(getattr(settings, "PDF_DIRECTORY", "/tmp"))
+
+
+def get_key(template, version, tags):
+    """
+    Hash of a render.  tags are the per-badge values handed to the template,
+    so anything that changes the output (name, number, level, age) changes
+    the key.  Templates that print the current date or time aren't cached.
+    """
+    payload = json.dumps(
+        {"template": template, "version": version, "tags": tags},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_path(key):
+    return get_directory() / f"{PREFIX}{key}.pdf"
+
+
+def is_cached_name(name):
+    return name.startswith(PREFIX) and name.endswith(".pdf")
+
+
+def lookup(key):
+    """Returns the path of a cached PDF, or None."""
+    path = get_path(key)
+    ttl = getattr(settings, "PDF_CACHE_TTL", 60 * 60 * 24)
+    try:
+        if time.time() - path.stat().st_mtime > ttl:
+            path.unlink()
+            raise FileNotFoundError(path)
+        # Hits keep an entry alive; pruning goes by least recently used.
+        os.utime(path)
+    except FileNotFoundError:
+        PDF_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+    PDF_CACHE_LOOKUPS.labels("hit").inc()
+    return path
+
+
+def store_file(key, source):
+    """Moves a freshly rendered PDF into the cache, returning its new path."""
+    path = get_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(str(source), str(path))
+    prune()
+    return path
+
+
+def store_uncached(source):
+    """Moves a render that can't be reused into PDF_DIRECTORY, returning its path."""
+    directory = get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / Path(source).name
+    if path != Path(source):
+        shutil.move(str(source), str(path))
+    return path
+
+
+def store(key, content):
+    """Writes PDF bytes into the cache, returning the path."""
+    directory = get_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Write alongside and rename so readers never see a partial file.
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix=PREFIX, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    path = get_path(key)
+    os.replace(tmpname, path)
+    prune()
+    return path
+
+
+def prune():
+    """Drops expired entries, then the least recently used until under size."""
+    ttl = getattr(settings, "PDF_CACHE_TTL", 60 * 60 * 24)
+    max_bytes = getattr(settings, "PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+    now = time.time()
+
+    entries = []
+    for path in get_directory().glob(f"{PREFIX}*.pdf"):
+        try:
+            stat = path.stat()
+            if now - stat.st_mtime > ttl:
+                path.unlink()
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            pass
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        logger.debug("Evicted %s from badge PDF cache", path.name)
@@ -0,0 +1,233 @@
+"""
+Price calculation shared by the cart, checkout, staff, dealer, upgrade and
+onsite flows.
+
+A PriceCatalog holds every price level and option referenced by a set of
+cart or order items, loaded in bulk, so a CartPricing can work out line
+totals, discounts and the minimum org donation without a query per line.
+"""
+
+import json
+from decimal import Decimal
+
+from django.db.models import prefetch_related_objects
+
+from registration.models import (
+    Badge,
+    Discount,
+    Order,
+    OrderItem,
+    PriceLevel,
+    PriceLevelOption,
+)
+
+
+def get_discount(disc):
+    """Resolve a discount code (or Discount) to a Discount, or None."""
+    if not disc:
+        return None
+    if isinstance(disc, Discount):
+        return disc
+    return Discount.objects.filter(codeName=disc).first()
+
+
+def discount_total(discount, subtotal):
+    """Amount a valid discount takes off a line with the given subtotal."""
+    if discount is None or not discount.isValid():
+        return 0
+    if discount.amountOff:
+        return discount.amountOff
+    elif discount.percentOff:
+        return Decimal(float(subtotal) * float(discount.percentOff) / 100)
+    return 0
+
+
+def option_price(option, value):
+    """Price of one PriceLevelOption chosen with the given value."""
+    if option.optionExtraType == "int":
+        if value:
+            return option.optionPrice * Decimal(value)
+        return 0
+    return option.optionPrice
+
+
+def get_effective_levels(badge_ids):
+    """
+    Badge.effectiveLevel() for several badges at once, keyed by badge id.
+    Badges without a placed order are left out.
+    """
+    levels = {}
+    order_items = OrderItem.objects.filter(
+        badge_id__in=badge_ids, order__isnull=False
+    ).select_related("order", "priceLevel")
+    for oi in order_items:
+        level = levels.get(oi.badge_id)
+        if level == Badge.UNPAID:
+            continue
+        if oi.order.billingType == Order.UNPAID:
+            levels[oi.badge_id] = Badge.UNPAID
+        elif not level or (oi.priceLevel and oi.priceLevel.basePrice > level.basePrice):
+            levels[oi.badge_id] = oi.priceLevel
+    return levels
+
+
+class PriceCatalog(object):
+    """Price levels and options, keyed by id."""
+
+    def __init__(self, levels=None, options=None):
+        self.levels = levels or {}
+        self.options = options or {}
+
+    @classmethod
+    def load(cls, level_ids=(), option_ids=()):
+        level_ids = {int(pk) for pk in level_ids}
+        option_ids = {int(pk) for pk in option_ids}
+        return cls(
+            PriceLevel.objects.in_bulk(level_ids) if level_ids else {},
+            PriceLevelOption.objects.in_bulk(option_ids) if option_ids else {},
+        )
+
+    @classmethod
+    def for_cart_data(cls, cart_data):
+        """Catalog covering the price levels in parsed Cart.formData dicts."""
+        level_ids = set()
+        option_ids = set()
+        for data in cart_data:
+            level_ids.add(data["priceLevel"]["id"])
+            option_ids.update(o["id"] for o in data["priceLevel"]["options"])
+        return cls.load(level_ids, option_ids)
+
+    def level(self, pk):
+        try:
+            return self.levels[int(pk)]
+        except KeyError:
+            raise PriceLevel.DoesNotExist(f"PriceLevel {pk} does not exist")
+
+    def option(self, pk):
+        try:
+            return self.options[int(pk)]
+        except KeyError:
+            raise PriceLevelOption.DoesNotExist(f"PriceLevelOption {pk} does not exist")
+
+
+class LineItem(object):
+    """
+    Pricing for one cart or order item.  For order items, credit is the
+    badge's effective level (what has already been paid for).
+    """
+
+    def __init__(self, item, priceLevel, options, credit=None):
+        self.item = item
+        self.priceLevel = priceLevel
+        self.options = options
+        self.credit = credit if isinstance(credit, PriceLevel) else None
+        self.discount = 0
+
+    @classmethod
+    def for_cart(cls, cart, data, catalog):
+        pdp = data["priceLevel"]
+        options = [
+            (catalog.option(option["id"]), option["value"]) for option in pdp["options"]
+        ]
+        return cls(cart, catalog.level(pdp["id"]), options)
+
+    @classmethod
+    def for_order_item(cls, item, attendee_options, credit=None):
+        options = [(ao.option, ao.optionValue) for ao in attendee_options]
+        return cls(item, item.priceLevel, options, credit)
+
+    @property
+    def option_total(self):
+        return sum(option_price(option, value) for option, value in self.options)
+
+    @property
+    def subtotal(self):
+        """Level price plus options, less the effective level's price."""
+        total = self.priceLevel.basePrice if self.priceLevel else 0
+        if self.credit:
+            total -= self.credit.basePrice
+        return total + self.option_total
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount
+
+    @property
+    def minimumOrgDonation(self):
+        # For order items the minimum comes from the level already held.
+        level = self.credit if isinstance(self.item, OrderItem) else self.priceLevel
+        return level.minimumOrgDonation if level else 0
+
+    def option_lines(self):
+        """Option name/number/total dicts, as rendered by the checkout page."""
+        lines = []
+        for option, value in self.options:
+            line = {}
+            if option.optionExtraType == "int":
+                if value:
+                    line = {
+                        "name": option.optionName,
+                        "number": value,
+                        "total": option_price(option, value),
+                    }
+            else:
+                line = {"name": option.optionName, "total": option.optionPrice}
+            lines.append(line)
+        return lines
+
+
+def get_order_item_lines(orderItems, credits=None):
+    """
+    LineItems for order items, with their levels and options loaded in bulk.
+    credits maps badge ids to the effective level to deduct, if any.
+    """
+    orderItems = list(orderItems)
+    credits = credits or {}
+    prefetch_related_objects(orderItems, "priceLevel", "attendeeoptions_set__option")
+    return [
+        LineItem.for_order_item(
+            item, item.attendeeoptions_set.all(), credits.get(item.badge_id)
+        )
+        for item in orderItems
+    ]
+
+
+class CartPricing(object):
+    """
+    Totals for a set of cart items and/or order items with a single discount.
+    Everything is loaded in a fixed number of queries on construction.
+    """
+
+    def __init__(self, cartItems=(), orderItems=(), discount=None, catalog=None):
+        self.discount = get_discount(discount)
+        self.lines = []
+
+        cart_data = [json.loads(cart.formData) for cart in cartItems]
+        if cart_data and catalog is None:
+            catalog = PriceCatalog.for_cart_data(cart_data)
+        for cart, data in zip(cartItems, cart_data):
+            self.lines.append(LineItem.for_cart(cart, data, catalog))
+
+        if orderItems:
+            credits = get_effective_levels({item.badge_id for item in orderItems})
+            self.lines.extend(get_order_item_lines(orderItems, credits))
+
+        if self.discount:
+            for line in self.lines:
+                line.discount = discount_total(self.discount, line.subtotal)
+
+    @property
+    def total(self):
+        return sum(line.total for line in self.lines if line.total > 0)
+
+    @property
+    def total_discount(self):
+        return sum(line.discount for line in self.lines)
+
+    @property
+    def minimum_org_donation(self):
+        if self.discount and self.discount.waiveRequiredDonation:
+            return 0.00
+        return max(
+            [line.minimumOrgDonation or 0.00 for line in self.lines], default=0.00
+        )
@@ -0,0 +1,210 @@
+"""
+Badge print jobs.
+
+Requests queue a PrintJob and return straight away; the print_worker
+command renders the PDF, sends it to the terminal's printer and reports
+back over MQTT.  Badges are only marked printed once the printer has
+accepted the job, so a failed attempt can be retried without counting twice.  Jobs are claimed with SELECT ... SKIP LOCKED so any number
+of workers can share the queue, and failed jobs are retried with backoff.
+"""
+
+import logging
+from pathlib import Path
+from urllib.parse import urlencode, urljoin
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from registration import mqtt, queues
+from registration.models import Badge, PrintJob
+
+logger = logging.getLogger(__name__)
+
+PRINT_JOB_SECONDS = Histogram(
+    "print_job_seconds", "Time from queueing a print job to finishing it"
+)
+PRINT_JOB_RESULTS = Counter("print_job_results", "Finished print job runs", ["status"])
+
+# Attempts before a job is marked failed, and the delay before the first
+# retry, which doubles each time.
+MAX_ATTEMPTS = getattr(settings, "PRINT_JOB_ATTEMPTS", 3)
+RETRY_DELAY = getattr(settings, "PRINT_JOB_RETRY_DELAY", 10)
+
+# Running jobs not updated for this long belong to a worker that died.
+STALE_AFTER = getattr(settings, "PRINT_JOB_TIMEOUT", 600)
+
+PRINTER_TIMEOUT = 30
+
+
+def use_print_jobs():
+    return getattr(settings, "PRINT_JOBS", False)
+
+
+def enqueue(badges, terminal=None, request=None):
+    """Queues badges (a queryset or list of ids) for printing."""
+    job = PrintJob(terminal=terminal)
+    if request is not None:
+        job.baseUrl = request.build_absolute_uri("/")
+        if request.user.is_authenticated:
+            job.user = request.user
+    job.save()
+    job.badges.set(badges)
+    return job
+
+
+def get_job_url(job):
+    if not job.file:
+        return None
+    url = reverse("registration:pdf") + "?" + urlencode({"file": job.file})
+    if job.baseUrl:
+        return urljoin(job.baseUrl, url)
+    return url
+
+
+def get_job_status(job):
+    return {
+        "id": job.pk,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error or None,
+        "file": get_job_url(job),
+    }
+
+
+def claim_job():
+    """Marks the next runnable job as running and returns it, or None."""
+    with transaction.atomic():
+        job = queues.get_claimable(
+            PrintJob.objects, PrintJob.PENDING, PrintJob.RUNNING, STALE_AFTER
+        ).first()
+        if job is None:
+            return None
+        job.status = PrintJob.RUNNING
+        job.attempts += 1
+        job.save(update_fields=["status", "attempts", "updated"])
+    return job
+
+
+def render(job):
+    """Renders the job's badges, returning the PDF's path in PDF_DIRECTORY."""
+    queryset = Badge.objects.filter(printjob=job).order_by("pk")
+    if getattr(settings, "PRINT_RENDERER", "wkhtmltopdf") == "gotenberg":
+        from registration.views.printing import generate_gotenberg_labels
+
+        path = generate_gotenberg_labels(queryset, mark_printed=False)
+    else:
+        from registration.admin import generate_badge_labels
+
+        name = generate_badge_labels(queryset, mark_printed=False)
+        path = None if name is None else pdf_path(name)
+    if path is None:
+        raise PrintJobError("None of the selected badges can be printed.")
+    return Path(path)
+
+
+def pdf_path(name):
+    return Path(getattr(settings, "PDF_DIRECTORY", "/tmp")) / name
+
+
+def dispatch(job):
+    """
+    Sends the finished PDF to the printer for the job's terminal: an HTTP
+    printer_url if one is configured, otherwise the print_via_mqtt terminal.
+    Terminals with neither print the file themselves when notified.
+    """
+    terminal = job.terminal
+    if terminal is None:
+        return
+    printer = terminal.print_via_mqtt or terminal
+    if printer.printer_url:
+        with open(pdf_path(job.file), "rb") as f:
+            response = requests.post(
+                printer.printer_url,
+                data=f,
+                headers={"Content-Type": "application/pdf"},
+                timeout=PRINTER_TIMEOUT,
+            )
+        response.raise_for_status()
+    elif terminal.print_via_mqtt:
+        topic = f"{mqtt.get_topic('admin', printer.name)}/action"
+        if not mqtt.send_mqtt_message(
+            topic, {"action": "print", "url": get_job_url(job)}
+        ):
+            raise PrintJobError(f"Unable to send the job to {printer.name}")
+
+
+def mark_printed(job):
+    """Marks the job's badges printed, skipping those render() left out."""
+    printed_ids = list(
+        Badge.objects.filter(printjob=job)
+        .with_status()
+        .exclude(effective_level_name__isnull=True)
+        .exclude(effective_level_name__in=("", Badge.UNPAID))
+        .values_list("pk", flat=True)
+    )
+    Badge.objects.filter(pk__in=printed_ids).update(
+        printed=True, printCount=F("printCount") + 1
+    )
+
+
+def notify(job):
+    if job.terminal is None:
+        return
+    topic = f"{mqtt.get_topic('admin', job.terminal.name)}/print_job"
+    mqtt.send_mqtt_message(topic, get_job_status(job))
+
+
+def run_job(job):
+    try:
+        job.file = render(job).name
+        dispatch(job)
+        mark_printed(job)
+    except Exception as e:
+        logger.exception(f"{job} failed")
+        job.error = str(e)
+        next_attempt = queues.get_next_attempt(job.attempts, MAX_ATTEMPTS, RETRY_DELAY)
+        if next_attempt is None:
+            job.status = PrintJob.FAILED
+        else:
+            job.status = PrintJob.PENDING
+            job.nextAttempt = next_attempt
+    else:
+        job.status = PrintJob.COMPLETE
+        job.error = ""
+    job.save()
+
+    PRINT_JOB_RESULTS.labels(job.status).inc()
+    if job.status != PrintJob.PENDING:
+        PRINT_JOB_SECONDS.observe((timezone.now() - job.created).total_seconds())
+        notify(job)
+        if job.status == PrintJob.COMPLETE and job.terminal is not None:
+            from registration.views.onsite_admin import push_cart_update
+
+            push_cart_update(job.terminal)
+    return job
+
+
+def run_batch(size=1):
+    """Claims and runs up to size jobs one at a time, returning the count."""
+    count = 0
+    for _ in range(size):
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def run_pending(limit=None):
+    """Runs queued jobs until there are none (or limit have run)."""
+    return queues.run_until_empty(run_batch, 1, limit)
+
+
+class PrintJobError(Exception):
+    pass
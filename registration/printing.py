@@ -8,8 +8,12 @@ import re
 import subprocess
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from configobj import ConfigObj
+from prometheus_client import Histogram
 
 PRINT_MODE = "pdf"
 
@@ -22,6 +26,76 @@ NAMETAGS = os.path.join(
     SCRIPT_PATH, "resources", "nametag"
 )  # path where html can be found.
 LPR = "/usr/bin/lpr"  # path to LPR program (CUPS/Unix only).
+RENDER_WORKERS = 2  # concurrent wkhtmltopdf processes per server process.
+
+BADGE_RENDER_SECONDS = Histogram(
+    "badge_render_seconds", "Time spent rendering each nametag", ["theme"]
+)
+
+# Parsed theme configs and compiled templates, keyed by path and
+# invalidated when the file's mtime changes.
+_config_cache = {}
+_template_cache = {}
+_arguments_cache = {}
+_cache_lock = threading.Lock()
+
+_render_pool = None
+_render_pool_pid = None
+
+# Placeholders filled in by Nametag.nametag().
+PLACEHOLDER_RE = re.compile(r"%(DATE|TIME|NAME|LEVEL|TITLE|NUMBER|AGE)%", re.IGNORECASE)
+
+
+def _cached(cache, path, load):
+    """Returns load(path), reusing the last result until path changes."""
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        hit = cache.get(path)
+        if hit is not None and hit[0] == mtime:
+            return hit[1]
+    value = load(path)
+    with _cache_lock:
+        cache[path] = (mtime, value)
+    return value
+
+
+def clear_caches():
+    with _cache_lock:
+        _config_cache.clear()
+        _template_cache.clear()
+        _arguments_cache.clear()
+
+
+def get_render_pool():
+    """Pool shared by every print request, bounding wkhtmltopdf processes."""
+    global _render_pool, _render_pool_pid
+    # Forked workers inherit the pool object but not its threads.
+    if _render_pool is None or _render_pool_pid != os.getpid():
+        with _cache_lock:
+            if _render_pool is None or _render_pool_pid != os.getpid():
+                _render_pool = ThreadPoolExecutor(
+                    max_workers=RENDER_WORKERS, thread_name_prefix="nametag-render"
+                )
+                _render_pool_pid = os.getpid()
+    return _render_pool
+
+
+class CompiledTemplate:
+    """A nametag template split once into literal text and placeholders."""
+
+    def __init__(self, html):
+        # Even indexes are literal text, odd indexes are placeholder names.
+        self.parts = PLACEHOLDER_RE.split(html)
+        for i in range(1, len(self.parts), 2):
+            self.parts[i] = self.parts[i].upper()
+        # Renders that print the current date or time can't be reused.
+        self.uses_clock = bool({"DATE", "TIME"} & set(self.parts[1::2]))
+
+    def render(self, values):
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        return "".join(parts)
 
 
 class Printer:
@@ -217,28 +291,6 @@ class Nametag:
         self.barcodeEnable = barcode
         self.log = logging.getLogger(__name__)
 
-        # Setup and compile regex replacements:
-        self.date_re = re.compile(r"%DATE%", re.IGNORECASE)  # date
-        self.time_re = re.compile(r"%TIME%", re.IGNORECASE)  # time
-        self.room_re = re.compile(r"%ROOM%", re.IGNORECASE)  # room
-        self.first_re = re.compile(r"%FIRST%", re.IGNORECASE)  # name
-        self.name_re = re.compile(r"%NAME%", re.IGNORECASE)  # name
-        self.last_re = re.compile(r"%LAST%", re.IGNORECASE)  # surname
-        self.medical_re = re.compile(r"%MEDICAL%", re.IGNORECASE)  # medical
-        self.code_re = re.compile(r"%CODE%", re.IGNORECASE)  # paging code
-        self.secure_re = re.compile(r"%S%", re.IGNORECASE)  # security code
-        self.title_re = re.compile(r"%TITLE%", re.IGNORECASE)  # security code
-        self.number_re = re.compile(r"%NUMBER%", re.IGNORECASE)  # security code
-        self.level_re = re.compile(r"%LEVEL%", re.IGNORECASE)  # security code
-        self.age_re = re.compile(r"%AGE%", re.IGNORECASE)  # age
-
-        self.medicalIcon_re = re.compile(
-            r"window\.onload\s=\shide\('medical'\)\;", re.IGNORECASE
-        )
-        self.volunteerIcon_re = re.compile(
-            r"window\.onload\s=\shide\('volunteer'\)\;", re.IGNORECASE
-        )
-
     def list_templates(self, directory=NAMETAGS):
         """Returns a list of the installed nametag themes"""
         # TODO: add more stringent validation against config and html.
@@ -290,6 +342,9 @@ class Nametag:
         dictionary.
         """
         inifile = self._get_template_file(theme)
+        return _cached(_config_cache, inifile, self._load_config)
+
+    def _load_config(self, inifile):
         self.log.info("Reading template configuration from '{0}'".format(inifile))
         config = ConfigObj(inifile)
         try:  # check for default section
@@ -317,7 +372,15 @@ class Nametag:
     ):
         # def nametag(self, template='default', room='', first='', last='', medical='',
         #            code='', secure='', barcode=True):
+        compiled = self.get_template(template, barcode)
+        if compiled is None:
+            return None
+        return self.render(
+            compiled, name=name, number=number, title=title, level=level, age=age
+        )
 
+    def get_template(self, template="apis", barcode=False):
+        """Returns the CompiledTemplate for a theme, falling back to default."""
         # Check that theme specified is valid:
         if template != "default":
             themes = self.list_templates()
@@ -333,41 +396,61 @@ class Nametag:
             )
             return None
 
-        # read in the HTML
-        self.log.debug("Generating nametag with nametag()")
-        self.log.debug("Reading {0}...".format(os.path.join(directory, "default.html")))
-        f = open(os.path.join(directory, "default.html"))
-        html = f.read()
-        f.close()
-
-        if len(html) == 0:  # template file is empty: use default instead.
-            self.log.warn(
-                "HTML template file {0} is blank.".format(
-                    os.path.join(directory, "default.html")
-                )
-            )
-
         # generate barcode of secure code, code128:
         if barcode:
             raise NotImplementedError()
-        # replace barcode image with white.gif
-        html = html.replace("default-secure.png", "white.gif")
-        self.log.debug("Disabled barcode.")
 
+        return self.compile_template(os.path.join(directory, "default.html"))
+
+    def template_version(self, template):
+        """Changes whenever a theme's .conf or HTML is modified."""
+        paths = [
+            self._get_template_file(template),
+            os.path.join(self._get_template_path(template), "default.html"),
+        ]
+        return "-".join(str(os.stat(path).st_mtime_ns) for path in paths)
+
+    def uses_clock(self, template):
+        """Whether a theme prints the current %DATE% or %TIME%."""
+        compiled = self.get_template(template)
+        return compiled is not None and compiled.uses_clock
+
+    def render(self, compiled, name="", number="", title="", level="", age=""):
+        self.log.debug("Generating nametag with nametag()")
         # get the current date/time
         now = datetime.datetime.now()
 
         # Perform substitutions:
-        html = self.date_re.sub(now.strftime("%a %d %b, %Y"), html)
-        html = self.time_re.sub(now.strftime("%H:%M:%S"), html)
         # Fix for if database returns None instead of empty string:
-        html = self.name_re.sub(name, html)
-        html = self.level_re.sub(str(level), html)
-        html = self.title_re.sub(str(title), html)
-        html = self.number_re.sub(str(number), html)
-        html = self.age_re.sub(str(age), html)
+        return compiled.render(
+            {
+                "DATE": now.strftime("%a %d %b, %Y"),
+                "TIME": now.strftime("%H:%M:%S"),
+                "NAME": name,
+                "LEVEL": str(level),
+                "TITLE": str(title),
+                "NUMBER": str(number),
+                "AGE": str(age),
+            }
+        )
+
+    def compile_template(self, path):
+        """Returns the CompiledTemplate for an HTML file, cached until it changes."""
+        return _cached(_template_cache, path, self._load_template)
+
+    def _load_template(self, path):
+        # read in the HTML
+        self.log.debug("Reading {0}...".format(path))
+        with open(path) as f:
+            html = f.read()
+
+        if len(html) == 0:  # template file is empty: use default instead.
+            self.log.warn("HTML template file {0} is blank.".format(path))
 
-        return html
+        # replace barcode image with white.gif
+        html = html.replace("default-secure.png", "white.gif")
+        self.log.debug("Disabled barcode.")
+        return CompiledTemplate(html)
 
 
 class _DummyPrinter:
@@ -493,51 +576,72 @@ class Main:
         # def nametag(self, theme='default', room='', first='', last='', medical='',
         #            code='', secure='', barcode=True, section='default'):
         """Note: section= not fully implemented in Nametag.nametag method"""
-        self.section = section
-        self.conf = self.tag.read_config(theme)  # theme
-        self.args = self.con.buildArguments(self.conf, section)  # section
-
-        stuff = self.tag.nametag(
-            name=name, number=number, title=title, template=theme, level=level
+        return self.nametags(
+            [{"name": name, "number": number, "title": title, "level": level}],
+            theme=theme,
+            section=section,
         )
-        temp_path = self.tag._get_template_path(theme)
-        html = tempfile.NamedTemporaryFile(delete=False, dir=temp_path, suffix=".html")
-        html.write(stuff.encode("utf-8"))
-        html.close()
-
-        self.pdf = self.con.writePdf(self.args, html.name)
-        os.unlink(html.name)
-        return self.pdf
 
     def nametags(self, tags, theme="apis", section="default"):
+        """
+        Renders every tag into a single pdf using the shared render pool.
+        Temporary HTML is always removed, even if wkhtmltopdf fails.
+        """
         self.section = section
         self.conf = self.tag.read_config(theme)  # theme
-        self.args = self.con.buildArguments(self.conf, section)  # section
+        self.args = self._arguments(theme, section)  # section
+        compiled = self.tag.get_template(theme)
+        temp_path = self.tag._get_template_path(theme)
 
+        start = time.monotonic()
         html_files = []
-        for data in tags:
-            stuff = self.tag.nametag(
-                name=data["name"],
-                number=data["number"],
-                title=data["title"],
-                template=theme,
-                level=data["level"],
-                age=data["age"],
-            )
-            temp_path = self.tag._get_template_path(theme)
-            html = tempfile.NamedTemporaryFile(
-                delete=False, dir=temp_path, suffix=".html"
+        try:
+            for data in tags:
+                stuff = self.tag.render(
+                    compiled,
+                    name=data["name"],
+                    number=data["number"],
+                    title=data["title"],
+                    level=data["level"],
+                    age=data.get("age", ""),
+                )
+                html = tempfile.NamedTemporaryFile(
+                    delete=False, dir=temp_path, suffix=".html"
+                )
+                html_files.append(html.name)
+                html.write(stuff.encode("utf-8"))
+                html.close()
+
+            pool = get_render_pool()
+            self.pdf = pool.submit(self.con.writePdf, self.args, html_files).result()
+        finally:
+            for tmpname in html_files:
+                try:
+                    os.unlink(tmpname)
+                except OSError as e:
+                    self.log.warning("Unable to remove {0}: {1}".format(tmpname, e))
+
+        if tags:
+            per_badge = (time.monotonic() - start) / len(tags)
+            for _ in tags:
+                BADGE_RENDER_SECONDS.labels(theme).observe(per_badge)
+            self.log.info(
+                "Rendered {0} nametags in {1:.3f}s each".format(len(tags), per_badge)
             )
-            html.write(stuff.encode("utf-8"))
-            html.close()
-            html_files.append(html.name)
-
-        self.pdf = self.con.writePdf(self.args, html_files)
-        for tmpname in html_files:
-            # os.unlink(tmpname)
-            pass
         return self.pdf
 
+    def _arguments(self, theme, section):
+        # buildArguments() only depends on the parsed config, which is reused
+        # until the .conf changes; writePdf() appends to the list it is given.
+        key = (theme, section)
+        with _cache_lock:
+            hit = _arguments_cache.get(key)
+        if hit is None or hit[0] is not self.conf:
+            hit = (self.conf, self.con.buildArguments(self.conf, section))
+            with _cache_lock:
+                _arguments_cache[key] = hit
+        return list(hit[1])
+
     def preview(self, filename=None):
         if filename is None:
             filename = self.pdf
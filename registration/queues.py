@@ -0,0 +1,52 @@
+"""
+Shared pieces of the database-backed work queues: print jobs, the email
+outbox and payment webhooks.  Each keeps its own model and handling; this
+is the claiming, retry backoff and polling they have in common.
+"""
+
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def get_claimable(queryset, pending, running, stale_after):
+    """
+    Rows of queryset that are pending and due, or still running after
+    stale_after seconds because their worker died, oldest due first.  They
+    are locked with SKIP LOCKED, so call this inside a transaction.
+    """
+    now = timezone.now()
+    return (
+        queryset.select_for_update(skip_locked=True)
+        .filter(
+            Q(status=pending, nextAttempt__lte=now)
+            | Q(status=running, updated__lt=now - timedelta(seconds=stale_after))
+        )
+        .order_by("nextAttempt", "pk")
+    )
+
+
+def get_next_attempt(attempts, max_attempts, retry_delay):
+    """
+    When to retry after a failed attempt, or None to give up.  The first
+    retry waits retry_delay seconds, and each after that twice as long.
+    """
+    if attempts >= max_attempts:
+        return None
+    return timezone.now() + timedelta(seconds=retry_delay * 2 ** (attempts - 1))
+
+
+def run_until_empty(run_batch, batch_size, limit=None):
+    """
+    Calls run_batch(size) until it does nothing or limit items have been
+    run, returning how many were.
+    """
+    count = 0
+    while limit is None or count < limit:
+        size = batch_size if limit is None else min(batch_size, limit - count)
+        ran = run_batch(size)
+        if not ran:
+            break
+        count += ran
+    return count
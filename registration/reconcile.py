@@ -0,0 +1,339 @@
+"""
+Bulk reconciliation of orders against Square.
+
+Pages through Square's payments and then refunds for a date range,
+matching each page to orders in one query (by payment id, falling back to
+the order reference) and updating order statuses with bulk_update.  Only
+a page is held at a time; discrepancies are written out as they are found.
+Matched orders are stamped with the run's start time, so orders Square has
+no payment for are found afterwards with one query.  Progress (the current
+phase and cursor) can be saved to a state file after every page so an
+interrupted run of the same range picks up where it left off.
+"""
+
+import csv
+import json
+import logging
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from registration import payments
+from registration.models import Order, load_api_data
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+REPORT_FIELDS = ["kind", "order", "reference", "payment", "refund", "detail"]
+
+# Statuses owned by refund and dispute processing, which a payment's own
+# status doesn't override.
+REFUND_STATUSES = (Order.REFUNDED, Order.REFUND_PENDING)
+DISPUTE_STATUSES = tuple(
+    status for status, _ in Order.STATUS_CHOICES if status.startswith("Dispute")
+)
+PAID_STATUSES = (Order.COMPLETED, Order.CAPTURED) + REFUND_STATUSES
+
+PAYMENT_STATUS_MAP = {
+    "COMPLETED": Order.COMPLETED,
+    "APPROVED": Order.CAPTURED,
+    "FAILED": Order.FAILED,
+    "CANCELED": Order.FAILED,
+}
+
+
+class ReconcileError(Exception):
+    pass
+
+
+class StateMismatch(ReconcileError):
+    pass
+
+
+def list_pages(method, endpoint, key, cursor=None, **kwargs):
+    """Yields (items, next cursor) for each page of a Square list call."""
+    while True:
+        with payments.SQUARE_REQUESTS.labels(endpoint=endpoint).time():
+            response = method(cursor=cursor, **kwargs)
+        if not response.is_success():
+            raise ReconcileError(payments.format_errors(response.errors))
+        cursor = response.body.get("cursor")
+        yield response.body.get(key, []), cursor
+        if not cursor:
+            return
+
+
+def get_payment_total(payment):
+    """Amount kept from a payment after refunds, in dollars."""
+    amount = payment.get("total_money", {}).get("amount", 0)
+    amount -= (payment.get("refunded_money") or {}).get("amount", 0)
+    return Decimal(amount).scaleb(-2)
+
+
+def stored_refund_changed(stored, refund):
+    """Whether a refund is missing from stored refunds or has a new status."""
+    for stored_refund in stored:
+        if stored_refund.get("id") == refund["id"]:
+            return stored_refund.get("status") != refund.get("status")
+    return True
+
+
+def match_reference(orders, payment_id):
+    """
+    The first of orders with a reference matching a payment, leaving out
+    any already paid with a different payment (such as an earlier attempt).
+    """
+    for order in orders:
+        if not order.squarePaymentId or order.squarePaymentId == payment_id:
+            return order
+    return None
+
+
+class Reconciliation:
+    def __init__(
+        self,
+        begin,
+        end,
+        report,
+        location_id=None,
+        state_path=None,
+        dry_run=False,
+        page_size=PAGE_SIZE,
+    ):
+        self.begin = begin
+        self.end = end
+        self.location_id = location_id or settings.SQUARE_LOCATION_ID
+        self.state_path = state_path
+        self.dry_run = dry_run
+        self.page_size = page_size
+        self.writer = csv.DictWriter(report, REPORT_FIELDS, lineterminator="\n")
+        self.counts = {}
+        self.state = {
+            "begin": begin.isoformat(),
+            "end": end.isoformat(),
+            "location": self.location_id,
+            "started": timezone.now().isoformat(),
+            "phase": "payments",
+            "cursor": None,
+        }
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                saved = json.load(f)
+            for key in ("begin", "end", "location"):
+                if saved.get(key) != self.state[key]:
+                    raise StateMismatch(
+                        f"{state_path} is for a different run ({key} "
+                        f"{saved.get(key)}, not {self.state[key]}); remove it "
+                        "to start over."
+                    )
+            self.state = saved
+        self.started = parse_datetime(self.state["started"])
+        # A dry run can't stamp orders, so it remembers the ones it matched.
+        self.matched = set()
+
+    def run(self):
+        if self.state["phase"] == "payments":
+            self.writer.writeheader()
+            self.reconcile_pages(
+                payments.payments_api.list_payments,
+                "list_payments",
+                "payments",
+                self.reconcile_payments,
+            )
+            self.save_state("refunds", None)
+        if self.state["phase"] == "refunds":
+            self.reconcile_pages(
+                payments.refunds_api.list_payment_refunds,
+                "list_payment_refunds",
+                "refunds",
+                self.reconcile_refunds,
+            )
+            self.save_state("missing", None)
+        if self.state["phase"] == "missing":
+            self.report_missing()
+        # Finished, so the next run starts from the beginning.
+        if self.state_path and not self.dry_run and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.counts
+
+    def reconcile_pages(self, method, endpoint, key, reconcile):
+        pages = list_pages(
+            method,
+            endpoint,
+            key,
+            cursor=self.state["cursor"],
+            begin_time=self.begin.isoformat(),
+            end_time=self.end.isoformat(),
+            sort_order="ASC",
+            location_id=self.location_id,
+            limit=self.page_size,
+        )
+        for items, cursor in pages:
+            reconcile(items)
+            self.save_state(self.state["phase"], cursor)
+
+    def save_state(self, phase, cursor):
+        self.state = dict(self.state, phase=phase, cursor=cursor)
+        if self.state_path and not self.dry_run:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def report(self, kind, order=None, payment_id="", refund_id="", detail=""):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.writer.writerow(
+            {
+                "kind": kind,
+                "order": order.pk if order else "",
+                "reference": order.reference if order else "",
+                "payment": payment_id,
+                "refund": refund_id,
+                "detail": detail,
+            }
+        )
+
+    def get_orders(self, payment_ids, references=()):
+        """
+        Orders for a page, keyed by Square payment id, and lists of them
+        keyed by reference.
+        """
+        orders = Order.objects.filter(
+            Q(squarePaymentId__in=payment_ids) | Q(reference__in=references)
+        )
+        by_payment = {}
+        by_reference = {}
+        for order in orders:
+            if order.squarePaymentId:
+                by_payment[order.squarePaymentId] = order
+            by_reference.setdefault(order.reference, []).append(order)
+        return by_payment, by_reference
+
+    def update(self, orders, fields):
+        if orders and not self.dry_run:
+            Order.objects.bulk_update(orders, fields)
+        self.counts["updated"] = self.counts.get("updated", 0) + len(orders)
+
+    def set_status(self, order, status, payment_id="", refund_id=""):
+        if order.status == status:
+            return False
+        self.report(
+            "status",
+            order,
+            payment_id,
+            refund_id,
+            f"{order.status} -> {status}",
+        )
+        order.status = status
+        return True
+
+    def reconcile_payments(self, page):
+        payment_ids = [payment["id"] for payment in page]
+        references = [p["reference_id"] for p in page if p.get("reference_id")]
+        by_payment, by_reference = self.get_orders(payment_ids, references)
+
+        changed = []
+        matched = []
+        for payment in page:
+            order = by_payment.get(payment["id"]) or match_reference(
+                by_reference.get(payment.get("reference_id"), []), payment["id"]
+            )
+            if order is None:
+                if payment.get("status") in ("COMPLETED", "APPROVED"):
+                    self.report(
+                        "orphan_payment",
+                        payment_id=payment["id"],
+                        detail=f"{get_payment_total(payment)} {payment.get('reference_id', '')}",
+                    )
+                continue
+            matched.append(order.pk)
+
+            if payment.get("status") in ("COMPLETED", "APPROVED"):
+                expected = get_payment_total(payment)
+                if order.total != expected:
+                    self.report(
+                        "total_mismatch",
+                        order,
+                        payment["id"],
+                        detail=f"order {order.total}, Square {expected}",
+                    )
+
+            status = PAYMENT_STATUS_MAP.get(payment.get("status"))
+            if status is None or order.status in REFUND_STATUSES + DISPUTE_STATUSES:
+                continue
+            if self.set_status(order, status, payment["id"]):
+                changed.append(order)
+        self.update(changed, ["status"])
+        self.mark_matched(matched)
+
+    def mark_matched(self, order_ids):
+        if self.dry_run:
+            self.matched.update(order_ids)
+        else:
+            Order.objects.filter(pk__in=order_ids).update(reconciledDate=self.started)
+
+    def reconcile_refunds(self, page):
+        payment_ids = [refund["payment_id"] for refund in page]
+        by_payment, _ = self.get_orders(payment_ids)
+
+        changed = {}
+        for refund in page:
+            order = by_payment.get(refund["payment_id"])
+            if order is None:
+                self.report(
+                    "orphan_refund",
+                    payment_id=refund["payment_id"],
+                    refund_id=refund["id"],
+                    detail=refund.get("status", ""),
+                )
+                continue
+
+            api_data = load_api_data(order.apiData) or {}
+            stored = api_data.get("refunds") or []
+            if stored_refund_changed(stored, refund):
+                api_data["refunds"] = [r for r in stored if r.get("id") != refund["id"]]
+                api_data["refunds"].append(refund)
+                order.apiData = api_data
+                order.refreshSquareIds()
+                changed[order.pk] = order
+
+            status = refund.get("status")
+            if order.status in DISPUTE_STATUSES:
+                continue
+            if status == "COMPLETED":
+                new_status = Order.REFUNDED
+            elif status == "PENDING" and order.status != Order.REFUNDED:
+                new_status = Order.REFUND_PENDING
+            elif (
+                status in ("REJECTED", "FAILED")
+                and order.status == Order.REFUND_PENDING
+            ):
+                new_status = Order.COMPLETED
+            else:
+                continue
+            if self.set_status(order, new_status, refund["payment_id"], refund["id"]):
+                changed[order.pk] = order
+        self.update(list(changed.values()), ["status", "apiData", "squareRefundIds"])
+
+    def report_missing(self):
+        """Reports paid card orders in the range that Square has no payment for."""
+        orders = (
+            Order.objects.filter(
+                billingType=Order.CREDIT,
+                status__in=PAID_STATUSES,
+                createdDate__gte=self.begin,
+                createdDate__lt=self.end,
+            )
+            .exclude(reconciledDate__gte=self.started)
+            .exclude(pk__in=self.matched)
+            .order_by("pk")
+        )
+        for order in orders.iterator():
+            self.report(
+                "missing", order, order.squarePaymentId or "", detail=order.status
+            )
@@ -1,10 +1,170 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 
-from registration.models import Order
+from registration.catalog import (
+    RELEASED_STATUSES,
+    bump_catalog_version,
+    release_option,
+    release_order_options,
+    take_option,
+    take_order_options,
+)
+from registration.events import invalidate_events
+from registration.models import (
+    AttendeeOptions,
+    Badge,
+    Dealer,
+    Event,
+    OptionInventory,
+    Order,
+    OrderItem,
+    PriceLevel,
+    PriceLevelOption,
+    ShirtSizes,
+    Staff,
+)
 
 
 @receiver(pre_save, sender=Order)
-def order_pre_save(sender, instance):
+def order_pre_save(sender, instance, raw=False, **kwargs):
     if instance.billingState == None:
         instance.billingState = ""
+
+
+@receiver(post_save, sender=Badge)
+def badge_post_save(sender, instance, created, raw=False, **kwargs):
+    # Staff and dealer records can exist before their badge does.
+    if created and not raw:
+        instance.refreshStatus()
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_status_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Badge.objects.filter(orderitem__order=instance).distinct().refresh_status()
+
+
+@receiver(post_save, sender=Order)
+def order_inventory_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "status" not in update_fields):
+        return
+    # The status the order was loaded with, or last saved with.
+    previous = getattr(instance, "_loaded_status", None)
+    instance._loaded_status = instance.status
+    if previous is None:
+        return
+    was_released = previous in RELEASED_STATUSES
+    if instance.status in RELEASED_STATUSES and not was_released:
+        release_order_options(instance.pk)
+    elif instance.status not in RELEASED_STATUSES and was_released:
+        take_order_options(instance.pk)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_status_changed(sender, instance, raw=False, **kwargs):
+    if raw or instance.badge_id is None:
+        return
+    Badge.objects.filter(pk=instance.badge_id).refresh_status()
+
+
+@receiver(pre_save, sender=Staff)
+@receiver(pre_save, sender=Dealer)
+def association_pre_save(sender, instance, raw=False, **kwargs):
+    # Remember the badge this record pointed at, in case it is being moved.
+    instance._previous_association = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_association = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("attendee_id", "event_id")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Staff)
+@receiver(post_save, sender=Dealer)
+@receiver(post_delete, sender=Staff)
+@receiver(post_delete, sender=Dealer)
+def association_status_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {(instance.attendee_id, instance.event_id)}
+    previous = getattr(instance, "_previous_association", None)
+    if previous:
+        keys.add(previous)
+    for attendee_id, event_id in keys:
+        if attendee_id is None or event_id is None:
+            continue
+        badges = Badge.objects.filter(attendee_id=attendee_id, event_id=event_id)
+        badges.refresh_status()
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_events()
+
+
+@receiver(post_save, sender=PriceLevel)
+@receiver(post_delete, sender=PriceLevel)
+@receiver(post_save, sender=PriceLevelOption)
+@receiver(post_delete, sender=PriceLevelOption)
+@receiver(post_save, sender=ShirtSizes)
+@receiver(post_delete, sender=ShirtSizes)
+@receiver(m2m_changed, sender=PriceLevel.priceLevelOptions.through)
+def catalog_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=PriceLevelOption)
+def option_limit_changed(sender, instance, raw=False, **kwargs):
+    # Counters are reseeded from AttendeeOptions if it's limited again later.
+    if not raw and instance.quantity is None:
+        OptionInventory.objects.filter(option=instance).delete()
+
+
+def attendee_option_event_id(instance):
+    """The option's event, or None if its order no longer holds stock."""
+    event_id, status = OrderItem.objects.filter(pk=instance.orderItem_id).values_list(
+        "badge__event_id", "order__status"
+    ).first() or (None, None)
+    if status in RELEASED_STATUSES:
+        return None
+    return event_id
+
+
+@receiver(post_save, sender=AttendeeOptions)
+def attendee_option_saved(sender, instance, created, raw=False, **kwargs):
+    # Checkout saves options in bulk and takes their stock itself.
+    if raw or not created:
+        return
+    if instance.option.quantity is None:
+        return
+    event_id = attendee_option_event_id(instance)
+    if event_id is not None:
+        take_option(event_id, instance.option)
+
+
+@receiver(pre_delete, sender=AttendeeOptions)
+def attendee_option_deleted(sender, instance, **kwargs):
+    # pre_delete, as a cascade may remove the badge before this row.
+    try:
+        option = instance.option
+    except PriceLevelOption.DoesNotExist:
+        return
+    if option.quantity is None:
+        return
+    event_id = attendee_option_event_id(instance)
+    if event_id is not None:
+        release_option(event_id, option)
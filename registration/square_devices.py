@@ -0,0 +1,146 @@
+"""
+Cached inventory of Square devices.
+
+Listing devices pages through the Square devices API, which is too slow to
+do in an admin request.  The list is kept in the cache; pages that need it
+get the cached copy straight away, and a copy older than
+SQUARE_DEVICE_REFRESH_AFTER is refreshed on a background thread, which also
+syncs the SquareDevice table from it.  Only one refresh runs at a time.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from prometheus_client import Counter
+
+from registration import payments
+from registration.models import SquareDevice
+
+logger = logging.getLogger(__name__)
+
+SQUARE_DEVICE_CACHE = Counter(
+    "square_device_cache_lookups", "Square device inventory lookups", ["result"]
+)
+
+CACHE_KEY = "square_devices"
+REFRESH_LOCK_KEY = "square_devices:refreshing"
+
+# How long the inventory is kept, and the age at which it is refreshed in
+# the background.
+CACHE_TTL = getattr(settings, "SQUARE_DEVICE_CACHE_TTL", 60 * 60)
+REFRESH_AFTER = getattr(settings, "SQUARE_DEVICE_REFRESH_AFTER", 5 * 60)
+
+# Longest a refresh may hold the lock, in case its thread dies.
+REFRESH_TIMEOUT = 120
+
+
+def get_inventory():
+    """The cached {"devices": [...], "fetched": timestamp}, or None."""
+    return cache.get(CACHE_KEY)
+
+
+def get_devices():
+    """
+    Square devices, from the cache when possible.  A stale copy is returned
+    as is and refreshed in the background; only an empty cache waits on
+    Square.
+    """
+    inventory = get_inventory()
+    if inventory is None:
+        SQUARE_DEVICE_CACHE.labels("miss").inc()
+        return refresh()
+    if time.time() - inventory["fetched"] > REFRESH_AFTER:
+        SQUARE_DEVICE_CACHE.labels("stale").inc()
+        start_refresh()
+    else:
+        SQUARE_DEVICE_CACHE.labels("hit").inc()
+    return inventory["devices"]
+
+
+def refresh():
+    """Fetches devices from Square, caches them and syncs SquareDevice."""
+    devices = payments.get_terminals()
+    cache.set(CACHE_KEY, {"devices": devices, "fetched": time.time()}, CACHE_TTL)
+    sync(devices)
+    return devices
+
+
+def refresh_if_stale():
+    """Starts a background refresh if the cached inventory is missing or old."""
+    inventory = get_inventory()
+    if inventory is None or time.time() - inventory["fetched"] > REFRESH_AFTER:
+        return start_refresh()
+    return False
+
+
+def start_refresh():
+    """Refreshes in the background unless a refresh is already running."""
+    if not cache.add(REFRESH_LOCK_KEY, True, REFRESH_TIMEOUT):
+        return False
+    run_in_background(_background_refresh)
+    return True
+
+
+def run_in_background(function):
+    def run():
+        try:
+            function()
+        finally:
+            # Threads get their own database connections; don't leak them.
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _background_refresh():
+    try:
+        refresh()
+    except Exception:
+        logger.exception("Unable to refresh Square devices")
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+
+
+def sync(devices):
+    """
+    Makes SquareDevice match a device list, writing only what changed.
+    Returns the number of devices created, updated and deleted.
+    """
+    wanted = {
+        device["id"]: (device["attributes"]["name"], device["attributes"]["type"])
+        for device in devices
+    }
+    existing = {
+        device_id: (name, device_type)
+        for device_id, name, device_type in SquareDevice.objects.values_list(
+            "device_id", "name", "device_type"
+        )
+    }
+
+    created = [
+        SquareDevice(device_id=device_id, name=name, device_type=device_type)
+        for device_id, (name, device_type) in wanted.items()
+        if device_id not in existing
+    ]
+    updated = [
+        SquareDevice(device_id=device_id, name=name, device_type=device_type)
+        for device_id, (name, device_type) in wanted.items()
+        if device_id in existing and existing[device_id] != (name, device_type)
+    ]
+    deleted = [device_id for device_id in existing if device_id not in wanted]
+    if not (created or updated or deleted):
+        return 0, 0, 0
+
+    with transaction.atomic():
+        if created:
+            # A concurrent sync may have just added the same devices.
+            SquareDevice.objects.bulk_create(created, ignore_conflicts=True)
+        if updated:
+            SquareDevice.objects.bulk_update(updated, ["name", "device_type"])
+        if deleted:
+            SquareDevice.objects.filter(device_id__in=deleted).delete()
+    return len(created), len(updated), len(deleted)
@@ -0,0 +1,82 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from registration.events import get_event_by_name
+from registration.models import *
+from registration.tests.common import OrdersTestCase
+from registration.views.cart import load_carts, save_carts
+
+
+class TestSaveCarts(OrdersTestCase):
+    def make_cart(self, attendee, priceLevel, options=()):
+        cart = Cart(
+            form=Cart.ATTENDEE,
+            formData=json.dumps(
+                {
+                    "attendee": attendee,
+                    "priceLevel": {"id": priceLevel.id, "options": list(options)},
+                    "event": self.event.name,
+                }
+            ),
+        )
+        cart.save()
+        return cart
+
+    def make_carts(self, count):
+        options = [
+            {"id": self.option_conbook.id, "value": "true"},
+            {"id": self.option_shirt.id, "value": self.shirt1.id},
+        ]
+        return [
+            self.make_cart(self.attendee_form_2, self.price_45, options)
+            for _ in range(count)
+        ]
+
+    def test_save_carts(self):
+        order = Order(total=90, reference="BULKSAVE")
+        order.save()
+
+        order_items = save_carts(load_carts(self.make_carts(2)), order)
+
+        self.assertEqual(len(order_items), 2)
+        for item in OrderItem.objects.filter(order=order):
+            self.assertEqual(item.priceLevel, self.price_45)
+            self.assertEqual(item.badge.attendee.fullName, "Bea Testerson")
+            self.assertEqual(item.badge.statusAssociation, Badge.PAID)
+            self.assertEqual(item.attendeeoptions_set.count(), 2)
+        self.assertFalse(Cart.objects.filter(transferedDate__isnull=True).exists())
+
+    def test_queries_do_not_grow_with_carts(self):
+        def count_queries(carts):
+            with CaptureQueriesContext(connection) as queries:
+                save_carts(load_carts(carts))
+            return len(queries)
+
+        get_event_by_name(self.event.name)
+        single = count_queries(self.make_carts(1))
+        self.assertEqual(count_queries(self.make_carts(4)), single)
+
+    def test_invalid_cart_writes_nothing(self):
+        carts = self.make_carts(1)
+        attendee = dict(self.attendee_form_1, birthdate="not a date")
+        carts.append(self.make_cart(attendee, self.price_45))
+
+        with self.assertRaises(ValueError):
+            save_carts(load_carts(carts))
+        self.assertEqual(Attendee.objects.count(), 0)
+
+    def test_zero_checkout(self):
+        self.add_to_cart(self.attendee_form_1, self.price_free, [])
+        self.add_to_cart(self.attendee_form_2, self.price_free, [])
+
+        response = self.zero_checkout()
+        self.assertEqual(response.status_code, 200)
+
+        order = Order.objects.get()
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.assertEqual(
+            set(Badge.objects.values_list("statusAssociation", flat=True)),
+            {Badge.COMP},
+        )
@@ -0,0 +1,262 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from registration import catalog
+from registration.models import *
+from registration.tests.common import TEST_ATTENDEE_ARGS, OrdersTestCase
+
+
+class TestPriceLevelCatalog(OrdersTestCase):
+    def setUp(self):
+        cache.clear()
+        catalog._local_cache.clear()
+        super().setUp()
+
+    def get_prices(self, year="1990", form_type="attendee"):
+        response = self.client.post(
+            reverse("registration:pricelevels"),
+            json.dumps(
+                {"year": year, "month": "1", "day": "1", "form_type": form_type}
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def sell(self, option):
+        attendee = Attendee(**TEST_ATTENDEE_ARGS)
+        attendee.save()
+        badge = Badge(attendee=attendee, event=self.event, badgeName="Sold")
+        badge.save()
+        order_item = OrderItem(badge=badge, priceLevel=self.price_45)
+        order_item.save()
+        AttendeeOptions(option=option, orderItem=order_item, optionValue="1").save()
+
+    def test_price_levels_cached(self):
+        first = self.get_prices()
+        self.assertEqual(
+            [level["name"] for level in first], ["Minor", "Attendee", "Sponsor"]
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_prices(), first)
+
+    def test_cache_keyed_by_age(self):
+        self.price_90.min_age = 40
+        self.price_90.save()
+
+        self.assertEqual(
+            [level["name"] for level in self.get_prices()], ["Minor", "Attendee"]
+        )
+        self.assertEqual(
+            [level["name"] for level in self.get_prices(year="1950")],
+            ["Minor", "Attendee", "Sponsor"],
+        )
+
+    def test_level_save_invalidates(self):
+        self.get_prices()
+        self.price_235.public = True
+        self.price_235.save()
+
+        self.assertIn("Elite", [level["name"] for level in self.get_prices()])
+
+    def test_option_change_invalidates(self):
+        self.get_prices()
+        self.option_conbook.optionName = "Program"
+        self.option_conbook.save()
+
+        attendee = [
+            level for level in self.get_prices() if level["name"] == "Attendee"
+        ][0]
+        self.assertIn("Program", [option["name"] for option in attendee["options"]])
+
+    def test_sold_out(self):
+        self.option_conbook.quantity = 1
+        self.option_conbook.save()
+
+        attendee = [
+            level for level in self.get_prices() if level["name"] == "Attendee"
+        ][0]
+        conbook = [o for o in attendee["options"] if o["id"] == self.option_conbook.id][
+            0
+        ]
+        self.assertTrue(conbook["limited_availability"])
+        self.assertFalse(conbook["sold_out"])
+
+        self.sell(self.option_conbook)
+
+        attendee = [
+            level for level in self.get_prices() if level["name"] == "Attendee"
+        ][0]
+        conbook = [o for o in attendee["options"] if o["id"] == self.option_conbook.id][
+            0
+        ]
+        self.assertTrue(conbook["sold_out"])
+
+    def test_unlimited_sale_keeps_inventory_version(self):
+        version = catalog.get_version(catalog.INVENTORY_VERSION_KEY)
+        self.sell(self.option_shirt)
+        self.assertEqual(catalog.get_version(catalog.INVENTORY_VERSION_KEY), version)
+
+    def test_expires_when_next_level_opens(self):
+        self.price_150.startDate = timezone.now() + timedelta(seconds=60)
+        self.price_150.save()
+
+        result, timeout = catalog.build_price_level_list("attendee", 30)
+        self.assertNotIn("Super", [level["name"] for level in result["levels"]])
+        self.assertLessEqual(timeout, 60)
+
+
+class TestOptionInventory(OrdersTestCase):
+    def setUp(self):
+        cache.clear()
+        catalog._local_cache.clear()
+        super().setUp()
+        self.option_conbook.quantity = 1
+        self.option_conbook.save()
+
+    def sold(self):
+        return OptionInventory.objects.get(
+            event=self.event, option=self.option_conbook
+        ).sold
+
+    def test_reserve_and_release(self):
+        self.assertTrue(catalog.reserve_option(self.event.pk, self.option_conbook))
+        self.assertFalse(catalog.reserve_option(self.event.pk, self.option_conbook))
+        self.assertEqual(self.sold(), 1)
+
+        catalog.release_option(self.event.pk, self.option_conbook)
+        self.assertEqual(self.sold(), 0)
+        catalog.release_option(self.event.pk, self.option_conbook)
+        self.assertEqual(self.sold(), 0)
+
+    def test_unlimited_options_are_not_counted(self):
+        self.assertTrue(catalog.reserve_option(self.event.pk, self.option_shirt))
+        self.assertFalse(
+            OptionInventory.objects.filter(option=self.option_shirt).exists()
+        )
+
+    def test_counter_seeded_from_existing_sales(self):
+        OptionInventory.objects.all().delete()
+        attendee = Attendee(**TEST_ATTENDEE_ARGS)
+        attendee.save()
+        badge = Badge(attendee=attendee, event=self.event, badgeName="Sold")
+        badge.save()
+        order_item = OrderItem(badge=badge, priceLevel=self.price_45)
+        order_item.save()
+        AttendeeOptions(
+            option=self.option_conbook, orderItem=order_item, optionValue="1"
+        ).save()
+        OptionInventory.objects.all().delete()
+
+        self.assertFalse(catalog.reserve_option(self.event.pk, self.option_conbook))
+        self.assertEqual(self.sold(), 1)
+
+    def test_first_sale_counted_once(self):
+        OptionInventory.objects.all().delete()
+        attendee = Attendee(**TEST_ATTENDEE_ARGS)
+        attendee.save()
+        badge = Badge(attendee=attendee, event=self.event, badgeName="Sold")
+        badge.save()
+        order_item = OrderItem(badge=badge, priceLevel=self.price_45)
+        order_item.save()
+        AttendeeOptions(
+            option=self.option_conbook, orderItem=order_item, optionValue="1"
+        ).save()
+        self.assertEqual(self.sold(), 1)
+
+    def test_checkout_reserves_stock(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.attendee_form_1, self.price_free, options)
+        response = self.zero_checkout()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sold(), 1)
+
+        self.add_to_cart(self.attendee_form_2, self.price_free, options)
+        response = self.zero_checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("sold out", response.json()["reason"]["apisError"])
+        self.assertEqual(self.sold(), 1)
+
+        # Cancelling the first registration puts the option back.
+        Badge.objects.get(event=self.event).delete()
+        self.assertEqual(self.sold(), 0)
+        self.assertFalse(
+            catalog.is_sold_out(
+                self.event, self.option_conbook.id, self.option_conbook.quantity
+            )
+        )
+
+    def test_refund_releases_stock(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.attendee_form_1, self.price_free, options)
+        self.assertEqual(self.zero_checkout().status_code, 200)
+        order = Order.objects.get()
+
+        order.status = Order.REFUNDED
+        order.save()
+        self.assertEqual(self.sold(), 0)
+        order.status = Order.COMPLETED
+        order.save()
+        self.assertEqual(self.sold(), 1)
+        order.status = Order.FAILED
+        order.save()
+        self.assertEqual(self.sold(), 0)
+
+        self.add_to_cart(self.attendee_form_2, self.price_free, options)
+        self.assertEqual(self.zero_checkout().status_code, 200)
+        self.assertEqual(self.sold(), 1)
+
+        # The failed order's stock was already given back.
+        Badge.objects.get(orderitem__order=order).delete()
+        self.assertEqual(self.sold(), 1)
+
+    def test_stale_order_status_not_released_twice(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.attendee_form_1, self.price_free, options)
+        self.assertEqual(self.zero_checkout().status_code, 200)
+        order = Order.objects.get()
+        refunded = Order.objects.get()
+        refunded.status = Order.REFUNDED
+        refunded.save()
+        self.assertEqual(self.sold(), 0)
+
+        order.refresh_from_db()
+        order.save()
+        self.assertEqual(self.sold(), 0)
+        # Saving other fields doesn't look at the status.
+        order.status = Order.COMPLETED
+        order.save(update_fields=["total"])
+        self.assertEqual(self.sold(), 0)
+
+    def test_checkout_error_releases_stock(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.attendee_form_1, self.price_free, options)
+        with (
+            patch("registration.views.ordering.save_order", side_effect=RuntimeError),
+            self.assertRaises(RuntimeError),
+        ):
+            self.zero_checkout()
+        self.assertEqual(self.sold(), 0)
+
+    def test_sold_out_check_is_read_only(self):
+        OptionInventory.objects.all().delete()
+        self.assertFalse(
+            catalog.is_sold_out(
+                self.event, self.option_conbook.id, self.option_conbook.quantity
+            )
+        )
+        self.assertFalse(OptionInventory.objects.exists())
+
+    def test_removing_limit_drops_counter(self):
+        catalog.reserve_option(self.event.pk, self.option_conbook)
+        self.option_conbook.quantity = None
+        self.option_conbook.save()
+        self.assertFalse(
+            OptionInventory.objects.filter(option=self.option_conbook).exists()
+        )
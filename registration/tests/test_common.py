@@ -1,7 +1,9 @@
-from tempfile import TemporaryDirectory
 from datetime import timedelta
+from tempfile import TemporaryDirectory
 
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 from django.utils import timezone
 from PIL import Image
 
@@ -14,9 +16,10 @@ from registration.models import (
     OrderItem,
     PriceLevel,
     PriceLevelOption,
+    Staff,
 )
+from registration.tests.common import DEFAULT_EVENT_ARGS, TEST_ATTENDEE_ARGS
 from registration.views.common import getOptionsDict
-from registration.tests.common import DEFAULT_EVENT_ARGS
 
 
 class TestGetOptionsDict(TestCase):
@@ -44,11 +47,7 @@ class TestGetOptionsDict(TestCase):
         )
         attendee.save()
 
-        badge = Badge(
-            attendee=attendee,
-            event=event,
-            badgeName="DisStaff"
-        )
+        badge = Badge(attendee=attendee, event=event, badgeName="DisStaff")
         badge.save()
 
         now = timezone.now()
@@ -104,13 +103,18 @@ class TestGetOptionsDict(TestCase):
 
         options = getOptionsDict(badge.orderitem_set.all())
         self.assertEqual(len(options), 1)
-        self.assertEqual(options, [{
-            "name": pl_option.optionName,
-            "type": pl_option.optionExtraType,
-            "value": attendee_option.optionValue,
-            "id": pl_option.id,
-            "image": None,
-        }])
+        self.assertEqual(
+            options,
+            [
+                {
+                    "name": pl_option.optionName,
+                    "type": pl_option.optionExtraType,
+                    "value": attendee_option.optionValue,
+                    "id": pl_option.id,
+                    "image": None,
+                }
+            ],
+        )
 
         # Add an image to the price level option
         image = Image.new("RGB", (200, 100), "white")
@@ -123,10 +127,62 @@ class TestGetOptionsDict(TestCase):
 
         options = getOptionsDict(badge.orderitem_set.all())
         self.assertEqual(len(options), 1)
-        self.assertEqual(options, [{
-            "name": pl_option.optionName,
-            "type": pl_option.optionExtraType,
-            "value": attendee_option.optionValue,
-            "id": pl_option.id,
-            "image": image_path,
-        }])
+        self.assertEqual(
+            options,
+            [
+                {
+                    "name": pl_option.optionName,
+                    "type": pl_option.optionExtraType,
+                    "value": attendee_option.optionValue,
+                    "id": pl_option.id,
+                    "image": image_path,
+                }
+            ],
+        )
+
+
+class TestBadgeLists(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser("admin", "admin@host", "admin")
+        self.client.force_login(self.admin_user)
+        self.event = Event.objects.create(**DEFAULT_EVENT_ARGS)
+        now = timezone.now()
+        self.vip = PriceLevel.objects.create(
+            name="Sponsor",
+            basePrice=100,
+            startDate=now - timedelta(days=10),
+            endDate=now + timedelta(days=10),
+            emailVIP=True,
+        )
+        order = Order.objects.create(
+            total=100, reference="LISTS", billingType=Order.CREDIT
+        )
+        for name in ("Attending", "Staffing"):
+            attendee = Attendee.objects.create(
+                **dict(TEST_ATTENDEE_ARGS, firstName=name)
+            )
+            badge = Badge.objects.create(
+                attendee=attendee, event=self.event, badgeName=name
+            )
+            OrderItem.objects.create(
+                badge=badge, priceLevel=self.vip, order=order, enteredBy="test"
+            )
+        Staff.objects.create(attendee=attendee, event=self.event, title="Staffer")
+
+    def test_basic_badges(self):
+        response = self.client.get(reverse("registration:basicBadges"))
+        self.assertEqual(response.status_code, 200)
+        attendees = response.context["attendees"]
+        self.assertEqual([att["badgeName"] for att in attendees], ["Attending"])
+        self.assertEqual(attendees[0]["level"], "Sponsor")
+        self.assertEqual(attendees[0]["assoc"], Badge.PAID)
+        staff = response.context["staff"]
+        self.assertEqual(staff[0]["badgeName"], "Staffing")
+        self.assertEqual(staff[0]["assoc"], Badge.STAFF)
+
+    def test_vip_badges(self):
+        response = self.client.get(reverse("registration:vipBadges"))
+        self.assertEqual(response.status_code, 200)
+        badges = response.context["badges"]
+        self.assertEqual([b["badge"].badgeName for b in badges], ["Attending"])
+        self.assertEqual(badges[0]["level"], "Sponsor")
@@ -1,10 +1,13 @@
+from datetime import timedelta
+from smtplib import SMTPException
 from unittest.mock import patch
 
 from django.core import mail
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from registration import emails
+from registration import emails, outbox
 from registration.models import (
     Attendee,
     Badge,
@@ -12,6 +15,7 @@ from registration.models import (
     DealerAsst,
     Event,
     Order,
+    QueuedEmail,
     Staff,
     TempToken,
 )
@@ -36,6 +40,91 @@ class TestSendEmail(TestCase):
         self.assertEqual(mail.outbox[0].subject, "Test email subject")
 
 
+@override_settings(EMAIL_OUTBOX=True)
+class TestEmailOutbox(TestCase):
+    def send_email(self, template="test", to="someone@mailinator.org"):
+        emails.send_email(
+            "no-reply@example.com",
+            [to],
+            "Test email subject",
+            "This is a test",
+            "<p>This is a test</p>",
+            bcc=["bcc@example.com"],
+            template=template,
+        )
+
+    def test_queues_instead_of_sending(self):
+        self.send_email()
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.status, QueuedEmail.PENDING)
+        self.assertEqual(email.template, "test")
+        self.assertEqual(email.to, ["someone@mailinator.org"])
+
+    def test_sends_batch_over_one_connection(self):
+        for i in range(3):
+            self.send_email(to=f"person{i}@mailinator.org")
+
+        with patch(
+            "registration.outbox.get_connection", wraps=mail.get_connection
+        ) as mock_get_connection:
+            self.assertEqual(outbox.run_pending(), 3)
+        mock_get_connection.assert_called_once()
+
+        self.assertEqual(len(mail.outbox), 3)
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, "Test email subject")
+        self.assertEqual(message.reply_to, ["no-reply@example.com"])
+        self.assertEqual(message.bcc, ["bcc@example.com"])
+        self.assertEqual(message.alternatives, [("<p>This is a test</p>", "text/html")])
+        self.assertFalse(QueuedEmail.objects.exclude(status=QueuedEmail.SENT).exists())
+        self.assertEqual(outbox.run_pending(), 0)
+
+    def test_retries_then_fails(self):
+        self.send_email()
+        with patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=SMTPException("Try again later"),
+        ):
+            outbox.run_pending()
+            email = QueuedEmail.objects.get()
+            self.assertEqual(email.status, QueuedEmail.PENDING)
+            self.assertEqual(email.error, "Try again later")
+            self.assertGreater(email.nextAttempt, timezone.now())
+            self.assertEqual(outbox.run_pending(), 0)
+
+            for _ in range(outbox.MAX_ATTEMPTS - 1):
+                QueuedEmail.objects.update(nextAttempt=timezone.now())
+                outbox.run_pending()
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, QueuedEmail.FAILED)
+        self.assertEqual(email.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_RATE_LIMITS={"limited": 2})
+    def test_rate_limit(self):
+        for i in range(3):
+            self.send_email(template="limited")
+        self.send_email(template="other")
+
+        self.assertEqual(outbox.run_pending(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+
+        held = QueuedEmail.objects.get(status=QueuedEmail.PENDING)
+        self.assertEqual(held.template, "limited")
+        self.assertEqual(held.attempts, 0)
+        self.assertGreater(held.nextAttempt, timezone.now())
+
+        # Once the earlier ones are outside the window it goes out.
+        QueuedEmail.objects.filter(status=QueuedEmail.SENT).update(
+            sent=timezone.now() - timedelta(seconds=outbox.RATE_LIMIT_WINDOW)
+        )
+        QueuedEmail.objects.filter(pk=held.pk).update(nextAttempt=timezone.now())
+        self.assertEqual(outbox.run_pending(), 1)
+
+
 class EmailTestCase(TestCase):
     def setUp(self):
         self.event = Event(**DEFAULT_EVENT_ARGS)
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.test import TestCase
+
+from registration import events
+from registration.models import *
+from registration.tests.common import DEFAULT_EVENT_ARGS
+
+
+class TestEventCache(TestCase):
+    def setUp(self):
+        self.event = Event(**DEFAULT_EVENT_ARGS)
+        self.event.save()
+
+    def tearDown(self):
+        events.finish_request()
+
+    def test_lookups_are_cached(self):
+        self.assertEqual(events.get_default_event(), self.event)
+        with self.assertNumQueries(0):
+            self.assertEqual(events.get_default_event(), self.event)
+            self.assertEqual(events.get_event_by_name(self.event.name), self.event)
+            self.assertEqual(events.get_event(self.event.pk), self.event)
+
+    def test_save_invalidates(self):
+        events.get_default_event()
+        self.event.name = "Renamed"
+        self.event.save()
+
+        self.assertEqual(events.get_default_event().name, "Renamed")
+        self.assertEqual(events.get_event_by_name("Renamed"), self.event)
+
+    def test_default_moves(self):
+        events.get_default_event()
+        other = Event(**dict(DEFAULT_EVENT_ARGS, name="Next Year", default=False))
+        other.save()
+        self.event.default = False
+        self.event.save()
+        other.default = True
+        other.save()
+
+        self.assertEqual(events.get_default_event(), other)
+
+    def test_delete_invalidates(self):
+        events.get_default_event()
+        self.event.delete()
+
+        with self.assertRaises(Event.DoesNotExist):
+            events.get_default_event()
+
+    def test_missing_event_raises(self):
+        with self.assertRaises(Event.DoesNotExist):
+            events.get_event_by_name("No Such Event")
+
+    def test_copies_outside_request(self):
+        event = events.get_default_event()
+        event.name = "Changed Locally"
+        self.assertEqual(events.get_default_event().name, self.event.name)
+
+    def test_request_scope(self):
+        events.start_request()
+        event = events.get_default_event()
+        self.assertIs(events.get_event(self.event.pk), event)
+        events.finish_request()
+
+        self.assertIsNot(events.get_default_event(), event)
+
+    def test_uncommitted_changes_not_shared(self):
+        events.get_default_event()
+        with transaction.atomic():
+            self.event.name = "Renamed"
+            self.event.save()
+            self.assertEqual(events.get_default_event().name, "Renamed")
+            with self.assertNumQueries(0):
+                events.get_default_event()
+            # Other threads never see the uncommitted change.
+            self.assertEqual(events._process_cache, (None, {}))
+            transaction.set_rollback(True)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                events.get_default_event().name, DEFAULT_EVENT_ARGS["name"]
+            )
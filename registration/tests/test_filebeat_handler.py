@@ -1,12 +1,12 @@
-from unittest.mock import MagicMock
 import base64
-import hmac
 import hashlib
+import hmac
 import json
 import logging
+from unittest.mock import MagicMock
 
-from django.test import TestCase
 import responses
+from django.test import TestCase
 
 from registration.middleware.logging import LoggingMiddleware
 from registration.utils.filebeat_logging_handler import FilebeatHandler
@@ -43,16 +43,17 @@ class TestLoggingMiddleware(TestCase):
 
         log.handlers.clear()
 
-        handler = FilebeatHandler(
+        self.handler = FilebeatHandler(
             endpoint_url="http://127.0.0.1/local/",
             username="username",
             password="password",
             hmac_header="x-256-secret",
             hmac_secret="hmac_secret",
         )
-        log.addHandler(handler)
+        log.addHandler(self.handler)
 
     def tearDown(self):
+        self.handler.close()
         log.handlers = self._old_handlers
 
     @responses.activate
@@ -88,14 +89,17 @@ class TestLoggingMiddleware(TestCase):
         self.assertEqual(request.return_value, response)
         self.assertEqual(request.META["REMOTE_ADDR"], "127.0.0.1")
 
+        self.handler.flush()
+
+        # Both records go out in one signed NDJSON batch.
         calls = list(responses.calls)
-        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(calls), 1)
 
         call = calls[0].request
         self.assertEqual(call.method, "POST")
         self.assertEqual(call.params, {})
         self.assertEqual(call.url, "http://127.0.0.1/local/")
-        self.assertEqual(call.headers["Content-Type"], "application/json")
+        self.assertEqual(call.headers["Content-Type"], "application/x-ndjson")
 
         expected = base64.b64encode(b"username:password").decode("utf-8")
         auth = call.headers["Authorization"]
@@ -118,7 +122,10 @@ class TestLoggingMiddleware(TestCase):
 
         self.assertEqual(call.headers["Content-Length"], str(len(data)))
 
-        log_args = json.loads(data)
+        lines = data.splitlines()
+        self.assertEqual(len(lines), 2)
+
+        log_args = json.loads(lines[0])
         self.assertEqual(log_args["name"], "registration")
         self.assertEqual(log_args["msg"], "Processing request")
         self.assertEqual(log_args["levelname"], "INFO")
@@ -136,34 +143,7 @@ class TestLoggingMiddleware(TestCase):
         self.assertEqual(log_args["request.user_email"], "test@example.net")
         self.assertEqual(log_args["request.session_id"], "12345")
 
-        call = calls[1].request
-        self.assertEqual(call.method, "POST")
-        self.assertEqual(call.params, {})
-        self.assertEqual(call.url, "http://127.0.0.1/local/")
-        self.assertEqual(call.headers["Content-Type"], "application/json")
-
-        expected = base64.b64encode(b"username:password").decode("utf-8")
-        auth = call.headers["Authorization"]
-        self.assertEqual(auth.startswith("Basic "), True)
-        auth = auth.removeprefix("Basic ")
-        self.assertEqual(auth, expected)
-
-        data = bytes(call.body)
-
-        signature = hmac.new(
-            b"hmac_secret",
-            msg=data,
-            digestmod=hashlib.sha256,
-        ).hexdigest()
-
-        sig_header = call.headers["x-256-secret"]
-        self.assertEqual(sig_header.startswith("sha256="), True)
-        sig_header = sig_header.removeprefix("sha256=")
-        self.assertEqual(sig_header, signature)
-
-        self.assertEqual(call.headers["Content-Length"], str(len(data)))
-
-        log_args = json.loads(data)
+        log_args = json.loads(lines[1])
         self.assertEqual(log_args["name"], "registration")
         self.assertEqual(log_args["msg"], "Processed request")
         self.assertEqual(log_args["levelname"], "INFO")
@@ -181,3 +161,30 @@ class TestLoggingMiddleware(TestCase):
         self.assertEqual(log_args["request.user_email"], "test@example.net")
         self.assertEqual(log_args["request.session_id"], "12345")
         self.assertEqual(log_args["request.status_code"], 200)
+        self.assertEqual(self.handler.sent, 2)
+
+    def test_full_queue_drops_records(self):
+        handler = FilebeatHandler(
+            endpoint_url="http://127.0.0.1/local/",
+            username="username",
+            password="password",
+            hmac_header="x-256-secret",
+            hmac_secret="hmac_secret",
+            queue_size=1,
+        )
+        # Keep the sender from draining the queue.
+        handler._ensure_thread = lambda: None
+        record = logging.LogRecord(
+            "registration", logging.INFO, __file__, 1, "msg", (), None
+        )
+        handler.emit(record)
+        handler.emit(record)
+        self.assertEqual(handler.dropped, 1)
+
+    @responses.activate
+    def test_failed_post_is_counted(self):
+        responses.add(responses.POST, "http://127.0.0.1/local/", status=503)
+        log.info("Unreachable")
+        self.handler.flush()
+        self.assertEqual(self.handler.failed, 1)
+        self.assertEqual(self.handler.sent, 0)
@@ -0,0 +1,111 @@
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase
+
+from registration.models import *
+from registration.tests.common import DEFAULT_EVENT_ARGS
+from registration.views.onsite_admin import get_search_candidates
+
+
+class TestLookupIndexes(TestCase):
+    """
+    The planner picks sequential scans on tables this small, so these turn
+    them off and check that an index can serve each hot lookup instead.
+    """
+
+    def setUp(self):
+        self.event = Event(**DEFAULT_EVENT_ARGS)
+        self.event.save()
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, *names):
+        """Checks for no sequential scan, and that each named index is used."""
+        table = queryset.model._meta.db_table
+        plan = queryset.explain()
+        self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+        for name in names:
+            self.assertIn(name, plan, plan)
+
+    def field_index(self, model, field_name):
+        """The name Django generated for a db_index field's index."""
+        column = model._meta.get_field(field_name).column
+        with connection.schema_editor() as editor:
+            return editor._create_index_name(model._meta.db_table, [column])
+
+    def has_trigram_extension(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            return cursor.fetchone() is not None
+
+    def test_order_reference(self):
+        self.assertUsesIndex(
+            Order.objects.filter(reference="ABCDEF"),
+            self.field_index(Order, "reference"),
+        )
+
+    def test_registration_tokens(self):
+        for model in (Badge, Staff, Dealer, DealerAsst):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(
+                    model.objects.filter(registrationToken="abc"),
+                    self.field_index(model, "registrationToken"),
+                )
+
+    def test_staff_lookup(self):
+        self.assertUsesIndex(
+            Staff.objects.filter(
+                attendee__email__iexact="apis@mailinator.org", registrationToken="abc"
+            ),
+            self.field_index(Staff, "registrationToken"),
+        )
+
+    def test_temp_token(self):
+        self.assertUsesIndex(
+            TempToken.objects.filter(token="abc"), self.field_index(TempToken, "token")
+        )
+
+    def test_firebase_token(self):
+        self.assertUsesIndex(
+            Firebase.objects.filter(token="abc"), self.field_index(Firebase, "token")
+        )
+
+    def test_discount_code(self):
+        self.assertUsesIndex(
+            Discount.objects.filter(codeName="FiveOff"),
+            self.field_index(Discount, "codeName"),
+        )
+
+    def test_ban_list(self):
+        self.assertUsesIndex(
+            BanList.objects.filter(
+                firstName="Test", lastName="Testerson", email="apis@mailinator.org"
+            ),
+            "ban_list_name_email",
+        )
+
+    def test_badge_number(self):
+        self.assertUsesIndex(
+            Badge.objects.filter(event=self.event, badgeNumber=42), "badge_event_number"
+        )
+        self.assertUsesIndex(
+            Badge.objects.filter(event=self.event, badgeNumber__isnull=False)
+            .values("event")
+            .annotate(highest=Max("badgeNumber")),
+            "badge_event_number",
+        )
+
+    def test_onsite_search_last_name(self):
+        self.assertUsesIndex(
+            Attendee.objects.filter(lastName__iexact="Smith"), "attendee_lastname_upper"
+        )
+
+    def test_onsite_search(self):
+        if not self.has_trigram_extension():
+            self.skipTest("pg_trgm is not installed")
+        self.assertUsesIndex(
+            Badge.objects.filter(pk__in=get_search_candidates("Smith")),
+            "attendee_fullname_trgm",
+            "badge_badgename_trgm",
+            "attendee_lastname_upper",
+        )
@@ -4,12 +4,25 @@ from django.test import TestCase
 
 from registration.models import (
     Attendee,
+    Badge,
     Charity,
+    Discount,
+    Event,
     HoldType,
+    Order,
+    OrderItem,
+    PriceLevel,
+    Staff,
     Venue,
     get_hold_type,
 )
-from registration.tests.common import DEFAULT_VENUE_ARGS, TEST_ATTENDEE_ARGS
+from registration.tests.common import (
+    DEFAULT_EVENT_ARGS,
+    DEFAULT_VENUE_ARGS,
+    TEST_ATTENDEE_ARGS,
+    now,
+    ten_days,
+)
 
 
 class TestCharity(TestCase):
@@ -62,3 +75,136 @@ class TestHoldType(TestCase):
     def test_get_hold_type_new(self):
         hold = get_hold_type("New Hold")
         self.assertNotEqual(self.existing_hold, hold)
+
+
+class TestBadgeStatus(TestCase):
+    def setUp(self):
+        self.event = Event.objects.create(**DEFAULT_EVENT_ARGS)
+        self.attendee = Attendee.objects.create(**TEST_ATTENDEE_ARGS)
+        self.badge = Badge.objects.create(attendee=self.attendee, event=self.event)
+        self.level = PriceLevel.objects.create(
+            name="Attendee",
+            basePrice=Decimal(45),
+            startDate=now - ten_days,
+            endDate=now + ten_days,
+        )
+
+    def assertStatusMatches(self):
+        self.badge.refresh_from_db()
+        self.assertEqual(self.badge.statusEffectiveLevel, self.badge.effectiveLevel())
+        self.assertEqual(self.badge.statusPaidTotal, self.badge.paidTotal())
+        self.assertEqual(self.badge.statusAssociation, self.badge.abandoned)
+
+    def test_new_badge_is_abandoned(self):
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.ABANDONED)
+
+    def test_order_lifecycle(self):
+        order = Order.objects.create(
+            total=0, reference="STATUS1", billingType=Order.UNPAID
+        )
+        item = OrderItem.objects.create(
+            badge=self.badge, priceLevel=self.level, order=order, enteredBy="test"
+        )
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.UNPAID)
+
+        order.billingType = Order.CREDIT
+        order.total = Decimal(45)
+        order.save()
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.PAID)
+        self.assertEqual(self.badge.statusLevel, self.level)
+
+        item.delete()
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.ABANDONED)
+
+    def test_staff_association(self):
+        staff = Staff.objects.create(attendee=self.attendee, event=self.event)
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.STAFF)
+
+        staff.delete()
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.ABANDONED)
+
+    def test_with_status_matches_methods(self):
+        discount = Discount.objects.create(
+            codeName="STATUS",
+            amountOff=Decimal(5),
+            startDate=now,
+            endDate=now + ten_days,
+        )
+        cheap = PriceLevel.objects.create(
+            name="Cheap",
+            basePrice=Decimal(10),
+            startDate=now - ten_days,
+            endDate=now + ten_days,
+        )
+        order = Order.objects.create(
+            total=Decimal(50),
+            reference="STATUS2",
+            billingType=Order.CREDIT,
+            discount=discount,
+        )
+        OrderItem.objects.create(
+            badge=self.badge, priceLevel=cheap, order=order, enteredBy="test"
+        )
+        OrderItem.objects.create(
+            badge=self.badge, priceLevel=self.level, order=order, enteredBy="test"
+        )
+
+        badge = Badge.objects.with_status().get(pk=self.badge.pk)
+        self.assertEqual(badge.effective_level_id, badge.effectiveLevel().id)
+        self.assertEqual(badge.effective_level_name, str(badge.effectiveLevel()))
+        self.assertEqual(badge.paid_total, badge.paidTotal())
+        self.assertEqual(badge.discount_code, badge.getDiscount())
+        self.assertEqual(badge.association, badge.abandoned)
+
+        Staff.objects.create(attendee=self.attendee, event=self.event)
+        badge = Badge.objects.with_status().get(pk=self.badge.pk)
+        self.assertTrue(badge.is_staff)
+        self.assertEqual(badge.association, Badge.STAFF)
+
+    def test_with_status_unpaid(self):
+        order = Order.objects.create(
+            total=0, reference="STATUS3", billingType=Order.UNPAID
+        )
+        OrderItem.objects.create(
+            badge=self.badge, priceLevel=self.level, order=order, enteredBy="test"
+        )
+        badge = Badge.objects.with_status().get(pk=self.badge.pk)
+        self.assertEqual(badge.effective_level_name, Badge.UNPAID)
+        self.assertEqual(badge.discount_code, "")
+        self.assertEqual(badge.association, badge.abandoned)
+
+    def test_save_does_not_clobber_status(self):
+        stale = Badge.objects.get(pk=self.badge.pk)
+        Staff.objects.create(attendee=self.attendee, event=self.event)
+        stale.printed = True
+        stale.save()
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.STAFF)
+
+    def test_refresh_status_in_bulk(self):
+        order = Order.objects.create(
+            total=Decimal(45), reference="STATUS4", billingType=Order.CREDIT
+        )
+        badges = [self.badge] + [
+            Badge.objects.create(attendee=self.attendee, event=self.event)
+            for _ in range(2)
+        ]
+        # Skips the signals, leaving the stored status stale.
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(badge=badge, priceLevel=self.level, order=order)
+                for badge in badges
+            ]
+        )
+
+        with self.assertNumQueries(2):
+            self.assertEqual(Badge.objects.all().refresh_status(), 3)
+        self.assertStatusMatches()
+        self.assertEqual(self.badge.statusAssociation, Badge.PAID)
+        self.assertEqual(self.badge.statusLevel, self.level)
@@ -0,0 +1,88 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import jwt
+from django.test import SimpleTestCase, override_settings
+from paho.mqtt import client as paho
+
+from registration import mqtt
+
+BROKER = {
+    "host": "broker.example",
+    "port": 8883,
+    "tls": {"ca_certs": None, "insecure": True},
+}
+
+
+@override_settings(MQTT_JWT_SECRET="c2VjcmV0", MQTT_JWT_ALGORITHM="HS256")
+class TestMQTTPublisher(SimpleTestCase):
+    def setUp(self):
+        self.clients = []
+        self.publisher = mqtt.MQTTPublisher(
+            broker=BROKER, client_factory=self.make_client
+        )
+
+    def make_client(self, **kwargs):
+        client = MagicMock()
+        client.publish.return_value.rc = paho.MQTT_ERR_SUCCESS
+        self.clients.append(client)
+        return client
+
+    def publish(self, topic="apis/admin/test/refresh", payload="{}"):
+        self.assertTrue(self.publisher.publish(topic, payload))
+        self.assertTrue(self.publisher.flush())
+
+    def test_reuses_connection(self):
+        self.publish()
+        self.publish()
+
+        self.assertEqual(len(self.clients), 1)
+        client = self.clients[0]
+        client.connect.assert_called_once_with("broker.example", 8883, 60)
+        client.tls_insecure_set.assert_called_once_with(True)
+        self.assertEqual(client.publish.call_count, 2)
+        self.assertEqual(BROKER["tls"]["insecure"], True)
+
+    def test_token_covers_all_topics(self):
+        self.publish()
+        username, token = self.clients[0].username_pw_set.call_args[0]
+        claims = jwt.decode(token, b"secret", algorithms=["HS256"])
+
+        self.assertEqual(username, "apis_server")
+        self.assertEqual(claims["publ"], [f"apis/{t}/#" for t in mqtt.TOPICS])
+        self.assertLessEqual(claims["exp"], time.time() + mqtt.SERVER_TOKEN_LIFETIME)
+
+    @patch("registration.mqtt.time.sleep")
+    def test_reconnects_after_failure(self, mock_sleep):
+        self.publish()
+        self.clients[0].publish.return_value.rc = paho.MQTT_ERR_NO_CONN
+        self.publish()
+
+        self.assertEqual(len(self.clients), 2)
+        self.clients[0].disconnect.assert_called_once()
+        self.clients[1].publish.assert_called_once()
+
+    def test_reconnects_before_token_expires(self):
+        self.publish()
+        self.publisher._client_expires = time.time()
+        self.publish()
+
+        self.assertEqual(len(self.clients), 2)
+
+    @patch("registration.mqtt.MESSAGE_TTL", 0)
+    def test_drops_stale_messages(self):
+        self.publish()
+        self.assertEqual(self.clients, [])
+
+    def test_full_outbox_drops(self):
+        self.publisher._outbox.maxsize = 1
+        self.publisher._ensure_thread = lambda: None
+        self.assertTrue(self.publisher.publish("apis/admin/test/refresh", "{}"))
+        self.assertFalse(self.publisher.publish("apis/admin/test/refresh", "{}"))
+
+    def test_send_reports_dropped_messages(self):
+        with patch("registration.mqtt.publisher", self.publisher):
+            self.publisher._outbox.maxsize = 1
+            self.publisher._ensure_thread = lambda: None
+            self.assertTrue(mqtt.send_mqtt_message("apis/admin/test/refresh"))
+            self.assertFalse(mqtt.send_mqtt_message("apis/admin/test/refresh"))
@@ -1,10 +1,14 @@
+import time
 import uuid
 from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
+from registration import mqtt
 from registration.models import *
 from registration.tests.common import *
 from registration.views import onsite_admin
@@ -179,16 +183,18 @@ class TestOnsiteCart(OnsiteBaseTestCase):
         self.assertEqual(response.status_code, 200)
 
 
-@override_settings(**{
-    "MQTT_BROKER": {
-        "host": "localhost",
-        "port": 1883,
-    },
-    "MQTT_JWT_SECRET": "secret==",
-    "MQTT_JWT_ALGORITHM": "HS256",
-    "REGISTER_KEY": "",
-    "REGISTER_PRINTER_URI": "",
-})
+@override_settings(
+    **{
+        "MQTT_BROKER": {
+            "host": "localhost",
+            "port": 1883,
+        },
+        "MQTT_JWT_SECRET": "secret==",
+        "MQTT_JWT_ALGORITHM": "HS256",
+        "REGISTER_KEY": "",
+        "REGISTER_PRINTER_URI": "",
+    }
+)
 class TestOnsiteAdmin(OnsiteBaseTestCase):
     def test_onsite_login_required(self):
         self.client.logout()
@@ -255,10 +261,214 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()["results"]), 0)
 
+    def test_onsite_admin_search_query_count(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        url = reverse("registration:onsite_admin_search")
+
+        with CaptureQueriesContext(connection) as one_result:
+            response = self.client.get(url, {"search": "Onsite Badge 1"})
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertEqual(
+            response.json()["results"][0]["orderReference"],
+            Order.objects.get().reference,
+        )
+
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        with CaptureQueriesContext(connection) as two_results:
+            response = self.client.get(url, {"search": "Cameron Christian"})
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertEqual(len(one_result), len(two_results))
+
+    def test_build_result_query_count(self):
+        options = [
+            {"id": self.option_conbook.id, "value": "true"},
+            {"id": self.option_100_int.id, "value": "2"},
+        ]
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        self.add_to_cart(self.price_90, options)
+        self.checkout()
+        first, second = Badge.objects.order_by("pk")
+        Staff.objects.create(attendee=second.attendee, event=self.event)
+
+        with CaptureQueriesContext(connection) as one_badge:
+            result = onsite_admin.build_result([first.id])
+        self.assertEqual(result["subtotal"], Decimal("245.00"))
+
+        cart = [first.id, second.id, 0]
+        with CaptureQueriesContext(connection) as two_badges:
+            result = onsite_admin.build_result(cart)
+        self.assertEqual(cart, [first.id, second.id])
+        self.assertEqual(len(one_badge), len(two_badges) - 1)  # + staff lookup
+        self.assertEqual(result["subtotal"], Decimal("535.00"))
+        self.assertEqual(result["result"][1]["abandoned"], Badge.STAFF)
+        self.assertEqual(result["result"][1]["staff"], {"shirtSize": None})
+        self.assertEqual(result["result"][1]["effectiveLevel"]["name"], "Sponsor")
+        self.assertEqual(
+            [line["quantity"] for line in result["result"][0]["attendee_options"][0]],
+            [1, 2],
+        )
+
     @patch("registration.mqtt.send_mqtt_message")
-    def test_onsite_admin_cart_no_donations(
-        self, mock_send_mqtt_message
-    ):
+    def test_cart_updates(self, mock_send_mqtt_message):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        badge = Badge.objects.get()
+        badge.printed = True
+        badge.save()
+
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        session = self.client.session
+        session["terminal"] = self.terminal.id
+        session.save()
+
+        response = self.client.get(
+            reverse("registration:onsite_add_to_cart"), {"id": badge.id}
+        )
+        update = response.json()["update"]
+        self.assertIsNone(update["base"])
+        self.assertEqual(update["order"], [badge.id])
+        mock_send_mqtt_message.assert_any_call(
+            f"{mqtt.get_topic('admin', self.terminal.name)}/cart", update
+        )
+
+        # Fetching an unchanged cart doesn't make a new version or push it.
+        mock_send_mqtt_message.reset_mock()
+        response = self.client.get(reverse("registration:onsite_admin_cart"))
+        self.assertEqual(response.json()["version"], update["version"])
+        mock_send_mqtt_message.assert_not_called()
+
+        response = self.client.post(
+            f'{reverse("registration:onsite_print_clear")}?id={badge.id}'
+        )
+        print_update = response.json()["update"]
+        self.assertEqual(print_update["base"], update["version"])
+        self.assertEqual(print_update["changes"], {})
+        self.assertEqual(print_update["badges"], [{"id": badge.id, "printed": False}])
+
+        response = self.client.get(
+            reverse("registration:onsite_remove_from_cart"), {"id": badge.id}
+        )
+        remove_update = response.json()["update"]
+        self.assertEqual(remove_update["base"], print_update["version"])
+        self.assertEqual(remove_update["order"], [])
+        self.assertEqual(remove_update["changes"]["total"], 0)
+
+        # Losing the stored cart sends the whole cart, under a newer version.
+        cache.delete(onsite_admin.get_cart_state_key(self.terminal))
+        response = self.client.get(
+            reverse("registration:onsite_add_to_cart"), {"id": badge.id}
+        )
+        readd_update = response.json()["update"]
+        self.assertIsNone(readd_update["base"])
+        self.assertGreater(readd_update["version"], remove_update["version"])
+
+    @patch("registration.mqtt.send_mqtt_message")
+    def test_cart_poll_skips_session_write(self, mock_send_mqtt_message):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        self.client.get(reverse("registration:onsite_admin_cart"))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("registration:onsite_admin_cart"))
+        self.assertFalse(
+            [
+                q
+                for q in queries
+                if q["sql"].startswith("UPDATE") and "django_session" in q["sql"]
+            ]
+        )
+
+        # Close to expiring, the session is extended again.
+        session = self.client.session
+        session["heartbeat"] = time.time() - session.get_expiry_age()
+        session.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("registration:onsite_admin_cart"))
+        self.assertTrue(
+            [
+                q
+                for q in queries
+                if q["sql"].startswith("UPDATE") and "django_session" in q["sql"]
+            ]
+        )
+
+    @override_settings(ONSITE_SESSION_CACHE=True)
+    @patch("registration.mqtt.send_mqtt_message")
+    def test_onsite_state_in_cache(self, mock_send_mqtt_message):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        badge = Badge.objects.get()
+
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        self.client.get(reverse("registration:onsite_admin"))
+        response = self.client.get(
+            reverse("registration:onsite_add_to_cart"), {"id": badge.id}
+        )
+        self.assertEqual(response.json()["cart"], [badge.id])
+
+        self.assertNotIn("cart", self.client.session)
+        self.assertNotIn("terminal", self.client.session)
+        response = self.client.get(reverse("registration:onsite_admin_cart"))
+        self.assertEqual([b["id"] for b in response.json()["result"]], [badge.id])
+        self.assertIsNotNone(response.json()["version"])
+
+    def test_onsite_admin_search_orders_no_query(self):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        response = self.client.get(reverse("registration:onsite_admin_search_orders"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_onsite_admin_search_orders(self):
+        options = [{"id": self.option_conbook.id, "value": "true"}]
+        self.add_to_cart(self.price_45, options)
+        self.checkout()
+        order = Order.objects.get()
+
+        other_event = Event.objects.create(
+            **dict(DEFAULT_EVENT_ARGS, default=False, name="Some other event")
+        )
+        old_badge = Badge.objects.create(
+            attendee=Badge.objects.get().attendee, event=other_event
+        )
+        old_order = Order.objects.create(total=0, reference="OLDORDER")
+        OrderItem.objects.create(badge=old_badge, order=old_order, enteredBy="test")
+
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        url = reverse("registration:onsite_admin_search_orders")
+
+        response = self.client.get(url, {"search": order.reference[:4].lower()})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["reference"] for result in results], [order.reference])
+        self.assertEqual(results[0]["attendee"]["lastName"], "Christian")
+        self.assertFalse(response.json()["more"])
+
+        response = self.client.get(url, {"search": "Cameron Christian"})
+        self.assertEqual([r["id"] for r in response.json()["results"]], [order.id])
+
+        # First and partial names match too.
+        response = self.client.get(url, {"search": "Cameron"})
+        self.assertEqual([r["id"] for r in response.json()["results"]], [order.id])
+        response = self.client.get(url, {"search": "Christ"})
+        self.assertEqual([r["id"] for r in response.json()["results"]], [order.id])
+
+        response = self.client.get(url, {"search": "apis@mailinator.com"})
+        self.assertEqual([r["id"] for r in response.json()["results"]], [order.id])
+
+        response = self.client.get(url, {"search": "OLDORDER"})
+        self.assertEqual(response.json()["results"], [])
+
+        response = self.client.get(url, {"search": "Christian", "page": 2})
+        self.assertEqual(response.json()["results"], [])
+        self.assertEqual(response.json()["page"], 2)
+
+    @patch("registration.mqtt.send_mqtt_message")
+    def test_onsite_admin_cart_no_donations(self, mock_send_mqtt_message):
         # Stage registration
         options = [
             {"id": self.option_conbook.id, "value": "true"},
@@ -307,9 +517,7 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         )
 
     @patch("registration.mqtt.send_mqtt_message")
-    def test_onsite_set_terminal_status(
-        self, mock_send_mqtt_single
-    ):
+    def test_onsite_set_terminal_status(self, mock_send_mqtt_single):
         self.assertTrue(self.client.login(username="admin", password="admin"))
         response = self.client.get(
             reverse("registration:terminal_status"),
@@ -319,6 +527,17 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(mock_send_mqtt_single.call_count, 2)
 
+    @patch("registration.mqtt.send_mqtt_message", return_value=False)
+    def test_onsite_terminal_message_dropped(self, mock_send_mqtt_message):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        response = self.client.get(
+            reverse("registration:terminal_status"),
+            {"terminal": self.terminal.id, "status": "open"},
+        )
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(response.json()["success"])
+
     @patch("registration.mqtt.send_mqtt_message")
     def test_onsite_set_invalid_terminal_status(self, mock_send_mqtt_message):
         self.assertTrue(self.client.login(username="admin", password="admin"))
@@ -334,9 +553,7 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         mock_send_mqtt_message.assert_not_called()
 
     @patch("registration.mqtt.send_mqtt_message")
-    def test_onsite_terminal_dne(
-        self, mock_send_mqtt_message
-    ):
+    def test_onsite_terminal_dne(self, mock_send_mqtt_message):
         self.assertTrue(self.client.login(username="admin", password="admin"))
         response = self.client.get(
             reverse("registration:terminal_status"),
@@ -353,9 +570,7 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         mock_send_mqtt_message.assert_not_called()
 
     @patch("registration.mqtt.send_mqtt_message")
-    def test_onsite_terminal_bad_request(
-        self, mock_send_mqtt_message
-    ):
+    def test_onsite_terminal_bad_request(self, mock_send_mqtt_message):
         self.assertTrue(self.client.login(username="admin", password="admin"))
         response = self.client.get(
             reverse("registration:terminal_status"),
@@ -364,9 +579,7 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         message = response.json()
         self.assertEqual(response.status_code, 400)
         self.assertFalse(message["success"])
-        self.assertEqual(
-            message["reason"], "No terminal associated with request"
-        )
+        self.assertEqual(message["reason"], "No terminal associated with request")
         mock_send_mqtt_message.assert_not_called()
 
     @patch("registration.mqtt.send_mqtt_message")
@@ -438,9 +651,7 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
         self.assertEqual(self.terminal.token, new_token)
 
     @patch("registration.mqtt.send_mqtt_message")
-    def test_complete_cash_transaction(
-        self, mock_send_mqtt_message
-    ):
+    def test_complete_cash_transaction(self, mock_send_mqtt_message):
         self.test_onsite_admin_cart_no_donations()
         self.client.get(
             reverse("registration:onsite_admin"), {"terminal": self.terminal.name}
@@ -476,7 +687,10 @@ class TestOnsiteAdmin(OnsiteBaseTestCase):
             "paymentId": "JUNK",
         }
         response = self.client.post(
-            reverse("registration:complete_square_transaction"), json.dumps(args), content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {self.terminal.token}"
+            reverse("registration:complete_square_transaction"),
+            json.dumps(args),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {self.terminal.token}",
         )
         self.assertEqual(response.status_code, 200)
         message = response.json()
@@ -606,6 +820,7 @@ class TestDrawers(OnsiteBaseTestCase):
         self.assertTrue(message["success"])
         mock_send_mqtt_message.assert_called_once()
 
+
 class TestSearchFields(OnsiteBaseTestCase):
     def test_search_fields_parse(self):
         fields = onsite_admin.SearchFields.parse("")
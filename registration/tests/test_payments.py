@@ -0,0 +1,113 @@
+import threading
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase
+
+from registration import payments
+from registration.models import Order
+
+PAYMENT_ID = "R2B3Z8WMVt3EAmzYWLZvz7Y69EbZY"
+
+
+def square_response(body=None, errors=None):
+    response = MagicMock()
+    response.is_success.return_value = errors is None
+    response.body = body or {}
+    response.errors = errors
+    return response
+
+
+@patch("registration.payments.get_refund")
+@patch("registration.payments.payments_api.get_payment")
+class TestRefreshPayment(TestCase):
+    def setUp(self):
+        self.order = Order(
+            total=100,
+            billingType=Order.CREDIT,
+            status=Order.COMPLETED,
+            reference="REFRESH_1",
+            apiData={"payment": {"id": PAYMENT_ID}, "refunds": [{"id": "stored"}]},
+        )
+        self.order.save()
+
+    def payment(self, refund_ids):
+        return square_response(
+            {
+                "payment": {
+                    "id": PAYMENT_ID,
+                    "status": "COMPLETED",
+                    "total_money": {"amount": 10000, "currency": "USD"},
+                    "refunded_money": {"amount": 3000, "currency": "USD"},
+                    "refund_ids": refund_ids,
+                }
+            }
+        )
+
+    def test_refunds_fetched_concurrently(self, mock_get_payment, mock_get_refund):
+        mock_get_payment.return_value = self.payment(["first", "second"])
+        # Every lookup has to be in flight at once to get past the barrier.
+        barrier = threading.Barrier(3, timeout=5)
+
+        def get_refund(refund_id):
+            barrier.wait()
+            status = "COMPLETED" if refund_id == "stored" else "PENDING"
+            return square_response({"refund": {"id": refund_id, "status": status}})
+
+        mock_get_refund.side_effect = get_refund
+
+        self.assertEqual(payments.refresh_payment(self.order), (True, None))
+        self.assertEqual(mock_get_refund.call_count, 3)
+        self.order.refresh_from_db()
+        self.assertEqual(
+            [refund["id"] for refund in self.order.apiData["refunds"]],
+            ["first", "second", "stored"],
+        )
+        self.assertEqual(self.order.squareRefundIds, ["first", "second", "stored"])
+        self.assertEqual(self.order.total, Decimal("70.00"))
+
+    def test_refund_errors_reported(self, mock_get_payment, mock_get_refund):
+        mock_get_payment.return_value = self.payment(["first"])
+        error = {"category": "API_ERROR", "code": "NOT_FOUND", "detail": "Gone"}
+        mock_get_refund.side_effect = lambda refund_id: (
+            square_response(errors=[error])
+            if refund_id == "stored"
+            else square_response({"refund": {"id": refund_id, "status": "COMPLETED"}})
+        )
+
+        success, message = payments.refresh_payment(self.order)
+        self.assertFalse(success)
+        self.assertIn("NOT_FOUND: Gone", message)
+
+    @patch("registration.payments.SQUARE_REFUND_TIMEOUT", 0.1)
+    def test_refund_timeout(self, mock_get_payment, mock_get_refund):
+        mock_get_payment.return_value = self.payment([])
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def get_refund(refund_id):
+            release.wait(5)
+            return square_response({"refund": {"id": refund_id}})
+
+        mock_get_refund.side_effect = get_refund
+
+        success, message = payments.refresh_payment(self.order)
+        self.assertFalse(success)
+        self.assertIn("Timed out fetching refund stored", message)
+
+
+class TestSquareClients(TestCase):
+    def test_pool_threads_get_their_own_client(self):
+        clients = list(
+            payments.square_pool.map(lambda _: payments.get_thread_client(), range(2))
+        )
+        for thread_client in clients:
+            self.assertIsNot(thread_client, payments.client)
+            self.assertIsNot(
+                thread_client.config.http_client.session,
+                payments.client.config.http_client.session,
+            )
+
+        # A thread keeps using the client it made
+        here = payments.get_thread_client()
+        self.assertIs(payments.get_thread_client(), here)
@@ -0,0 +1,113 @@
+import json
+from decimal import Decimal
+
+from registration.models import *
+from registration.pricing import CartPricing, PriceCatalog, get_effective_levels
+from registration.tests.common import TEST_ATTENDEE_ARGS, OrdersTestCase
+from registration.views.ordering import get_total
+
+
+class TestCartPricing(OrdersTestCase):
+    def make_cart(self, priceLevel, options=()):
+        cart = Cart(
+            form=Cart.ATTENDEE,
+            formData=json.dumps(
+                {
+                    "attendee": self.attendee_form_1,
+                    "priceLevel": {"id": priceLevel.id, "options": list(options)},
+                    "event": self.event.name,
+                }
+            ),
+        )
+        cart.save()
+        return cart
+
+    def make_badge(self, priceLevel, billingType=Order.CREDIT):
+        attendee = Attendee(**TEST_ATTENDEE_ARGS)
+        attendee.save()
+        badge = Badge(attendee=attendee, event=self.event, badgeName="Priced")
+        badge.save()
+        order = Order(
+            total=priceLevel.basePrice,
+            reference=f"PRICE{badge.id}",
+            billingType=billingType,
+        )
+        order.save()
+        OrderItem(order=order, badge=badge, priceLevel=priceLevel).save()
+        return badge
+
+    def test_cart_totals(self):
+        carts = [
+            self.make_cart(
+                self.price_45, [{"id": self.option_conbook.id, "value": "true"}]
+            ),
+            self.make_cart(
+                self.price_150, [{"id": self.option_100_int.id, "value": "2"}]
+            ),
+            self.make_cart(
+                self.price_150, [{"id": self.option_100_int.id, "value": ""}]
+            ),
+        ]
+        pricing = CartPricing(carts, [], "FiveOff")
+
+        self.assertEqual(
+            [line.subtotal for line in pricing.lines],
+            [Decimal("45.00"), Decimal("350.00"), Decimal("150.00")],
+        )
+        self.assertEqual(pricing.total_discount, Decimal("15.00"))
+        self.assertEqual(pricing.total, Decimal("530.00"))
+        self.assertEqual(
+            get_total(carts, [], "FiveOff"), (pricing.total, pricing.total_discount)
+        )
+        self.assertEqual(
+            pricing.lines[1].option_lines(),
+            [{"name": "Something Pricy", "number": "2", "total": Decimal("200.00")}],
+        )
+        self.assertEqual(pricing.lines[2].option_lines(), [{}])
+
+    def test_cart_queries_do_not_grow_with_items(self):
+        carts = [self.make_cart(self.price_45) for _ in range(5)]
+        carts += [
+            self.make_cart(
+                self.price_150, [{"id": self.option_100_int.id, "value": "1"}]
+            )
+            for _ in range(5)
+        ]
+        # Price levels, options and the discount code
+        with self.assertNumQueries(3):
+            CartPricing(carts, [], "FiveOff").total
+
+    def test_unknown_level_raises(self):
+        catalog = PriceCatalog.load([self.price_45.id])
+        with self.assertRaises(PriceLevel.DoesNotExist):
+            catalog.level(self.price_90.id)
+
+    def test_order_item_upgrade_credits_effective_level(self):
+        badge = self.make_badge(self.price_45)
+        upgrade = OrderItem(badge=badge, priceLevel=self.price_90)
+        upgrade.save()
+
+        pricing = CartPricing([], OrderItem.objects.filter(pk=upgrade.pk))
+        self.assertEqual(pricing.lines[0].credit, self.price_45)
+        self.assertEqual(pricing.total, Decimal("45.00"))
+
+    def test_effective_levels_match_badge(self):
+        paid = self.make_badge(self.price_45)
+        OrderItem(order=paid.getOrder(), badge=paid, priceLevel=self.price_235).save()
+        unpaid = self.make_badge(self.price_90, billingType=Order.UNPAID)
+
+        levels = get_effective_levels([paid.id, unpaid.id])
+        self.assertEqual(levels[paid.id], paid.effectiveLevel())
+        self.assertEqual(levels[unpaid.id], Badge.UNPAID)
+        self.assertEqual(unpaid.effectiveLevel(), Badge.UNPAID)
+
+    def test_minimum_org_donation(self):
+        self.price_90.minimumOrgDonation = Decimal("20.00")
+        self.price_90.save()
+        carts = [self.make_cart(self.price_45), self.make_cart(self.price_90)]
+
+        self.assertEqual(CartPricing(carts).minimum_org_donation, Decimal("20.00"))
+
+        self.discount.waiveRequiredDonation = True
+        self.discount.save()
+        self.assertEqual(CartPricing(carts, [], "FiveOff").minimum_org_donation, 0)
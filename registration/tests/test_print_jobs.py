@@ -0,0 +1,231 @@
+import subprocess
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+import responses
+from django.contrib.auth.models import User
+from django.test import Client, TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from registration import mqtt, print_jobs
+from registration.models import (
+    Attendee,
+    Badge,
+    Event,
+    Firebase,
+    Order,
+    OrderItem,
+    PriceLevel,
+    PrintJob,
+)
+from registration.tests.common import DEFAULT_EVENT_ARGS, TEST_ATTENDEE_ARGS
+
+now = timezone.now()
+ten_days = timedelta(days=10)
+
+
+@override_settings(PRINT_JOBS=True, PRINT_RENDERER="wkhtmltopdf")
+@patch("registration.print_jobs.mqtt.send_mqtt_message")
+class TestPrintJobs(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser("admin", "admin@host", "admin")
+
+        self.event = Event(**DEFAULT_EVENT_ARGS)
+        self.event.save()
+
+        price_level = PriceLevel(
+            name="Attendee",
+            description="Hello",
+            basePrice=1.00,
+            startDate=now - ten_days,
+            endDate=now + ten_days,
+            public=True,
+        )
+        price_level.save()
+
+        order = Order(
+            total=100,
+            billingType=Order.CREDIT,
+            status=Order.COMPLETED,
+            reference="CREDIT_ORDER_1",
+        )
+        order.save()
+
+        self.attendee = Attendee(**TEST_ATTENDEE_ARGS)
+        self.attendee.save()
+
+        self.badge = Badge(event=self.event, attendee=self.attendee, badgeName="Fox")
+        self.badge.save()
+        OrderItem(order=order, badge=self.badge, priceLevel=price_level).save()
+
+        self.terminal = Firebase(token="test", name="Terminal 1")
+        self.terminal.save()
+
+        pdf_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_directory.cleanup)
+        pdf_settings = override_settings(PDF_DIRECTORY=pdf_directory.name)
+        pdf_settings.enable()
+        self.addCleanup(pdf_settings.disable)
+
+        self.client = Client()
+
+    def enqueue(self):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        session = self.client.session
+        session["terminal"] = self.terminal.id
+        session.save()
+
+        response = self.client.get(
+            reverse("registration:onsite_print_badges"), {"id": self.badge.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_enqueue_returns_job(self, mock_send_mqtt_message):
+        with patch("subprocess.check_call") as patched:
+            data = self.enqueue()
+        patched.assert_not_called()
+
+        job = PrintJob.objects.get()
+        self.assertEqual(data["job"]["id"], job.id)
+        self.assertEqual(data["job"]["status"], PrintJob.PENDING)
+        self.assertEqual(list(job.badges.all()), [self.badge])
+        self.assertEqual(job.terminal, self.terminal)
+        self.assertEqual(job.user, self.admin_user)
+
+        response = self.client.get(data["status_url"])
+        self.assertEqual(response.json()["job"]["status"], PrintJob.PENDING)
+
+    def test_worker_renders_and_notifies(self, mock_send_mqtt_message):
+        data = self.enqueue()
+        with patch("subprocess.check_call", return_value=0) as patched:
+            self.assertEqual(print_jobs.run_pending(), 1)
+        self.assertEqual(patched.call_count, 1)
+
+        job = PrintJob.objects.get()
+        self.assertEqual(job.status, PrintJob.COMPLETE)
+        self.assertTrue(job.file.startswith("badge-"))
+        self.badge.refresh_from_db()
+        self.assertTrue(self.badge.printed)
+
+        status = print_jobs.get_job_status(job)
+        self.assertTrue(status["file"].startswith("http://testserver/"))
+        mock_send_mqtt_message.assert_any_call(
+            f"{mqtt.get_topic('admin', self.terminal.name)}/print_job", status
+        )
+        response = self.client.get(data["status_url"])
+        self.assertEqual(response.json()["job"], status)
+
+    def test_dispatch_via_mqtt(self, mock_send_mqtt_message):
+        printer = Firebase(token="printer", name="Printer")
+        printer.save()
+        self.terminal.print_via_mqtt = printer
+        self.terminal.save()
+
+        self.enqueue()
+        with patch("subprocess.check_call", return_value=0):
+            print_jobs.run_pending()
+
+        job = PrintJob.objects.get()
+        mock_send_mqtt_message.assert_any_call(
+            f"{mqtt.get_topic('admin', printer.name)}/action",
+            {"action": "print", "url": print_jobs.get_job_url(job)},
+        )
+
+    @responses.activate
+    def test_dispatch_to_printer_url(self, mock_send_mqtt_message):
+        self.terminal.printer_url = "http://printer.local/print"
+        self.terminal.save()
+        responses.add(responses.POST, "http://printer.local/print", status=200)
+
+        self.enqueue()
+        with patch("subprocess.check_call", return_value=0):
+            print_jobs.run_pending()
+
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(
+            responses.calls[0].request.headers["Content-Type"], "application/pdf"
+        )
+        self.assertEqual(PrintJob.objects.get().status, PrintJob.COMPLETE)
+
+    @responses.activate
+    def test_printed_only_after_dispatch(self, mock_send_mqtt_message):
+        self.terminal.printer_url = "http://printer.local/print"
+        self.terminal.save()
+        responses.add(responses.POST, "http://printer.local/print", status=500)
+
+        self.enqueue()
+        with patch("subprocess.check_call", return_value=0):
+            print_jobs.run_pending()
+        self.assertEqual(PrintJob.objects.get().status, PrintJob.PENDING)
+        self.badge.refresh_from_db()
+        self.assertFalse(self.badge.printed)
+        self.assertEqual(self.badge.printCount, 0)
+
+        responses.replace(responses.POST, "http://printer.local/print", status=200)
+        PrintJob.objects.update(nextAttempt=timezone.now())
+        with patch("subprocess.check_call", return_value=0):
+            print_jobs.run_pending()
+        self.assertEqual(PrintJob.objects.get().status, PrintJob.COMPLETE)
+        self.badge.refresh_from_db()
+        self.assertTrue(self.badge.printed)
+        self.assertEqual(self.badge.printCount, 1)
+
+    def test_retries_then_fails(self, mock_send_mqtt_message):
+        self.enqueue()
+        error = subprocess.CalledProcessError(1, "wkhtmltopdf")
+        with patch("subprocess.check_call", side_effect=error):
+            print_jobs.run_pending()
+
+            job = PrintJob.objects.get()
+            self.assertEqual(job.status, PrintJob.PENDING)
+            self.assertEqual(job.attempts, 1)
+            self.assertGreater(job.nextAttempt, timezone.now())
+            # Not due yet
+            self.assertEqual(print_jobs.run_pending(), 0)
+
+            for _ in range(print_jobs.MAX_ATTEMPTS - 1):
+                PrintJob.objects.update(nextAttempt=timezone.now())
+                print_jobs.run_pending()
+
+        job = PrintJob.objects.get()
+        self.assertEqual(job.status, PrintJob.FAILED)
+        self.assertEqual(job.attempts, print_jobs.MAX_ATTEMPTS)
+        self.assertIn("wkhtmltopdf", job.error)
+        mock_send_mqtt_message.assert_called_once_with(
+            f"{mqtt.get_topic('admin', self.terminal.name)}/print_job",
+            print_jobs.get_job_status(job),
+        )
+
+    def test_stale_running_job_reclaimed(self, mock_send_mqtt_message):
+        self.enqueue()
+        job = print_jobs.claim_job()
+        self.assertIsNone(print_jobs.claim_job())
+
+        stale = timezone.now() - timedelta(seconds=print_jobs.STALE_AFTER + 1)
+        PrintJob.objects.filter(pk=job.pk).update(updated=stale)
+        self.assertEqual(print_jobs.claim_job(), job)
+
+    def test_admin_action_enqueues(self, mock_send_mqtt_message):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        with patch("subprocess.check_call") as patched:
+            response = self.client.post(
+                reverse("admin:registration_badge_changelist"),
+                {"action": "print_badges", "_selected_action": [self.badge.id]},
+            )
+        patched.assert_not_called()
+        self.assertEqual(response.status_code, 302)
+
+        job = PrintJob.objects.get()
+        self.assertIsNone(job.terminal)
+        self.assertEqual(list(job.badges.all()), [self.badge])
+
+    def test_unknown_job(self, mock_send_mqtt_message):
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        response = self.client.get(
+            reverse("registration:onsite_print_job", args=(1000,))
+        )
+        self.assertEqual(response.status_code, 404)
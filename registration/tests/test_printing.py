@@ -1,4 +1,6 @@
+import glob
 import os
+import subprocess
 from unittest import TestCase
 from unittest.mock import patch
 
@@ -63,6 +65,24 @@ class TestNametag(TestCase):
             )
             self.assertIn(f"""<span class="pull-left">{tag['level']}</span>""", result)
 
+    def test_config_and_template_cached(self) -> None:
+        printing.clear_caches()
+        self.assertIs(
+            self.nametags.read_config(self.default_theme),
+            self.nametags.read_config(self.default_theme),
+        )
+        self.assertIs(
+            self.nametags.get_template(self.default_theme),
+            self.nametags.get_template(self.default_theme),
+        )
+
+    def test_compiled_template(self) -> None:
+        compiled = printing.CompiledTemplate("<b>%name%</b> %LEVEL%/%Level% %OTHER%")
+        result = compiled.render({"NAME": "%LEVEL%", "LEVEL": "Sponsor"})
+        self.assertEqual(result, "<b>%LEVEL%</b> Sponsor/Sponsor %OTHER%")
+        self.assertFalse(compiled.uses_clock)
+        self.assertTrue(printing.CompiledTemplate("Printed %date%").uses_clock)
+
 
 class TestMain(TestCase):
     def setUp(self) -> None:
@@ -84,6 +104,38 @@ class TestMain(TestCase):
         self.assertEqual(args[-1], pdf)
         self.printing.cleanup()
 
+    def temp_html(self):
+        path = printing.Nametag()._get_template_path("apis", printing.NAMETAGS)
+        return set(glob.glob(os.path.join(path, "tmp*.html")))
+
+    def test_nametags_removes_html(self) -> None:
+        before = self.temp_html()
+        with patch("subprocess.check_call", return_value=0) as patched:
+            self.printing.nametags(TAGS)
+        html = patched.call_args[0][0][-3:-1]
+        self.assertEqual(len(html), 2)
+        for name in html:
+            self.assertFalse(os.path.exists(name))
+        self.assertEqual(self.temp_html(), before)
+        self.printing.cleanup()
+
+    def test_nametags_removes_html_on_failure(self) -> None:
+        before = self.temp_html()
+        error = subprocess.CalledProcessError(1, printing.WKHTMLTOPDF)
+        with patch("subprocess.check_call", side_effect=error):
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.printing.nametags(TAGS)
+        self.assertEqual(self.temp_html(), before)
+
+    def test_arguments_not_shared(self) -> None:
+        with patch("subprocess.check_call", return_value=0) as patched:
+            self.printing.nametags(TAGS)
+            self.printing.cleanup()
+            self.printing.nametags(TAGS)
+        first, second = (c[0][0] for c in patched.call_args_list)
+        self.assertEqual(len(first), len(second))
+        self.printing.cleanup()
+
     def test_nametags(self) -> None:
         with patch("subprocess.check_call", return_value=0) as patched:
             pdf = self.printing.nametags(TAGS)
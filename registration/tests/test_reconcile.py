@@ -0,0 +1,307 @@
+import copy
+import csv
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+import responses
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from registration import payments
+from registration.models import Order
+
+BASE_URL = payments.client.config.get_base_uri()
+
+# Recorded list responses, keyed by endpoint and then by request cursor.
+RECORDING = {
+    "/v2/payments": {
+        None: {
+            "payments": [
+                {
+                    "id": "PAYMENT_A",
+                    "status": "COMPLETED",
+                    "reference_id": "ORDER_A",
+                    "total_money": {"amount": 5000, "currency": "USD"},
+                },
+                {
+                    "id": "PAYMENT_B",
+                    "status": "COMPLETED",
+                    "reference_id": "ORDER_B",
+                    "total_money": {"amount": 2500, "currency": "USD"},
+                },
+            ],
+            "cursor": "payments-2",
+        },
+        "payments-2": {
+            "payments": [
+                {
+                    "id": "PAYMENT_C",
+                    "status": "COMPLETED",
+                    "reference_id": "ORDER_C",
+                    "total_money": {"amount": 9000, "currency": "USD"},
+                },
+                {
+                    "id": "PAYMENT_ORPHAN",
+                    "status": "COMPLETED",
+                    "reference_id": "NOT_AN_ORDER",
+                    "total_money": {"amount": 100, "currency": "USD"},
+                },
+            ],
+        },
+    },
+    "/v2/refunds": {
+        None: {
+            "refunds": [
+                {
+                    "id": "REFUND_C",
+                    "payment_id": "PAYMENT_C",
+                    "status": "COMPLETED",
+                    "amount_money": {"amount": 1000, "currency": "USD"},
+                },
+                {
+                    "id": "REFUND_ORPHAN",
+                    "payment_id": "PAYMENT_ELSEWHERE",
+                    "status": "COMPLETED",
+                    "amount_money": {"amount": 100, "currency": "USD"},
+                },
+            ],
+        },
+    },
+}
+
+
+class SquareStandIn:
+    """Serves RECORDING for Square's list endpoints, noting each request."""
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.requests = []
+        self.fail = set()
+
+    def __call__(self, request):
+        url = urlparse(request.url)
+        cursor = parse_qs(url.query).get("cursor", [None])[0]
+        self.requests.append((url.path, cursor))
+        if (url.path, cursor) in self.fail:
+            body = {
+                "errors": [
+                    {
+                        "category": "API_ERROR",
+                        "code": "INTERNAL_SERVER_ERROR",
+                        "detail": "Down",
+                    }
+                ]
+            }
+            return 500, {}, json.dumps(body)
+        return 200, {}, json.dumps(self.recording[url.path][cursor])
+
+    def install(self, mock):
+        for path in self.recording:
+            mock.add_callback(
+                responses.GET,
+                BASE_URL + path,
+                callback=self,
+                content_type="application/json",
+            )
+
+
+class TestReconcileSquare(TestCase):
+    def setUp(self):
+        self.order_a = self.add_order(
+            "ORDER_A", "50.00", Order.CAPTURED, payment_id="PAYMENT_A"
+        )
+        # Paid, but the payment was never stored on the order
+        self.order_b = self.add_order("ORDER_B", "25.00", Order.FAILED)
+        self.order_c = self.add_order(
+            "ORDER_C", "90.00", Order.COMPLETED, payment_id="PAYMENT_C"
+        )
+        self.order_missing = self.add_order(
+            "ORDER_MISSING", "10.00", Order.COMPLETED, payment_id="PAYMENT_GONE"
+        )
+
+        self.begin = timezone.now() - timezone.timedelta(days=1)
+        self.end = timezone.now() + timezone.timedelta(days=1)
+
+        self.square = SquareStandIn(RECORDING)
+        self.mock = responses.RequestsMock(assert_all_requests_are_fired=False)
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.addCleanup(self.mock.reset)
+        self.square.install(self.mock)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.report_path = os.path.join(self.directory.name, "report.csv")
+        self.state_path = os.path.join(self.directory.name, "state.json")
+
+    def add_order(self, reference, total, status, payment_id=None):
+        order = Order(
+            total=total,
+            billingType=Order.CREDIT,
+            status=status,
+            reference=reference,
+            apiData={"payment": {"id": payment_id}} if payment_id else None,
+        )
+        order.save()
+        return order
+
+    def reconcile(self, *args, end=None):
+        call_command(
+            "reconcile_square",
+            self.begin.isoformat(),
+            (end or self.end).isoformat(),
+            "--report",
+            self.report_path,
+            "--page-size",
+            "2",
+            *args,
+            stderr=io.StringIO(),
+        )
+        with open(self.report_path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def by_kind(self, report):
+        rows = {}
+        for row in report:
+            rows.setdefault(row["kind"], []).append(row)
+        return rows
+
+    def test_reconcile(self):
+        rows = self.by_kind(self.reconcile())
+
+        self.order_a.refresh_from_db()
+        self.assertEqual(self.order_a.status, Order.COMPLETED)
+        self.order_b.refresh_from_db()
+        self.assertEqual(self.order_b.status, Order.COMPLETED)
+        self.order_c.refresh_from_db()
+        self.assertEqual(self.order_c.status, Order.REFUNDED)
+        self.assertEqual(self.order_c.squareRefundIds, ["REFUND_C"])
+        self.assertEqual(self.order_c.apiData["refunds"][0]["id"], "REFUND_C")
+
+        self.assertEqual(
+            sorted(row["reference"] for row in rows["status"]),
+            ["ORDER_A", "ORDER_B", "ORDER_C"],
+        )
+        self.assertEqual(
+            [row["payment"] for row in rows["orphan_payment"]], ["PAYMENT_ORPHAN"]
+        )
+        self.assertEqual(
+            [row["refund"] for row in rows["orphan_refund"]], ["REFUND_ORPHAN"]
+        )
+        self.assertEqual(
+            [row["reference"] for row in rows["missing"]], ["ORDER_MISSING"]
+        )
+        self.assertNotIn("total_mismatch", rows)
+        self.assertFalse(os.path.exists(self.state_path))
+        self.assertIsNotNone(self.order_a.reconciledDate)
+        self.order_missing.refresh_from_db()
+        self.assertIsNone(self.order_missing.reconciledDate)
+
+        # Pages were fetched in order, once each
+        self.assertEqual(
+            self.square.requests,
+            [
+                ("/v2/payments", None),
+                ("/v2/payments", "payments-2"),
+                ("/v2/refunds", None),
+            ],
+        )
+
+    def test_earlier_failed_attempt(self):
+        recording = copy.deepcopy(RECORDING)
+        recording["/v2/payments"][None]["payments"].insert(
+            0,
+            {
+                "id": "PAYMENT_A_DECLINED",
+                "status": "FAILED",
+                "reference_id": "ORDER_A",
+                "total_money": {"amount": 5000, "currency": "USD"},
+            },
+        )
+        self.square.recording = recording
+        rows = self.by_kind(self.reconcile())
+
+        self.order_a.refresh_from_db()
+        self.assertEqual(self.order_a.status, Order.COMPLETED)
+        self.assertNotIn(
+            "PAYMENT_A_DECLINED", [row["payment"] for row in rows["status"]]
+        )
+
+    def test_serialized_api_data_kept(self):
+        Order.objects.filter(pk=self.order_c.pk).update(
+            apiData=json.dumps({"payment": {"id": "PAYMENT_C"}})
+        )
+        self.reconcile()
+
+        self.order_c.refresh_from_db()
+        self.assertEqual(self.order_c.apiData["payment"]["id"], "PAYMENT_C")
+        self.assertEqual(self.order_c.squarePaymentId, "PAYMENT_C")
+        self.assertEqual(self.order_c.squareRefundIds, ["REFUND_C"])
+
+    def test_total_mismatch(self):
+        Order.objects.filter(pk=self.order_a.pk).update(total=Decimal("40.00"))
+        rows = self.by_kind(self.reconcile())
+        self.assertEqual(
+            [(row["reference"], row["detail"]) for row in rows["total_mismatch"]],
+            [("ORDER_A", "order 40.00, Square 50.00")],
+        )
+
+    def test_dry_run(self):
+        rows = self.by_kind(self.reconcile("--dry-run"))
+        self.assertEqual(len(rows["status"]), 3)
+        self.assertEqual(
+            [row["reference"] for row in rows["missing"]], ["ORDER_MISSING"]
+        )
+        self.order_a.refresh_from_db()
+        self.assertEqual(self.order_a.status, Order.CAPTURED)
+        self.assertIsNone(self.order_a.reconciledDate)
+
+    def test_earlier_runs_dont_count(self):
+        # Matched by a previous run, but Square no longer has the payment
+        Order.objects.filter(pk=self.order_missing.pk).update(
+            reconciledDate=timezone.now() - timezone.timedelta(days=1)
+        )
+        rows = self.by_kind(self.reconcile())
+        self.assertEqual(
+            [row["reference"] for row in rows["missing"]], ["ORDER_MISSING"]
+        )
+
+    def test_resume(self):
+        self.square.fail.add(("/v2/payments", "payments-2"))
+        with self.assertRaises(CommandError):
+            self.reconcile("--state", self.state_path)
+
+        # The first page was applied and the cursor for the next one saved
+        self.order_a.refresh_from_db()
+        self.assertEqual(self.order_a.status, Order.COMPLETED)
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.assertEqual(state["phase"], "payments")
+        self.assertEqual(state["cursor"], "payments-2")
+        self.assertEqual(state["begin"], self.begin.isoformat())
+        self.assertNotIn("matched", state)
+
+        # A different range doesn't pick up this run's progress
+        with self.assertRaisesMessage(CommandError, "different run"):
+            self.reconcile(
+                "--state", self.state_path, end=self.end + timezone.timedelta(days=1)
+            )
+
+        self.square.fail.clear()
+        self.square.requests.clear()
+        rows = self.by_kind(self.reconcile("--state", self.state_path))
+
+        self.assertEqual(self.square.requests[0], ("/v2/payments", "payments-2"))
+        self.assertNotIn(("/v2/payments", None), self.square.requests)
+        # Orders matched before the interruption aren't reported missing
+        self.assertEqual(
+            [row["reference"] for row in rows["missing"]], ["ORDER_MISSING"]
+        )
+        self.order_c.refresh_from_db()
+        self.assertEqual(self.order_c.status, Order.REFUNDED)
+        self.assertFalse(os.path.exists(self.state_path))
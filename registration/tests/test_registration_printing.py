@@ -1,18 +1,22 @@
+import os
+import tempfile
+import time
 from contextlib import contextmanager
 from datetime import timedelta
 from pathlib import Path
 from unittest.mock import patch
 from urllib.parse import urlparse
 
+import httpx
+import respx
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.test import Client, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
-import httpx
-import respx
 
+from registration import pdf_cache
 from registration.models import (
     Attendee,
     Badge,
@@ -23,6 +27,7 @@ from registration.models import (
     PriceLevel,
 )
 from registration.tests.common import DEFAULT_EVENT_ARGS, TEST_ATTENDEE_ARGS
+from registration.views import printing
 
 now = timezone.now()
 ten_days = timedelta(days=10)
@@ -98,6 +103,14 @@ class TestRegistrationPrinting(TestCase):
 
         self.client = Client()
 
+        # Keep rendered and cached PDFs out of the shared directory.
+        pdf_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_directory.cleanup)
+        self.pdf_directory = Path(pdf_directory.name)
+        pdf_settings = override_settings(PDF_DIRECTORY=pdf_directory.name)
+        pdf_settings.enable()
+        self.addCleanup(pdf_settings.disable)
+
     def _badge_generates_pdf(self) -> dict:
         self.assertTrue(self.client.login(username="admin", password="admin"))
 
@@ -121,17 +134,135 @@ class TestRegistrationPrinting(TestCase):
         with patch("subprocess.check_call", return_value=0) as patched:
             data = self._badge_generates_pdf()
         self.assertEqual(patched.call_count, 1)
-        args = patched.call_args[0][0]
-        # Last argument is always the filename with path
-        arg_filename = Path(args[-1]).name
+        # The rendered file is moved into the cache under its content hash
         response_filename = urlparse(data["file"]).query.removeprefix("file=")
-        self.assertEqual(arg_filename, response_filename)
+        self.assertTrue(response_filename.startswith("badge-"))
+        self.assertTrue((self.pdf_directory / response_filename).is_file())
         # wkhtmltopdf responses return a direct path to the file
         self.assertIn("?file=", data["file"])
 
+    @override_settings(PRINT_RENDERER="wkhtmltopdf")
+    def test_reprint_wkhtmltopdf_is_cached(self):
+        with patch("subprocess.check_call", return_value=0) as patched:
+            first = self._badge_generates_pdf()
+            second = self._badge_generates_pdf()
+            self.assertEqual(patched.call_count, 1)
+            self.assertEqual(first["file"], second["file"])
+
+            self.badge.badgeName = "Renamed"
+            self.badge.save()
+            third = self._badge_generates_pdf()
+            self.assertEqual(patched.call_count, 2)
+            self.assertNotEqual(first["file"], third["file"])
+
+    @override_settings(PRINT_RENDERER="wkhtmltopdf")
+    def test_reprint_with_time_is_rendered(self):
+        with (
+            patch("subprocess.check_call", return_value=0) as patched,
+            patch("registration.printing.Nametag.uses_clock", return_value=True),
+        ):
+            first = self._badge_generates_pdf()
+            second = self._badge_generates_pdf()
+            self.assertEqual(patched.call_count, 2)
+        self.assertNotEqual(first["file"], second["file"])
+        self.assertEqual(list(self.pdf_directory.glob("badge-*.pdf")), [])
+
     def test_print_gotenberg(self):
         settings.PRINT_RENDERER = "gotenberg"
         with patch_gotenberg(hasattr(settings, "GOTENBERG_HOST")):
             data = self._badge_generates_pdf()
         # gotenberg responses return a signed data parameter with badge IDs
         self.assertIn("?data=", data["file"])
+
+    @override_settings(
+        PRINT_RENDERER="gotenberg", GOTENBERG_HOST="https://localhost:9125"
+    )
+    def test_print_gotenberg_marks_printed(self):
+        with respx.mock:
+            convert_route = respx.post(
+                "https://localhost:9125/forms/chromium/convert/html"
+            ).mock(return_value=httpx.Response(200, content=b"%PDF-1.4"))
+            self._badge_generates_pdf()
+            self._badge_generates_pdf()
+
+        # The reprint is served from the cache
+        self.assertEqual(convert_route.call_count, 1)
+        self.badge.refresh_from_db()
+        self.assertTrue(self.badge.printed)
+        self.assertEqual(self.badge.printCount, 2)
+
+    def test_compile_badge_template_cached(self):
+        template = printing.compile_badge_template(
+            self.badge_template.id, self.badge_template.template
+        )
+        self.assertIs(
+            printing.compile_badge_template(
+                self.badge_template.id, self.badge_template.template
+            ),
+            template,
+        )
+        self.assertIsNot(
+            printing.compile_badge_template(self.badge_template.id, "{{ badges }}"),
+            template,
+        )
+
+
+class TestServePDF(TestCase):
+    def setUp(self):
+        pdf_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_directory.cleanup)
+        pdf_settings = override_settings(PDF_DIRECTORY=pdf_directory.name)
+        pdf_settings.enable()
+        self.addCleanup(pdf_settings.disable)
+
+        self.content = b"%PDF-1.4 0123456789"
+        self.key = pdf_cache.get_key("apis", "1", [{"name": "Test"}])
+        self.path = pdf_cache.store(self.key, self.content)
+        self.url = reverse("registration:pdf") + f"?file={self.path.name}"
+        self.client = Client()
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["ETag"], f'"{self.key}"')
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.key}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=9-12")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b"0123")
+        self.assertEqual(response["Content-Range"], f"bytes 9-12/{len(self.content)}")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(response.content, b"789")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_range_mismatch_sends_everything(self):
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-3", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_file(self):
+        response = self.client.get(reverse("registration:pdf") + "?file=nope.pdf")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PDF_CACHE_MAX_BYTES=30)
+    def test_prune_by_size(self):
+        stale = time.time() - 60
+        os.utime(self.path, (stale, stale))
+        other = pdf_cache.get_key("apis", "1", [{"name": "Other"}])
+        pdf_cache.store(other, self.content)
+        self.assertIsNone(pdf_cache.lookup(self.key))
+        self.assertIsNotNone(pdf_cache.lookup(other))
+
+    @override_settings(PDF_CACHE_TTL=-1)
+    def test_expired(self):
+        self.assertIsNone(pdf_cache.lookup(self.key))
+        self.assertFalse(self.path.exists())
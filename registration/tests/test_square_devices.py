@@ -0,0 +1,89 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from registration import square_devices
+from registration.models import SquareDevice
+
+
+def device(device_id, name, device_type="TERMINAL_API"):
+    return {"id": device_id, "attributes": {"name": name, "type": device_type}}
+
+
+DEVICES = [device("device:1", "Front desk"), device("device:2", "Ops")]
+
+
+@patch("registration.square_devices.run_in_background", lambda function: function())
+@patch("registration.payments.get_terminals", return_value=DEVICES)
+class TestSquareDevices(TestCase):
+    def setUp(self):
+        cache.delete(square_devices.CACHE_KEY)
+        cache.delete(square_devices.REFRESH_LOCK_KEY)
+        self.addCleanup(cache.delete, square_devices.CACHE_KEY)
+
+    def test_sync_writes_only_changes(self, mock_get_terminals):
+        SquareDevice.objects.create(
+            device_id="device:1", name="Front desk", device_type="TERMINAL_API"
+        )
+        SquareDevice.objects.create(
+            device_id="device:2", name="Old name", device_type="TERMINAL_API"
+        )
+        SquareDevice.objects.create(
+            device_id="device:3", name="Retired", device_type="TERMINAL_API"
+        )
+
+        counts = square_devices.sync(DEVICES + [device("device:4", "New")])
+        self.assertEqual(counts, (1, 1, 1))
+        self.assertEqual(
+            dict(SquareDevice.objects.values_list("device_id", "name")),
+            {"device:1": "Front desk", "device:2": "Ops", "device:4": "New"},
+        )
+
+        # Nothing changed, so nothing is written
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                square_devices.sync(DEVICES + [device("device:4", "New")]), (0, 0, 0)
+            )
+
+    def test_cached(self, mock_get_terminals):
+        self.assertEqual(square_devices.get_devices(), DEVICES)
+        self.assertEqual(SquareDevice.objects.count(), 2)
+        self.assertEqual(square_devices.get_devices(), DEVICES)
+        mock_get_terminals.assert_called_once()
+
+    def test_stale_refreshed_in_background(self, mock_get_terminals):
+        stale = time.time() - square_devices.REFRESH_AFTER - 1
+        cache.set(square_devices.CACHE_KEY, {"devices": [], "fetched": stale})
+
+        # The stale copy is returned; the refresh updates the cache and table.
+        self.assertEqual(square_devices.get_devices(), [])
+        mock_get_terminals.assert_called_once()
+        self.assertEqual(square_devices.get_inventory()["devices"], DEVICES)
+        self.assertEqual(SquareDevice.objects.count(), 2)
+        self.assertIsNone(cache.get(square_devices.REFRESH_LOCK_KEY))
+
+    def test_one_refresh_at_a_time(self, mock_get_terminals):
+        cache.add(square_devices.REFRESH_LOCK_KEY, True)
+        self.assertFalse(square_devices.refresh_if_stale())
+        mock_get_terminals.assert_not_called()
+
+    def test_admin_sync(self, mock_get_terminals):
+        User.objects.create_superuser("admin", "admin@host", "admin")
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        SquareDevice.objects.create(
+            device_id="device:3", name="Retired", device_type="TERMINAL_API"
+        )
+
+        response = self.client.get(
+            reverse("admin:registration_squaredevice_changelist") + "sync/"
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(SquareDevice.objects.values_list("device_id", flat=True)),
+            ["device:1", "device:2"],
+        )
+        mock_get_terminals.assert_called_once()
@@ -1,10 +1,15 @@
 import json
+import uuid
+from decimal import Decimal
 from unittest.mock import patch
 
+from django.contrib.auth.models import User
 from django.test import TestCase, tag
 from django.test.utils import override_settings
 from django.urls import reverse
+from django.utils import timezone
 
+from registration import payments, webhooks
 from registration.models import (
     Attendee,
     Badge,
@@ -122,7 +127,11 @@ class TestSquareRefundWebhooks(TestCase):
             HTTP_X_SQUARE_HMACSHA256_SIGNATURE=self.SHA256_SIGNATURE,
         )
 
-        self.assertTrue(response.status_code, 409)
+        # Acknowledged, so Square doesn't retry, but stored only once.
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            PaymentWebhookNotification.objects.filter(event_id=self.EVENT_ID).count(), 1
+        )
 
 
 class TestSquareDisputeWebhookCreate(TestCase):
@@ -301,3 +310,237 @@ class TestSquareDisputeWebhookCreate(TestCase):
         self.assertTrue(response.status_code, 200)
         webhook = PaymentWebhookNotification.objects.get(event_id=self.EVENT_ID)
         self.assertFalse(webhook.processed)
+
+
+class TestOrderSquareIds(TestCase):
+    PAYMENT_ID = "HH2sTvwhwFGq0Ivi4uBRvFJt55ZZY"
+    REFUND_ID = "HH2sTvwhwFGq0Ivi4uBRvFJt55ZZY_refund"
+
+    def setUp(self):
+        self.order = Order(
+            total="90.00",
+            status=Order.COMPLETED,
+            reference="SQUAREIDS",
+            apiData={"payment": {"id": self.PAYMENT_ID}, "refunds": []},
+        )
+        self.order.save()
+
+    def refund_created(self, status="COMPLETED"):
+        refund = {
+            "id": self.REFUND_ID,
+            "payment_id": self.PAYMENT_ID,
+            "status": status,
+            "amount_money": {"amount": 1000, "currency": "USD"},
+        }
+        notification = PaymentWebhookNotification(
+            body={"data": {"id": self.REFUND_ID, "object": {"refund": refund}}}
+        )
+        return payments.process_webhook_refund_created(notification)
+
+    def test_ids_set_on_save(self):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.squarePaymentId, self.PAYMENT_ID)
+        self.assertEqual(self.order.squareRefundIds, [])
+
+        self.order.apiData["refunds"].append({"id": self.REFUND_ID})
+        self.order.save(update_fields=["apiData"])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.squareRefundIds, [self.REFUND_ID])
+
+    def test_ids_from_serialized_api_data(self):
+        self.order.apiData = json.dumps({"payment": {"id": "CASH_PAYMENT"}})
+        self.order.save()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.squarePaymentId, "CASH_PAYMENT")
+
+    def test_ids_cleared(self):
+        self.order.apiData = None
+        self.order.save()
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.squarePaymentId)
+        self.assertEqual(self.order.squareRefundIds, [])
+
+    def test_refund_webhooks_use_ids(self):
+        self.assertTrue(self.refund_created(status="PENDING"))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.REFUND_PENDING)
+        self.assertEqual(self.order.squareRefundIds, [self.REFUND_ID])
+
+        # Replayed notifications don't refund twice
+        self.assertTrue(self.refund_created(status="PENDING"))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal("80.00"))
+
+        refund = dict(self.order.apiData["refunds"][0], status="COMPLETED")
+        notification = PaymentWebhookNotification(
+            body={"data": {"id": self.REFUND_ID, "object": {"refund": refund}}}
+        )
+        self.assertTrue(payments.process_webhook_refund_update(notification))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.REFUNDED)
+
+
+@override_settings(WEBHOOK_QUEUE=True)
+class TestWebhookQueue(TestCase):
+    PAYMENT_ID = "HH2sTvwhwFGq0Ivi4uBRvFJt55ZZY"
+    REFUND_ID = "HH2sTvwhwFGq0Ivi4uBRvFJt55ZZY_refund"
+
+    def setUp(self):
+        self.order = Order(
+            total="90.00",
+            status=Order.COMPLETED,
+            reference="WEBHOOKQUEUE",
+            apiData={"payment": {"id": self.PAYMENT_ID}, "refunds": []},
+        )
+        self.order.save()
+
+    def add_refund_notification(self, event_type, status):
+        refund = {
+            "id": self.REFUND_ID,
+            "payment_id": self.PAYMENT_ID,
+            "status": status,
+            "amount_money": {"amount": 1000, "currency": "USD"},
+        }
+        body = {
+            "type": event_type,
+            "event_id": str(uuid.uuid4()),
+            "data": {
+                "type": "refund",
+                "id": self.REFUND_ID,
+                "object": {"refund": refund},
+            },
+        }
+        notification = PaymentWebhookNotification(
+            event_id=body["event_id"],
+            event_type=event_type,
+            body=body,
+            headers={},
+            paymentId=webhooks.get_payment_id(body),
+        )
+        notification.save()
+        return notification
+
+    @override_settings(
+        SQUARE_WEBHOOK_SIGNATURE_KEY=TestSquareRefundWebhooks.SIGNATURE_KEY
+    )
+    @patch("django.http.request.HttpRequest.build_absolute_uri")
+    def test_ingest_defers_processing(self, mock_build_absolute_uri):
+        mock_build_absolute_uri.return_value = TestSquareRefundWebhooks.NOTIFICATION_URL
+        with patch("registration.webhooks.process") as patched:
+            response = self.client.post(
+                reverse("registration:square_webhook"),
+                TestSquareRefundWebhooks.WEBHOOK_BODY,
+                content_type="application/json",
+                HTTP_X_SQUARE_HMACSHA256_SIGNATURE=TestSquareRefundWebhooks.SHA256_SIGNATURE,
+            )
+        patched.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+        notification = PaymentWebhookNotification.objects.get()
+        self.assertFalse(notification.processed)
+        self.assertEqual(notification.paymentId, self.PAYMENT_ID)
+        self.assertIn(notification, webhooks.get_due())
+
+    def test_processed_in_order(self):
+        created = self.add_refund_notification("refund.created", "PENDING")
+        updated = self.add_refund_notification("refund.updated", "COMPLETED")
+
+        self.assertEqual(webhooks.run_pending(), 2)
+        created.refresh_from_db()
+        updated.refresh_from_db()
+        self.assertTrue(created.processed)
+        self.assertTrue(updated.processed)
+        self.assertIsNotNone(updated.processedAt)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.REFUNDED)
+        self.assertEqual(self.order.total, Decimal("80.00"))
+
+    def test_later_notifications_wait_for_retry(self):
+        Order.objects.filter(pk=self.order.pk).update(squarePaymentId=None)
+        created = self.add_refund_notification("refund.created", "PENDING")
+        updated = self.add_refund_notification("refund.updated", "COMPLETED")
+
+        self.assertEqual(webhooks.run_pending(), 1)
+        created.refresh_from_db()
+        self.assertFalse(created.processed)
+        self.assertEqual(created.attempts, 1)
+        self.assertGreater(created.nextAttempt, timezone.now())
+        self.assertTrue(created.error)
+        # The refund update is due but held behind the failed refund
+        self.assertEqual(list(webhooks.get_due()), [])
+        self.assertEqual(webhooks.run_pending(), 0)
+
+        self.order.save()
+        PaymentWebhookNotification.objects.filter(pk=created.pk).update(
+            nextAttempt=timezone.now()
+        )
+        self.assertEqual(webhooks.run_pending(), 2)
+        updated.refresh_from_db()
+        self.assertTrue(updated.processed)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.REFUNDED)
+
+    def test_unhandled_types_skipped(self):
+        body = {
+            "type": "payment.created",
+            "event_id": str(uuid.uuid4()),
+            "data": {"type": "payment", "id": self.PAYMENT_ID, "object": {}},
+        }
+        self.assertEqual(webhooks.get_payment_id(body), "")
+        # Stored before unhandled types were skipped on arrival
+        unhandled = PaymentWebhookNotification(
+            event_id=body["event_id"],
+            event_type=body["type"],
+            body=body,
+            headers={},
+            paymentId=self.PAYMENT_ID,
+        )
+        unhandled.save()
+        refund = self.add_refund_notification("refund.created", "PENDING")
+
+        self.assertEqual(webhooks.run_pending(), 2)
+        unhandled.refresh_from_db()
+        self.assertFalse(unhandled.processed)
+        self.assertEqual(unhandled.attempts, 0)
+        self.assertIsNone(unhandled.nextAttempt)
+        self.assertIn("payment.created", unhandled.error)
+        refund.refresh_from_db()
+        self.assertTrue(refund.processed)
+        self.assertEqual(webhooks.run_pending(), 0)
+
+    def test_gives_up_after_max_attempts(self):
+        notification = self.add_refund_notification("refund.updated", "COMPLETED")
+        for _ in range(webhooks.MAX_ATTEMPTS):
+            PaymentWebhookNotification.objects.filter(pk=notification.pk).update(
+                nextAttempt=timezone.now()
+            )
+            webhooks.run_pending()
+
+        notification.refresh_from_db()
+        self.assertFalse(notification.processed)
+        self.assertEqual(notification.attempts, webhooks.MAX_ATTEMPTS)
+        self.assertIsNone(notification.nextAttempt)
+        self.assertEqual(webhooks.run_pending(), 0)
+
+    def test_admin_replay(self):
+        User.objects.create_superuser("admin", "admin@host", "admin")
+        self.assertTrue(self.client.login(username="admin", password="admin"))
+        notification = self.add_refund_notification("refund.created", "PENDING")
+        webhooks.run_pending()
+        notification.refresh_from_db()
+        self.assertTrue(notification.processed)
+
+        response = self.client.post(
+            reverse("admin:registration_paymentwebhooknotification_changelist")
+            + "?processed__exact=1",
+            {"action": "replay_webhooks", "_selected_action": [notification.pk]},
+        )
+        self.assertEqual(response.status_code, 302)
+        notification.refresh_from_db()
+        self.assertFalse(notification.processed)
+        self.assertEqual(notification.attempts, 0)
+
+        # The refund is already recorded, so replaying doesn't apply it twice
+        self.assertEqual(webhooks.run_pending(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal("80.00"))
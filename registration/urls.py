@@ -1,5 +1,5 @@
-from django.urls import path, re_path
 from django.contrib.auth.views import LogoutView
+from django.urls import path, re_path
 
 import registration.views.attendee
 import registration.views.cart
@@ -24,7 +24,7 @@ def trigger_error(request):
 
 urlpatterns = [
     re_path(r"^sentry-debug/", trigger_error),
-    path('', registration.views.common.index, name="index"),
+    path("", registration.views.common.index, name="index"),
     re_path(r"^logout/$", LogoutView.as_view(), name="logout"),
     re_path(
         r"^upgrade/lookup/?$",
@@ -36,7 +36,9 @@ urlpatterns = [
         registration.views.upgrade.info_upgrade,
         name="info_upgrade",
     ),
-    re_path(r"^upgrade/add/?$", registration.views.upgrade.add_upgrade, name="add_upgrade"),
+    re_path(
+        r"^upgrade/add/?$", registration.views.upgrade.add_upgrade, name="add_upgrade"
+    ),
     re_path(
         r"^upgrade/invoice/?$",
         registration.views.upgrade.invoice_upgrade,
@@ -52,13 +54,17 @@ urlpatterns = [
         registration.views.upgrade.done_upgrade,
         name="done_upgrade",
     ),
-    path('upgrade/<slug:guid>/', registration.views.upgrade.upgrade, name="upgrade"),
+    path("upgrade/<slug:guid>/", registration.views.upgrade.upgrade, name="upgrade"),
     re_path(r"^staff/done/?$", registration.views.staff.staff_done, name="staff_done"),
-    re_path(r"^staff/lookup/?$", registration.views.staff.find_staff, name="find_staff"),
+    re_path(
+        r"^staff/lookup/?$", registration.views.staff.find_staff, name="find_staff"
+    ),
     re_path(r"^staff/info/?$", registration.views.staff.info_staff, name="info_staff"),
     re_path(r"^staff/add/?$", registration.views.staff.add_staff, name="add_staff"),
-    path('staff/<slug:guid>/', registration.views.staff.staff_index, name="staff"),
-    re_path(r"^newstaff/done/?$", registration.views.staff.staff_done, name="doneNewStaff"),
+    path("staff/<slug:guid>/", registration.views.staff.staff_index, name="staff"),
+    re_path(
+        r"^newstaff/done/?$", registration.views.staff.staff_done, name="doneNewStaff"
+    ),
     re_path(
         r"^newstaff/lookup/?$",
         registration.views.staff.find_new_staff,
@@ -74,14 +80,16 @@ urlpatterns = [
         registration.views.staff.add_new_staff,
         name="add_new_staff",
     ),
-    path('newstaff/<slug:guid>/', registration.views.staff.new_staff, name="new_staff"),
+    path("newstaff/<slug:guid>/", registration.views.staff.new_staff, name="new_staff"),
     re_path(r"^dealer/?$", registration.views.dealers.new_dealer, name="new_dealer"),
     re_path(
         r"^dealer/addNew/?$",
         registration.views.dealers.addNewDealer,
         name="addNewDealer",
     ),
-    re_path(r"^dealer/done/?$", registration.views.dealers.done_dealer, name="done_dealer"),
+    re_path(
+        r"^dealer/done/?$", registration.views.dealers.done_dealer, name="done_dealer"
+    ),
     re_path(
         r"^dealer/thanks/?$",
         registration.views.dealers.thanks_dealer,
@@ -90,8 +98,12 @@ urlpatterns = [
     re_path(
         r"^dealer/lookup/?$", registration.views.dealers.find_dealer, name="find_dealer"
     ),
-    re_path(r"^dealer/add/?$", registration.views.dealers.add_dealer, name="add_dealer"),
-    re_path(r"^dealer/info/?$", registration.views.dealers.info_dealer, name="info_dealer"),
+    re_path(
+        r"^dealer/add/?$", registration.views.dealers.add_dealer, name="add_dealer"
+    ),
+    re_path(
+        r"^dealer/info/?$", registration.views.dealers.info_dealer, name="info_dealer"
+    ),
     re_path(
         r"^dealer/invoice/?$",
         registration.views.dealers.invoice_dealer,
@@ -102,8 +114,9 @@ urlpatterns = [
         registration.views.dealers.checkout_dealer,
         name="checkout_dealer",
     ),
-    path('dealer/<slug:guid>/', registration.views.dealers.dealers, name="dealers"),
-    path('dealer/<slug:guid>/assistants/',
+    path("dealer/<slug:guid>/", registration.views.dealers.dealers, name="dealers"),
+    path(
+        "dealer/<slug:guid>/assistants/",
         registration.views.dealers.find_dealer_to_add_assistant,
         name="find_dealer_to_add_assistant",
     ),
@@ -122,7 +135,11 @@ urlpatterns = [
         registration.views.dealers.add_assistants_checkout,
         name="add_assistants_checkout",
     ),
-    path('dealerassistant/<slug:guid>/', registration.views.dealers.dealer_asst, name="dealer_asst"),
+    path(
+        "dealerassistant/<slug:guid>/",
+        registration.views.dealers.dealer_asst,
+        name="dealer_asst",
+    ),
     re_path(
         r"^dealerassistant/add/find/?$",
         registration.views.dealers.find_asst_dealer,
@@ -134,8 +151,12 @@ urlpatterns = [
         name="done_asst_dealer",
     ),
     re_path(r"^onsite/?$", registration.views.onsite.onsite, name="onsite"),
-    re_path(r"^onsite/cart/?$", registration.views.onsite.onsite_cart, name="onsite_cart"),
-    re_path(r"^onsite/done/?$", registration.views.onsite.onsite_done, name="onsite_done"),
+    re_path(
+        r"^onsite/cart/?$", registration.views.onsite.onsite_cart, name="onsite_cart"
+    ),
+    re_path(
+        r"^onsite/done/?$", registration.views.onsite.onsite_done, name="onsite_done"
+    ),
     re_path(
         r"^onsite/admin/?$",
         registration.views.onsite_admin.onsite_admin,
@@ -201,6 +222,11 @@ urlpatterns = [
         registration.views.onsite_admin.onsite_print_badges,
         name="onsite_print_badges",
     ),
+    re_path(
+        r"^onsite/admin/badge/print/job/(?P<job_id>\d+)/?$",
+        registration.views.onsite_admin.onsite_print_job,
+        name="onsite_print_job",
+    ),
     re_path(
         r"^onsite/admin/badge/print/clear/?$",
         registration.views.onsite_admin.onsite_print_clear,
@@ -278,17 +304,29 @@ urlpatterns = [
         registration.views.ordering.apply_discount,
         name="discount",
     ),
-    re_path(r"^cart/checkout/?$", registration.views.ordering.checkout, name="checkout"),
+    re_path(
+        r"^cart/checkout/?$", registration.views.ordering.checkout, name="checkout"
+    ),
     re_path(r"^cart/done/?$", registration.views.cart.cart_done, name="done"),
-    path('events/', registration.views.common.get_events, name="events"),
-    path('departments/', registration.views.common.get_departments, name="departments"),
-    path('alldepartments/', registration.views.common.get_all_departments, name="alldepartments"),
-    path('pricelevels/', registration.views.pricelevels.get_price_levels, name="pricelevels"),
-    path('shirts/', registration.views.common.get_shirt_sizes, name="shirtsizes"),
-    path('tables/', registration.views.dealers.getTableSizes, name="tablesizes"),
-    path('addresses/', registration.views.common.get_session_addresses, name="addresses"),
-    path('utility/badges/', registration.views.common.basicBadges, name="basicBadges"),
-    path('utility/vips', registration.views.common.vipBadges, name="vipBadges"),
+    path("events/", registration.views.common.get_events, name="events"),
+    path("departments/", registration.views.common.get_departments, name="departments"),
+    path(
+        "alldepartments/",
+        registration.views.common.get_all_departments,
+        name="alldepartments",
+    ),
+    path(
+        "pricelevels/",
+        registration.views.pricelevels.get_price_levels,
+        name="pricelevels",
+    ),
+    path("shirts/", registration.views.common.get_shirt_sizes, name="shirtsizes"),
+    path("tables/", registration.views.dealers.getTableSizes, name="tablesizes"),
+    path(
+        "addresses/", registration.views.common.get_session_addresses, name="addresses"
+    ),
+    path("utility/badges/", registration.views.common.basicBadges, name="basicBadges"),
+    path("utility/vips", registration.views.common.vipBadges, name="vipBadges"),
     re_path(r"^flush/?$", registration.views.common.flush, name="flush"),
     re_path(r"^pdf/?$", registration.views.printing.servePDF, name="pdf"),
     re_path(r"^print/?$", registration.views.printing.printNametag, name="print"),
@@ -310,16 +348,16 @@ urlpatterns = [
     re_path(
         r"^terminal/square/token$",
         registration.views.onsite_admin.terminal_square_token,
-        name="terminal_square_token"
+        name="terminal_square_token",
     ),
     re_path(
         r"^terminal/square/completed$",
         registration.views.onsite_admin.complete_square_transaction,
-        name="terminal_square_completed"
+        name="terminal_square_completed",
     ),
     re_path(
         r"^oauth/square$",
         registration.views.onsite_admin.oauth_square,
         name="oauth_square",
-    )
+    ),
 ]
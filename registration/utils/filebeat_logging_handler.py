@@ -1,22 +1,52 @@
 import base64
-import hmac
 import hashlib
+import hmac
 import json
 import logging
+import os
+import queue
+import threading
+import time
 
 import requests
 
+_FLUSH = object()
+_STOP = object()
+
 
 class FilebeatHandler(logging.Handler):
+    """
+    Ships log records to a Filebeat HTTP endpoint.
+
+    emit() only serializes the record and queues it; a background thread
+    posts queued records in batches as newline-delimited JSON, signed the
+    same way single records were.  Records are dropped, and counted, when
+    the queue is full rather than holding up the caller.
+    """
+
     def __init__(self, *args, **kwargs):
         self._endpoint_url = kwargs.pop("endpoint_url")
         self._username = kwargs.pop("username")
         self._password = kwargs.pop("password")
         self._hmac_header = kwargs.pop("hmac_header")
         self._hmac_secret = kwargs.pop("hmac_secret")
+        self._batch_size = kwargs.pop("batch_size", 100)
+        self._flush_interval = kwargs.pop("flush_interval", 1.0)
+        self._timeout = kwargs.pop("timeout", 5)
+        queue_size = kwargs.pop("queue_size", 10000)
 
         super().__init__(*args, **kwargs)
 
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._session = requests.Session()
+        self._thread = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
     @property
     def _auth_basic(self):
         user_pass = f"{self._username}:{self._password}".encode("utf-8")
@@ -24,7 +54,83 @@ class FilebeatHandler(logging.Handler):
         return encoded
 
     def emit(self, record):
-        data_to_send = json.dumps(dict(record.__dict__.items())).encode("utf-8")
+        try:
+            data = json.dumps(dict(record.__dict__.items())).encode("utf-8")
+        except Exception:
+            self.handleError(record)
+            return
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5):
+        """Send everything queued so far, waiting up to timeout seconds."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_FLUSH, timeout=timeout)
+        except queue.Full:
+            return
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        self.flush()
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=1)
+        self._session.close()
+        super().close()
+
+    def _ensure_thread(self):
+        # Forked workers inherit the handler but not its thread.
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._session = requests.Session()
+            self._thread = threading.Thread(
+                target=self._run, name="filebeat-handler", daemon=True
+            )
+            self._thread.start()
+
+    def _next_batch(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self._flush_interval
+        while len(items) < self._batch_size and items[-1] not in (_FLUSH, _STOP):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+            batch = [item for item in items if item not in (_FLUSH, _STOP)]
+            try:
+                if batch:
+                    self._send(batch)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if items[-1] is _STOP:
+                return
+
+    def _send(self, batch):
+        data_to_send = b"\n".join(batch) + b"\n"
         signature = hmac.new(
             self._hmac_secret.encode("utf-8"),
             msg=data_to_send,
@@ -33,12 +139,19 @@ class FilebeatHandler(logging.Handler):
 
         headers = {
             "Authorization": f"Basic {self._auth_basic}",
-            "Content-Type": "application/json",
+            "Content-Type": "application/x-ndjson",
             self._hmac_header: f"sha256={signature}",
         }
 
         try:
-            response = requests.post(self._endpoint_url, headers=headers, data=data_to_send, timeout=1)
+            response = self._session.post(
+                self._endpoint_url,
+                headers=headers,
+                data=data_to_send,
+                timeout=self._timeout,
+            )
             response.raise_for_status()
+            self.sent += len(batch)
         except Exception as exc:
+            self.failed += len(batch)
             print(exc)
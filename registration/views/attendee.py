@@ -7,13 +7,13 @@ from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
 from django.utils import timezone
 
+from registration.catalog import is_sold_out
+from registration.events import get_default_event
 from registration.models import (
     Attendee,
-    AttendeeOptions,
     Badge,
     BanList,
     Dealer,
-    Event,
     PriceLevel,
     Staff,
 )
@@ -36,16 +36,8 @@ def check_ban_list(firstName, lastName, email):
 
 
 def check_if_option_is_sold_out(option) -> bool:
-    event = Event.objects.get(default=True)
-
-    total_sold = AttendeeOptions.objects.filter(
-        orderItem__badge__event__name=event.name,
-        option__optionName=option.optionName,
-    ).count()
-
-    sold_out = total_sold >= option.quantity
-
-    return sold_out
+    event = get_default_event()
+    return is_sold_out(event, option.id, option.quantity)
 
 
 def get_price_level_options_list(level) -> List[Dict[str, Any]]:
@@ -61,19 +53,21 @@ def get_price_level_options_list(level) -> List[Dict[str, Any]]:
             limited_availability = False
             sold_out = None
 
-        data_options.append({
-            "name": option.optionName,
-            "value": option.optionPrice,
-            "id": option.id,
-            "required": option.required,
-            "active": option.active,
-            "type": option.optionExtraType,
-            "image": option.getOptionImage(),
-            "description": option.description,
-            "list": option.getList(),
-            "limited_availability": limited_availability,
-            "sold_out": sold_out,
-        })
+        data_options.append(
+            {
+                "name": option.optionName,
+                "value": option.optionPrice,
+                "id": option.id,
+                "required": option.required,
+                "active": option.active,
+                "type": option.optionExtraType,
+                "image": option.getOptionImage(),
+                "description": option.description,
+                "list": option.getList(),
+                "limited_availability": limited_availability,
+                "sold_out": sold_out,
+            }
+        )
 
     return data_options
 
@@ -82,18 +76,21 @@ def get_price_level_list(levels):
     data = []
 
     for level in levels:
-        data.append({
-            "name": level.name,
-            "id": level.id,
-            "base_price": str(level.basePrice),
-            "description": level.description,
-            "options": get_price_level_options_list(level),
-        })
+        data.append(
+            {
+                "name": level.name,
+                "id": level.id,
+                "base_price": str(level.basePrice),
+                "description": level.description,
+                "options": get_price_level_options_list(level),
+            }
+        )
 
     return data
 
+
 # moved to views.pricelevels
-# def get_price_level_list(levels): 
+# def get_price_level_list(levels):
 #     data = [
 #         {
 #             "name": level.name,
@@ -122,8 +119,8 @@ def get_price_level_list(levels):
 #     return data
 
 
-#deprecated
-# def get_price_levels(request): 
+# deprecated
+# def get_price_levels(request):
 #     dealer = request.session.get("dealer_id", -1)
 #     staff = request.session.get("staff_id", -1)
 #     attendee = request.session.get("attendee_id", -1)
@@ -2,11 +2,16 @@ import json
 import logging
 from datetime import datetime
 
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.shortcuts import render
 
+from registration.catalog import take_option
+from registration.events import get_default_event, get_event_by_name
 from registration.models import *
+from registration.pricing import CartPricing, PriceCatalog
 
-from . import common, ordering
+from . import common
 from .attendee import check_ban_list
 
 logger = logging.getLogger(__name__)
@@ -16,9 +21,15 @@ def get_cart(request):
     sessionItems = request.session.get("cart_items", [])
     sessionOrderItems = request.session.get("order_items", [])
     discount = request.session.get("discount", "")
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     if not sessionItems and not sessionOrderItems:
-        context = {"orderItems": [], "total": 0, "discount": {}, "event": event, "minimum_org_donation": 0.00}
+        context = {
+            "orderItems": [],
+            "total": 0,
+            "discount": {},
+            "event": event,
+            "minimum_org_donation": 0.00,
+        }
         request.session.flush()
     elif sessionOrderItems:
         orderItems = list(OrderItem.objects.filter(id__in=sessionOrderItems))
@@ -26,23 +37,17 @@ def get_cart(request):
             discount = Discount.objects.filter(codeName=discount)
             if discount.count() > 0:
                 discount = discount.first()
-        total, total_discount = ordering.get_total([], orderItems, discount)
+        pricing = CartPricing([], orderItems, discount)
+        total, total_discount = pricing.total, pricing.total_discount
+        minimum_org_donation = pricing.minimum_org_donation
 
         hasMinors = False
-        minimum_org_donation = 0.00
         for item in orderItems:
-            effective_level = item.badge.effectiveLevel()
-            if effective_level.minimumOrgDonation and effective_level.minimumOrgDonation > minimum_org_donation:
-                minimum_org_donation = effective_level.minimumOrgDonation
-
             if item.badge.isMinor():
                 item.isMinor = True
                 hasMinors = True
                 break
 
-        if discount and discount.waiveRequiredDonation:
-            minimum_org_donation = 0.00
-
         paid_total = item.badge.paidTotal()
 
         context = {
@@ -57,20 +62,22 @@ def get_cart(request):
         }
 
     elif sessionItems:
-        minimum_org_donation = 0.00
         cartItems = list(Cart.objects.filter(id__in=sessionItems))
         orderItems = []
         if discount:
             discount = Discount.objects.filter(codeName=discount)
             if discount.count() > 0:
                 discount = discount.first()
-        total, total_discount = ordering.get_total(cartItems, [], discount)
+        pricing = CartPricing(cartItems, [], discount)
+        total, total_discount = pricing.total, pricing.total_discount
+        minimum_org_donation = pricing.minimum_org_donation
+        lines = {line.item.id: line for line in pricing.lines}
 
         hasMinors = False
         for idx, cart in enumerate(cartItems):
             cartJson = json.loads(cart.formData)
             pda = cartJson["attendee"]
-            event = Event.objects.get(name=cartJson["event"])
+            event = get_event_by_name(cartJson["event"])
             evt = event.eventStart
             tz = timezone.get_current_timezone()
             try:
@@ -95,40 +102,15 @@ def get_cart(request):
                 pda["isMinor"] = True
                 hasMinors = True
 
-            pdp = cartJson["priceLevel"]
-            priceLevel = PriceLevel.objects.get(id=pdp["id"])
-
-            if priceLevel.minimumOrgDonation and priceLevel.minimumOrgDonation > minimum_org_donation:
-                minimum_org_donation = priceLevel.minimumOrgDonation
-
-            pdo = pdp["options"]
-            options = []
-            for option in pdo:
-                dataOption = {}
-                optionData = PriceLevelOption.objects.get(id=option["id"])
-                if optionData.optionExtraType == "int":
-                    if option["value"]:
-                        itemTotal = optionData.optionPrice * Decimal(option["value"])
-                        dataOption = {
-                            "name": optionData.optionName,
-                            "number": option["value"],
-                            "total": itemTotal,
-                        }
-                else:
-                    itemTotal = optionData.optionPrice
-                    dataOption = {"name": optionData.optionName, "total": itemTotal}
-                options.append(dataOption)
+            line = lines[cart.id]
             orderItem = {
                 "id": cart.id,
                 "attendee": pda,
-                "priceLevel": priceLevel,
-                "options": options,
+                "priceLevel": line.priceLevel,
+                "options": line.option_lines(),
             }
             orderItems.append(orderItem)
 
-        if discount and discount.waiveRequiredDonation:
-            minimum_org_donation = 0.00
-
         context = {
             "event": event,
             "orderItems": orderItems,
@@ -141,17 +123,45 @@ def get_cart(request):
     return render(request, "registration/checkout.html", context)
 
 
-def saveCart(cart):
-    postData = json.loads(cart.formData)
-    pda = postData["attendee"]
-    pdp = postData["priceLevel"]
-    evt = postData["event"]
-
+def load_carts(carts):
+    """
+    Parse and validate carts before anything is written, loading their
+    price levels and options in bulk.  Raises ValueError for the
+    first cart that can't be registered.
+    """
+    cart_data = [json.loads(cart.formData) for cart in carts]
+    catalog = PriceCatalog.for_cart_data(cart_data)
     tz = timezone.get_current_timezone()
-    birthdate = tz.localize(datetime.strptime(pda["birthdate"], "%Y-%m-%d"))
 
-    event = Event.objects.get(name=evt)
+    entries = []
+    for cart, data in zip(carts, cart_data):
+        pda = data["attendee"]
+        pdp = data["priceLevel"]
+        try:
+            event = get_event_by_name(data["event"])
+            birthdate = tz.localize(datetime.strptime(pda["birthdate"], "%Y-%m-%d"))
+            priceLevel = catalog.level(pdp["id"])
+            options = [
+                (catalog.option(option["id"]), option["value"])
+                for option in pdp["options"]
+            ]
+        except (KeyError, ValueError, ObjectDoesNotExist) as e:
+            raise ValueError(f"Unable to register cart {cart.id}: {e}")
+        entries.append(
+            {
+                "cart": cart,
+                "attendee": pda,
+                "event": event,
+                "birthdate": birthdate,
+                "priceLevel": priceLevel,
+                "options": options,
+            }
+        )
+    return entries
+
 
+def build_attendee(entry):
+    pda = entry["attendee"]
     volDepts = pda.get("volDepts", [])
 
     attendee = Attendee(
@@ -160,18 +170,17 @@ def saveCart(cart):
         lastName=pda["lastName"],
         phone=pda["phone"],
         email=pda["email"],
-        birthdate=birthdate,
+        birthdate=entry["birthdate"],
         emailsOk=bool(pda["emailsOk"]),
         volunteerContact=len(volDepts) > 0,
         volunteerDepts=volDepts,
         surveyOk=bool(pda["surveyOk"]),
         aslRequest=bool(pda["asl"]),
     )
+    # bulk_create doesn't call Attendee.save()
+    attendee.fullName = f"{attendee.firstName} {attendee.lastName}"
 
-    priceLevel = PriceLevel.objects.get(id=int(pdp["id"]))
-    is_vendor_level = priceLevel.isVendor
-
-    if event.collectAddress or is_vendor_level:
+    if entry["event"].collectAddress or entry["priceLevel"].isVendor:
         try:
             attendee.address1 = pda["address1"]
             attendee.address2 = pda["address2"]
@@ -183,41 +192,90 @@ def saveCart(cart):
             logging.error(
                 "Supposed to be collecting addresses, but wasn't provided by form!"
             )
-    attendee.save()
+    return attendee
+
 
+def build_badge(entry, attendee):
+    pda = entry["attendee"]
+    event = entry["event"]
     if event.hasBadges:
         badgeName = pda["badgeName"]
     else:
         badgeName = attendee.preferredName or attendee.firstName
 
-    badge = Badge(badgeName=badgeName, event=event, attendee=attendee, signature_svg=pda.get("signature_svg"), signature_bitmap=pda.get("signature_bitmap"))
-    badge.save()
+    return Badge(
+        badgeName=badgeName,
+        event=event,
+        attendee=attendee,
+        registeredDate=timezone.now(),
+        signature_svg=pda.get("signature_svg"),
+        signature_bitmap=pda.get("signature_bitmap"),
+    )
 
-    via = "WEB"
-    if postData["attendee"].get("onsite", False):
-        via = "ONSITE"
 
-    orderItem = OrderItem(badge=badge, priceLevel=priceLevel, enteredBy=via)
-    orderItem.save()
+def save_carts(entries, order=None, reserved=False):
+    """
+    Create the attendees, badges, order items and options for carts loaded
+    with load_carts, in one transaction and a fixed number of queries.
+    Pass reserved if limited options were already taken with
+    catalog.reserve_option.
+    """
+    with transaction.atomic():
+        attendees = Attendee.objects.bulk_create(
+            [build_attendee(entry) for entry in entries]
+        )
+        badges = Badge.objects.bulk_create(
+            [
+                build_badge(entry, attendee)
+                for entry, attendee in zip(entries, attendees)
+            ]
+        )
 
-    for option in pdp["options"]:
-        plOption = PriceLevelOption.objects.get(id=int(option["id"]))
-        if plOption.optionExtraType == "int" and option["value"] == "":
-            attendeeOption = AttendeeOptions(
-                option=plOption, orderItem=orderItem, optionValue="0"
-            )
-            attendeeOption.save()
-        else:
-            if option["value"] != "":
-                attendeeOption = AttendeeOptions(
-                    option=plOption, orderItem=orderItem, optionValue=option["value"]
+        order_items = OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    badge=badge,
+                    priceLevel=entry["priceLevel"],
+                    enteredBy=(
+                        "ONSITE" if entry["attendee"].get("onsite", False) else "WEB"
+                    ),
+                )
+                for entry, badge in zip(entries, badges)
+            ]
+        )
+
+        attendee_options = []
+        for entry, orderItem in zip(entries, order_items):
+            for plOption, value in entry["options"]:
+                if plOption.optionExtraType == "int" and value == "":
+                    value = "0"
+                elif value == "":
+                    continue
+                attendee_options.append(
+                    AttendeeOptions(
+                        option=plOption, orderItem=orderItem, optionValue=value
+                    )
                 )
-                attendeeOption.save()
+        AttendeeOptions.objects.bulk_create(attendee_options)
 
-    cart.transferedDate = timezone.now()
-    cart.save()
+        # bulk_create skips the post_save signals that would do this.
+        if not reserved:
+            for attendeeOption in attendee_options:
+                take_option(
+                    attendeeOption.orderItem.badge.event_id, attendeeOption.option
+                )
+        Badge.objects.filter(pk__in=[badge.pk for badge in badges]).refresh_status()
 
-    return orderItem
+        Cart.objects.filter(pk__in=[entry["cart"].pk for entry in entries]).update(
+            transferedDate=timezone.now()
+        )
+
+    return order_items
+
+
+def saveCart(cart):
+    return save_carts(load_carts([cart]))[0]
 
 
 def add_to_cart(request):
@@ -229,7 +287,7 @@ def add_to_cart(request):
     except ValueError as e:
         return common.abort(400, "Unable to decode JSON body")
 
-    event = Event.objects.get(default=True)
+    event = get_default_event()
 
     try:
         pda = postData["attendee"]
@@ -306,6 +364,6 @@ def remove_from_cart(request):
 
 
 def cart_done(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event}
     return render(request, "registration/done.html", context)
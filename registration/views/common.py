@@ -8,7 +8,7 @@ from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.db.models.fields.files import FieldFile
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
@@ -18,7 +18,9 @@ from django.views.decorators.cache import cache_page
 from idempotency_key.decorators import idempotency_key
 
 import registration.emails
+from registration.events import get_default_event
 from registration.models import (
+    Badge,
     Cart,
     Department,
     Discount,
@@ -182,6 +184,7 @@ def handler(obj):
             )
         )
 
+
 def _get_default_non_vendor_price_level(now: datetime) -> Optional[int]:
     price_levels = PriceLevel.objects.filter(
         public=True, startDate__lte=now, endDate__gte=now
@@ -201,7 +204,9 @@ def _get_default_non_vendor_price_level(now: datetime) -> Optional[int]:
     return non_vendor_id
 
 
-def _parse_level_id(level_id: Optional[Any], now: datetime) -> Tuple[Optional[int], bool]:
+def _parse_level_id(
+    level_id: Optional[Any], now: datetime
+) -> Tuple[Optional[int], bool]:
     try:
         level_id = int(level_id)
     except Exception:
@@ -229,7 +234,7 @@ def index(request):
     level_id = request.GET.get("level_id")
 
     try:
-        event = Event.objects.get(default=True)
+        event = get_default_event()
     except Event.DoesNotExist:
         return render(request, "registration/docs/no-event.html")
 
@@ -242,9 +247,11 @@ def index(request):
         if discount.count() > 0:
             discount = discount.first()
 
-    level_count = PriceLevel.objects.filter(
-        public=True, startDate__lte=now, endDate__gte=now
-    ).order_by("basePrice").count()
+    level_count = (
+        PriceLevel.objects.filter(public=True, startDate__lte=now, endDate__gte=now)
+        .order_by("basePrice")
+        .count()
+    )
 
     level_id, is_vendor = _parse_level_id(level_id, now)
 
@@ -265,10 +272,14 @@ def index(request):
     if event.attendeeRegStart <= today <= event.attendeeRegEnd:
         return render(request, "registration/registration-form.html", context)
     elif event.attendeeRegStart >= today:
-        context["message"] = "is not yet open. Please stay tuned to our social media for updates!"
+        context["message"] = (
+            "is not yet open. Please stay tuned to our social media for updates!"
+        )
         return render(request, "registration/closed.html", context)
     elif event.attendeeRegEnd <= today:
-        context["message"] = "has ended. In person registration will open on event day, May 31st, 2025."
+        context["message"] = (
+            "has ended. In person registration will open on event day, May 31st, 2025."
+        )
         return render(request, "registration/closed.html", context)
 
 
@@ -282,45 +293,54 @@ def manualDiscount(request):
 @cache_page(60 * 5)
 @staff_member_required
 def basicBadges(request):
-    event = Event.objects.get(default=True)
-
-    staff = Staff.objects.filter(event=event)
-    order_items = OrderItem.objects.filter(badge__event=event)
+    event = get_default_event()
+
+    staff = Staff.objects.filter(event=event).select_related("attendee")
+    badges = (
+        Badge.objects.filter(event=event)
+        .with_status()
+        .select_related("attendee")
+        .prefetch_related("orderitem_set")
+        .order_by("pk")
+    )
+    badges_by_id = {badge.id: badge for badge in badges}
+    badges_by_attendee = {badge.attendee_id: badge for badge in badges}
+    order_item_badges = OrderItem.objects.filter(badge__event=event).values_list(
+        "badge_id", flat=True
+    )
 
     bdata = [
         {
-            "badgeName": oi.badge.badgeName,
-            "level": oi.badge.effectiveLevel(),
-            "assoc": oi.badge.abandoned,
-            "firstName": oi.badge.attendee.firstName.lower(),
-            "lastName": oi.badge.attendee.lastName.lower(),
-            "printed": oi.badge.printed,
-            "discount": oi.badge.getDiscount(),
-            "orderItems": getOptionsDict(oi.badge.orderitem_set.all()),
+            "badgeName": badge.badgeName,
+            "level": badge.effective_level_name,
+            "assoc": badge.association,
+            "firstName": badge.attendee.firstName.lower(),
+            "lastName": badge.attendee.lastName.lower(),
+            "printed": badge.printed,
+            "discount": badge.discount_code,
+            "orderItems": getOptionsDict(badge.orderitem_set.all()),
         }
-        for oi in order_items
+        for badge in (badges_by_id[badge_id] for badge_id in order_item_badges)
     ]
 
-    staffdata = [
-        {
+    staffdata = []
+    for s in staff:
+        sdict = {
             "firstName": s.attendee.firstName.lower(),
             "lastName": s.attendee.lastName.lower(),
             "title": s.title,
             "id": s.id,
         }
-        for s in staff
-    ]
-
-    for staff in staffdata:
-        sbadge = Staff.objects.get(id=staff["id"]).getBadge()
+        sbadge = badges_by_attendee.get(s.attendee_id)
         if sbadge:
-            staff["badgeName"] = sbadge.badgeName
-            if sbadge.effectiveLevel():
-                staff["level"] = sbadge.effectiveLevel()
+            sdict["badgeName"] = sbadge.badgeName
+            if sbadge.effective_level_name:
+                sdict["level"] = sbadge.effective_level_name
             else:
-                staff["level"] = "none"
-            staff["assoc"] = sbadge.abandoned
-            staff["orderItems"] = getOptionsDict(sbadge.orderitem_set.all())
+                sdict["level"] = "none"
+            sdict["assoc"] = sbadge.association
+            sdict["orderItems"] = getOptionsDict(sbadge.orderitem_set.all())
+        staffdata.append(sdict)
 
     sdata = sorted(bdata, key=lambda x: (str(x["level"]), x["lastName"]))
     ssdata = sorted(staffdata, key=lambda x: x["lastName"])
@@ -338,7 +358,7 @@ def basicBadges(request):
 @cache_page(60 * 5)
 @staff_member_required
 def vipBadges(request):
-    default_event = Event.objects.get(default=True)
+    default_event = get_default_event()
     event_id = request.GET.get("event", default_event.id)
     event = get_object_or_404(Event, id=event_id)
 
@@ -348,17 +368,24 @@ def vipBadges(request):
 
     vip_order_items = OrderItem.objects.filter(
         priceLevel__in=price_levels, badge__event=event
+    ).prefetch_related(
+        Prefetch(
+            "badge",
+            queryset=Badge.objects.with_status()
+            .select_related("attendee")
+            .prefetch_related("orderitem_set"),
+        )
     )
 
     badges = [
         {
             "badge": oi.badge,
             "orderItems": getOptionsDict(oi.badge.orderitem_set.all()),
-            "level": oi.badge.effectiveLevel(),
-            "assoc": oi.badge.abandoned,
+            "level": oi.badge.effective_level_name,
+            "assoc": oi.badge.association,
         }
         for oi in vip_order_items
-        if oi.badge.abandoned != "Staff"
+        if oi.badge.association != Badge.STAFF
     ]
 
     context = {
@@ -396,7 +423,7 @@ def get_shirt_sizes(request):
 
 
 def get_session_addresses(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     sessionItems = request.session.get("cart_items", [])
     if not sessionItems:
         # might be from dealer workflow, which is order items in the session
@@ -457,7 +484,7 @@ def get_registration_email(event=None):
     """
     if event is None:
         try:
-            event = Event.objects.get(default=True)
+            event = get_default_event()
         except BaseException:
             return settings.APIS_DEFAULT_EMAIL
     if event.registrationEmail == "":
@@ -14,7 +14,9 @@ from django.shortcuts import render
 from django.urls import reverse
 
 import registration.emails
+from registration.events import get_default_event, get_event_by_name
 from registration.models import *
+from registration.pricing import get_order_item_lines
 
 from . import common
 from .common import clear_session, handler, logger
@@ -23,54 +25,55 @@ from .ordering import do_checkout, doZeroCheckout, get_discount_total
 logger = logging.getLogger(__name__)
 form_type = "marketplace"
 
+
 def dealers(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"token": guid, "event": event, "form_type": form_type}
     return render(request, "registration/dealer/dealer-locate.html", context)
 
 
 def thanks_dealer(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event, "form_type": form_type}
     return render(request, "registration/dealer/dealer-thanks.html", context)
 
 
 def done_dealer(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event, "form_type": form_type}
     return render(request, "registration/dealer/dealer-done.html", context)
 
 
 def find_dealer_to_add_assistant(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {
         "token": guid,
         "event": event,
         "next": reverse("registration:find_dealer_to_add_assistant_post"),
-        "form_type": form_type
+        "form_type": form_type,
     }
     return render(request, "registration/dealer/dealerasst-locate.html", context)
 
 
 def dealer_asst(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {
         "token": guid,
         "event": event,
-        "next": reverse("registration:find_asst_dealer"), 
-        "form_type": form_type
+        "next": reverse("registration:find_asst_dealer"),
+        "form_type": form_type,
     }
     return render(request, "registration/dealer/dealerasst-locate.html", context)
 
 
 def done_asst_dealer(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event, "form_type": form_type}
     return render(request, "registration/dealer/dealerasst-done.html", context)
 
 
 def new_dealer(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     venue = event.venue
     tz = timezone.get_current_timezone()
     today = tz.localize(datetime.now())
@@ -89,7 +92,7 @@ def new_dealer(request):
 
 
 def info_dealer(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"dealer": None, "event": event, "form_type": form_type}
     try:
         dealerId = request.session["dealer_id"]
@@ -223,7 +226,7 @@ def invoice_dealer(request):
                 "discount": discount,
                 "dealer": dealer,
             }
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context["event"] = event
     context["form_type"] = form_type
     return render(request, "registration/dealer/dealer-checkout.html", context)
@@ -251,7 +254,7 @@ def add_assistants(request):
             "asst_count_registered": asst_count_registered,
             "json_assistants": json.dumps(assistants, default=handler),
         }
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context["event"] = event
     return render(request, "registration/dealer/dealerasst-add.html", context)
 
@@ -266,7 +269,7 @@ def add_assistants_checkout(request):
     assistants_form = form_data["assistants"]
     dealer_id = request.session["dealer_id"]
     dealer = Dealer.objects.get(id=dealer_id)
-    event = Event.objects.get(default=True)
+    event = get_default_event()
 
     badge = Badge.objects.filter(attendee=dealer.attendee, event=dealer.event).last()
 
@@ -362,7 +365,7 @@ def add_dealer(request):
     pdd = postData["dealer"]
     evt = postData["event"]
     pdp = postData["priceLevel"]
-    event = Event.objects.get(name=evt)
+    event = get_event_by_name(evt)
 
     if "dealer_id" not in request.session:
         return HttpResponseServerError("Session expired")
@@ -532,7 +535,7 @@ def addNewDealer(request):
     except ValueError as e:
         logger.warning(f"Unable to parse birthdate: {pda['birthdate']} - {e}")
         return common.abort(400, f"Unable to parse birthdate: {pda['birthdate']}")
-    event = Event.objects.get(name=evt)
+    event = get_event_by_name(evt)
 
     attendee = Attendee(
         preferredName=pda.get("preferredName", ""),
@@ -617,7 +620,7 @@ def addNewDealer(request):
 
 
 def getTableSizes(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     sizes = TableSize.objects.filter(event=event)
     data = [
         {
@@ -646,7 +649,7 @@ def get_dealer_email(event=None):
     """
     if event is None:
         try:
-            event = Event.objects.get(default=True)
+            event = get_default_event()
         except BaseException:
             return settings.APIS_DEFAULT_EMAIL
     if event.dealerEmail == "":
@@ -656,16 +659,8 @@ def get_dealer_email(event=None):
 
 def get_dealer_total(orderItems, discount, dealer):
     itemSubTotal = 0
-    for item in orderItems:
-        itemSubTotal = item.priceLevel.basePrice
-        for option in item.attendeeoptions_set.all():
-            if option.option.optionExtraType == "int":
-                if option.optionValue:
-                    itemSubTotal += option.option.optionPrice * Decimal(
-                        option.optionValue
-                    )
-            else:
-                itemSubTotal += option.option.optionPrice
+    for line in get_order_item_lines(orderItems):
+        itemSubTotal = line.subtotal
     unpaidPartnerCount = dealer.getUnpaidPartnerCount()
     partnerCount = dealer.getPartnerCount()
     partnerBreakfast = 0
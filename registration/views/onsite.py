@@ -1,29 +1,22 @@
 import json
 import logging
 from datetime import datetime
-from decimal import Decimal
 
 from django.shortcuts import render
 from django.urls import reverse
 from django.utils import timezone
 
-from registration.models import (
-    Cart,
-    Discount,
-    Event,
-    PriceLevel,
-    PriceLevelOption,
-)
+from registration.events import get_default_event, get_event_by_name
+from registration.models import Cart, Discount, Event
+from registration.pricing import CartPricing
 from registration.views.common import clear_session
 
-from .ordering import get_total
-
 logger = logging.getLogger(__name__)
 form_type = "attendee"
 
 
 def onsite(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     tz = timezone.get_current_timezone()
     today = tz.localize(datetime.now())
     context = {"event": event, "form_type": form_type}
@@ -36,7 +29,9 @@ def onsite(request):
     if event.onsiteRegStart <= today <= event.onsiteRegEnd:
         return render(request, "registration/onsite.html", context)
     elif event.onsiteRegStart >= today:
-        context["message"] = "is not yet open. Please stay tuned to our social media for updates!"
+        context["message"] = (
+            "is not yet open. Please stay tuned to our social media for updates!"
+        )
         return render(request, "registration/closed.html", context)
     elif event.onsiteRegEnd <= today:
         context["message"] = "has ended."
@@ -58,16 +53,18 @@ def onsite_cart(request):
             discount = Discount.objects.filter(codeName=discount)
             if discount.count() > 0:
                 discount = discount.first()
-        total, total_discount = get_total(cartItems, [], discount)
+        pricing = CartPricing(cartItems, [], discount)
+        total, total_discount = pricing.total, pricing.total_discount
+        lines = {line.item.id: line for line in pricing.lines}
 
         hasMinors = False
         for cart in cartItems:
             cartJson = json.loads(cart.formData)
             pda = cartJson["attendee"]
             try:
-                event = Event.objects.get(name=cartJson["event"])
+                event = get_event_by_name(cartJson["event"])
             except Event.DoesNotExist:
-                event = Event.objects.get(default=True)
+                event = get_default_event()
             evt = event.eventStart
             tz = timezone.get_current_timezone()
             try:
@@ -83,43 +80,24 @@ def onsite_cart(request):
             if age_at_event < 18:
                 hasMinors = True
 
-            pdp = cartJson["priceLevel"]
-            priceLevel = PriceLevel.objects.get(id=pdp["id"])
-            pdo = pdp["options"]
-            options = []
-            for option in pdo:
-                dataOption = {}
-                optionData = PriceLevelOption.objects.get(id=option["id"])
-                if optionData.optionExtraType == "int":
-                    if option["value"]:
-                        itemTotal = optionData.optionPrice * Decimal(option["value"])
-                        total_ = {
-                            "name": optionData.optionName,
-                            "number": option["value"],
-                            "total": itemTotal,
-                        }
-                        dataOption = total_
-                else:
-                    itemTotal = optionData.optionPrice
-                    dataOption = {"name": optionData.optionName, "total": itemTotal}
-                options.append(dataOption)
+            line = lines[cart.id]
             orderItem = {
                 "id": cart.id,
                 "attendee": pda,
-                "priceLevel": priceLevel,
-                "options": options,
+                "priceLevel": line.priceLevel,
+                "options": line.option_lines(),
             }
             orderItems.append(orderItem)
 
         if event is None:
-            event = Event.objects.get(default=True)
+            event = get_default_event()
         context = {
             "event": event,
             "orderItems": orderItems,
             "total": total,
             "total_discount": total_discount,
             "discount": discount,
-            "hasMinors": hasMinors
+            "hasMinors": hasMinors,
         }
         context["form_type"] = form_type
     return render(request, "registration/onsite-checkout.html", context)
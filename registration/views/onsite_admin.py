@@ -14,8 +14,22 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import permission_required
 from django.contrib.messages import get_messages
 from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.signing import TimestampSigner
-from django.db.models import F, Func, Q, Sum, Value
+from django.db.models import (
+    BooleanField,
+    Case,
+    F,
+    FloatField,
+    Func,
+    Max,
+    Prefetch,
+    Q,
+    Sum,
+    Value,
+    When,
+)
 from django.http import HttpRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import redirect, render
 from django.template.loader import render_to_string
@@ -24,25 +38,24 @@ from django.utils import timezone
 from django.utils.http import urlencode
 from django.views.decorators.csrf import csrf_exempt
 
-from registration import admin, mqtt, payments
+from registration import admin, mqtt, payments, print_jobs
+from registration.events import get_default_event
 from registration.models import (
+    AttendeeOptions,
     Badge,
     Cashdrawer,
     Discount,
-    Event,
     Firebase,
     Order,
     OrderItem,
+    PrintJob,
     ShirtSizes,
     Staff,
     get_token,
 )
+from registration.pricing import LineItem, discount_total
 from registration.views.attendee import get_attendee_age
 from registration.views.common import logger
-from registration.views.ordering import (
-    get_discount_total,
-    get_order_item_option_total,
-)
 
 
 def flatten(l):
@@ -54,8 +67,106 @@ logger = logging.getLogger(__name__)
 TWOPLACES = Decimal(10) ** -2
 
 
+class TrigramSimilar(Func):
+    """pg_trgm's ``lhs % rhs``, which unlike similarity() can use a trigram index."""
+
+    arg_joiner = " %% "
+    template = "%(expressions)s"
+    output_field = BooleanField()
+
+
+class TrigramWordSimilar(Func):
+    """
+    pg_trgm's ``lhs <% rhs``, true when lhs is like some run of words in
+    rhs, so a first or partial name matches a full one.  A trigram index on
+    rhs can answer it.
+    """
+
+    arg_joiner = " <%% "
+    template = "%(expressions)s"
+    output_field = BooleanField()
+
+
+class TrigramWordSimilarity(Func):
+    """pg_trgm's word_similarity(), which Django only has from 4.0."""
+
+    function = "WORD_SIMILARITY"
+    output_field = FloatField()
+
+
+def get_search_candidates(query):
+    """
+    Ids of badges whose name, badge name or last name could match query.
+    Each branch of the union is answered from its own index (the trigram
+    indexes for %, attendee_lastname_upper for iexact), which they can't be
+    when ORed together across the attendee join.
+    """
+    return (
+        Badge.objects.filter(Q(TrigramSimilar(F("attendee__fullName"), Value(query))))
+        .values("pk")
+        .union(
+            Badge.objects.filter(
+                Q(TrigramSimilar(F("badgeName"), Value(query)))
+            ).values("pk"),
+            Badge.objects.filter(attendee__lastName__iexact=query).values("pk"),
+        )
+    )
+
+
+def use_onsite_state_cache():
+    return getattr(settings, "ONSITE_SESSION_CACHE", False)
+
+
+def get_onsite_state_key(request):
+    return f"onsite:session:{request.session.session_key}"
+
+
+def get_onsite_state(request, name, default=None):
+    """
+    Read onsite admin state (the cart and terminal selection).  With
+    ONSITE_SESSION_CACHE it lives in the cache alongside the session, so
+    changing it doesn't write the session back to the database.
+    """
+    if not use_onsite_state_cache() or not request.session.session_key:
+        return request.session.get(name, default)
+    return cache.get(get_onsite_state_key(request), {}).get(name, default)
+
+
+def set_onsite_state(request, name, value):
+    """Store onsite admin state; a value of None removes it."""
+    if not use_onsite_state_cache() or not request.session.session_key:
+        if value is None:
+            request.session.pop(name, None)
+        else:
+            request.session[name] = value
+        return
+    key = get_onsite_state_key(request)
+    state = cache.get(key, {})
+    if value is None:
+        state.pop(name, None)
+    else:
+        state[name] = value
+    cache.set(key, state, request.session.get_expiry_age())
+
+
+def keep_session_alive(request):
+    """
+    Extend the session only once it's within SESSION_REFRESH_THRESHOLD
+    seconds of expiring, rather than writing it on every poll.
+    """
+    now = time.time()
+    expiry_age = request.session.get_expiry_age()
+    threshold = getattr(settings, "SESSION_REFRESH_THRESHOLD", expiry_age / 2)
+    last = request.session.get("heartbeat", 0)
+    if last + expiry_age - now < threshold:
+        request.session["heartbeat"] = now
+        if use_onsite_state_cache() and request.session.session_key:
+            key = get_onsite_state_key(request)
+            cache.touch(key, expiry_age)
+
+
 def get_active_terminal(request):
-    term_id = request.session.get("terminal")
+    term_id = get_onsite_state(request, "terminal")
     if term_id:
         try:
             return Firebase.objects.get(pk=int(term_id))
@@ -66,17 +177,16 @@ def get_active_terminal(request):
 
 @staff_member_required
 def onsite_admin(request):
-    # Modify a dummy session variable to keep it alive
-    request.session["heartbeat"] = time.time()
+    keep_session_alive(request)
 
     terminals = list(Firebase.objects.order_by("name").all())
-    term = request.session.get("terminal", None)
+    term = get_onsite_state(request, "terminal")
 
     errors = []
 
     # Set default payment terminal to use:
     if term is None and len(terminals) > 0:
-        request.session["terminal"] = terminals[0].id
+        set_onsite_state(request, "terminal", terminals[0].id)
 
     if len(terminals) == 0:
         errors.append(
@@ -96,9 +206,9 @@ def onsite_admin(request):
     if url_terminal is not None:
         try:
             terminal_obj = Firebase.objects.get(id=int(url_terminal))
-            request.session["terminal"] = terminal_obj.id
+            set_onsite_state(request, "terminal", terminal_obj.id)
         except Firebase.DoesNotExist:
-            del request.session["terminal"]
+            set_onsite_state(request, "terminal", None)
             errors.append(
                 {
                     "type": "warning",
@@ -123,67 +233,88 @@ def onsite_admin(request):
                 "square_terminal": terminal.square_terminal_id is not None,
                 "payment_type": terminal.payment_type,
                 "cashdrawer": terminal.cashdrawer,
-            }
+            },
         }
 
     context = {
-        "settings": json.dumps({
-            "user": {
-                "id": request.user.id,
-                "email": request.user.email,
-                "station": terminal.name if terminal else None,
-            },
-            "sentry": {
-                "enabled": getattr(settings, "SENTRY_ENABLED", False),
-                "user_reports": getattr(settings, "SENTRY_USER_REPORTS", False),
-                "frontend_dsn": getattr(settings, "SENTRY_FRONTEND_DSN", None),
-                "environment": getattr(settings, "SENTRY_ENVIRONMENT", None),
-                "release": getattr(settings, "SENTRY_RELEASE", None),
-            },
-            "errors": errors,
-            "mqtt": {
-                "broker": getattr(settings, "MQTT_EXTERNAL_BROKER", None),
-                "auth": mqtt_auth,
-            },
-            "shirt_sizes": [{"name": s.name, "id": s.id} for s in ShirtSizes.objects.all()],
-            "urls": {
-                "assign_badge_number": reverse("registration:assign_badge_number"),
-                "mark_checked_in": reverse("registration:mark_checked_in"),
-                "cash_deposit": reverse("registration:cash_deposit"),
-                "cash_pickup": reverse("registration:cash_pickup"),
-                "close_drawer": reverse("registration:close_drawer"),
-                "complete_cash_transaction": reverse("registration:complete_cash_transaction"),
-                "enable_payment": reverse("registration:enable_payment"),
-                "logout": reverse("registration:logout"),
-                "no_sale": reverse("registration:no_sale"),
-                "onsite_add_to_cart": reverse("registration:onsite_add_to_cart"),
-                "onsite_admin_cart": reverse("registration:onsite_admin_cart"),
-                "onsite_admin_clear_cart": reverse("registration:onsite_admin_clear_cart"),
-                "onsite_admin_search": reverse("registration:onsite_admin_search"),
-                "onsite_admin_transfer_cart": reverse("registration:onsite_admin_transfer_cart"),
-                "onsite_admin": reverse("registration:onsite_admin"),
-                "onsite_create_discount": reverse("registration:onsite_create_discount"),
-                "onsite_print_badges": reverse("registration:onsite_print_badges"),
-                "onsite_print_clear": reverse("registration:onsite_print_clear"),
-                "onsite_print_receipts": reverse("registration:onsite_print_receipts"),
-                "onsite_remove_from_cart": reverse("registration:onsite_remove_from_cart"),
-                "onsite": reverse("registration:onsite"),
-                "open_drawer": reverse("registration:open_drawer"),
-                "pdf": reverse("registration:pdf"),
-                "registration_badge_change": reverse("admin:registration_badge_change", args=(0,)),
-                "safe_drop": reverse("registration:safe_drop"),
-                "set_terminal_status": reverse("registration:terminal_status"),
-            },
-            "permissions": {
-                "cash": request.user.has_perm("registration.cash"),
-                "cash_admin": request.user.has_perm("registration.cash_admin"),
-                "discount": request.user.has_perm("registration.discount"),
-            },
-            "terminals": {
-                "selected": selected_terminal,
-                "available": [{"id": terminal.id, "name": terminal.name} for terminal in terminals],
-            },
-        }),
+        "settings": json.dumps(
+            {
+                "user": {
+                    "id": request.user.id,
+                    "email": request.user.email,
+                    "station": terminal.name if terminal else None,
+                },
+                "sentry": {
+                    "enabled": getattr(settings, "SENTRY_ENABLED", False),
+                    "user_reports": getattr(settings, "SENTRY_USER_REPORTS", False),
+                    "frontend_dsn": getattr(settings, "SENTRY_FRONTEND_DSN", None),
+                    "environment": getattr(settings, "SENTRY_ENVIRONMENT", None),
+                    "release": getattr(settings, "SENTRY_RELEASE", None),
+                },
+                "errors": errors,
+                "mqtt": {
+                    "broker": getattr(settings, "MQTT_EXTERNAL_BROKER", None),
+                    "auth": mqtt_auth,
+                },
+                "shirt_sizes": [
+                    {"name": s.name, "id": s.id} for s in ShirtSizes.objects.all()
+                ],
+                "urls": {
+                    "assign_badge_number": reverse("registration:assign_badge_number"),
+                    "mark_checked_in": reverse("registration:mark_checked_in"),
+                    "cash_deposit": reverse("registration:cash_deposit"),
+                    "cash_pickup": reverse("registration:cash_pickup"),
+                    "close_drawer": reverse("registration:close_drawer"),
+                    "complete_cash_transaction": reverse(
+                        "registration:complete_cash_transaction"
+                    ),
+                    "enable_payment": reverse("registration:enable_payment"),
+                    "logout": reverse("registration:logout"),
+                    "no_sale": reverse("registration:no_sale"),
+                    "onsite_add_to_cart": reverse("registration:onsite_add_to_cart"),
+                    "onsite_admin_cart": reverse("registration:onsite_admin_cart"),
+                    "onsite_admin_clear_cart": reverse(
+                        "registration:onsite_admin_clear_cart"
+                    ),
+                    "onsite_admin_search": reverse("registration:onsite_admin_search"),
+                    "onsite_admin_transfer_cart": reverse(
+                        "registration:onsite_admin_transfer_cart"
+                    ),
+                    "onsite_admin": reverse("registration:onsite_admin"),
+                    "onsite_create_discount": reverse(
+                        "registration:onsite_create_discount"
+                    ),
+                    "onsite_print_badges": reverse("registration:onsite_print_badges"),
+                    "onsite_print_clear": reverse("registration:onsite_print_clear"),
+                    "onsite_print_receipts": reverse(
+                        "registration:onsite_print_receipts"
+                    ),
+                    "onsite_remove_from_cart": reverse(
+                        "registration:onsite_remove_from_cart"
+                    ),
+                    "onsite": reverse("registration:onsite"),
+                    "open_drawer": reverse("registration:open_drawer"),
+                    "pdf": reverse("registration:pdf"),
+                    "registration_badge_change": reverse(
+                        "admin:registration_badge_change", args=(0,)
+                    ),
+                    "safe_drop": reverse("registration:safe_drop"),
+                    "set_terminal_status": reverse("registration:terminal_status"),
+                },
+                "permissions": {
+                    "cash": request.user.has_perm("registration.cash"),
+                    "cash_admin": request.user.has_perm("registration.cash_admin"),
+                    "discount": request.user.has_perm("registration.discount"),
+                },
+                "terminals": {
+                    "selected": selected_terminal,
+                    "available": [
+                        {"id": terminal.id, "name": terminal.name}
+                        for terminal in terminals
+                    ],
+                },
+            }
+        ),
     }
 
     return render(request, "registration/onsite-admin.html", context)
@@ -216,62 +347,95 @@ class SearchFields:
         return SearchFields(query=query, birthday=birthday)
 
 
+ORDER_SEARCH_PAGE_SIZE = 25
+
+
 @staff_member_required
 def onsite_admin_search_orders(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     query = request.GET.get("search", None)
     if query is None:
         return redirect("registration:onsite_admin")
 
-    data = []
-
     query = query.strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
 
-    def make_response_object(order_item):
-        return {
-            "id": order_item.order_id,
-            "reference": order_item.order.reference,
-            "editUrl": reverse("admin:registration_order_change", args=(order_item.order_id,)),
-            "attendee": {
-                "firstName": order_item.badge.attendee.firstName,
-                "lastName": order_item.badge.attendee.lastName,
-                "preferredName": order_item.badge.attendee.preferredName,
-            },
-        }
-
-    checked_order_ids = set()
-    filtered_orders = {}
-
-    order_item_results = OrderItem.objects.all()
-    for order_item in order_item_results:
-        if not order_item.badge:
-            continue
-
-        if order_item.order_id in checked_order_ids:
-            continue
-
-        checked_order_ids.add(order_item.order_id)
-
-        if query.lower() in order_item.order.reference:
-            filtered_orders[order_item.order_id] = make_response_object(order_item)
-            continue
+    if not query:
+        return JsonResponse(
+            {"success": True, "results": [], "page": page, "more": False}
+        )
 
-        full_name = order_item.badge.attendee.firstName + " " + order_item.badge.attendee.lastName
-        if query.lower() in full_name.lower():
-            filtered_orders[order_item.order_id] = make_response_object(order_item)
-            continue
+    # Order references are uppercase tokens; prefix matches rank above name matches.
+    reference_match = Q(order__reference__startswith=query.upper())
+    filters = reference_match | Q(
+        TrigramWordSimilar(Value(query), F("badge__attendee__fullName"))
+    )
+    if "@" in query:
+        filters |= Q(order__billingEmail__iexact=query) | Q(
+            badge__attendee__email__iexact=query
+        )
 
-    data = list(filtered_orders.values())
+    start = (page - 1) * ORDER_SEARCH_PAGE_SIZE
+    matches = list(
+        OrderItem.objects.filter(badge__event=event, order__isnull=False)
+        .annotate(
+            name_similarity=TrigramWordSimilarity(
+                Value(query), F("badge__attendee__fullName")
+            )
+        )
+        .filter(filters)
+        .annotate(
+            rank=Case(
+                When(reference_match, then=Value(1.0)),
+                default=F("name_similarity"),
+                output_field=FloatField(),
+            )
+        )
+        .values("order_id")
+        .annotate(score=Max("rank"))
+        .order_by("-score", "order_id")
+        .values_list("order_id", flat=True)[start : start + ORDER_SEARCH_PAGE_SIZE + 1]
+    )
+    more = len(matches) > ORDER_SEARCH_PAGE_SIZE
+    order_ids = matches[:ORDER_SEARCH_PAGE_SIZE]
+
+    # Show the first attendee on each order, as the order admin does.
+    first_items = {}
+    order_items = (
+        OrderItem.objects.filter(order_id__in=order_ids, badge__event=event)
+        .select_related("order", "badge__attendee")
+        .order_by("pk")
+    )
+    for order_item in order_items:
+        first_items.setdefault(order_item.order_id, order_item)
 
-    from django.db import connection
-    print(len(connection.queries))
+    data = []
+    for order_id in order_ids:
+        order_item = first_items[order_id]
+        data.append(
+            {
+                "id": order_item.order_id,
+                "reference": order_item.order.reference,
+                "editUrl": reverse(
+                    "admin:registration_order_change", args=(order_item.order_id,)
+                ),
+                "attendee": {
+                    "firstName": order_item.badge.attendee.firstName,
+                    "lastName": order_item.badge.attendee.lastName,
+                    "preferredName": order_item.badge.attendee.preferredName,
+                },
+            }
+        )
 
-    return JsonResponse({"success": True, "results": data})
+    return JsonResponse({"success": True, "results": data, "page": page, "more": more})
 
 
 @staff_member_required
 def onsite_admin_search(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     query = request.GET.get("search", None)
     if query is None:
         return redirect("registration:onsite_admin")
@@ -279,25 +443,35 @@ def onsite_admin_search(request):
     data = []
 
     def collectBadges(badges):
+        badges = badges.select_related("attendee").prefetch_related(
+            Prefetch(
+                "orderitem_set",
+                queryset=OrderItem.objects.select_related("order").order_by("pk"),
+            )
+        )
         for badge in badges:
-            order = OrderItem.objects.filter(badge=badge).first().order
-            data.append({
-                "id": badge.id,
-                "editUrl": reverse("admin:registration_badge_change", args=(badge.id,)),
-                "orderReference": order.reference,
-                "checkedInDate": order.checkedInDate,
-                "wristBandCountPickedUp": order.wristBandCountPickedUp,
-                "cabinAssignment": order.cabinAssignment,
-                "campsiteAssignment": order.campsiteAssignment,
-                "attendee": {
-                    "firstName": badge.attendee.firstName,
-                    "lastName": badge.attendee.lastName,
-                    "preferredName": badge.attendee.preferredName,
-                },
-                "badgeName": badge.badgeName,
-                "badgeNumber": badge.badgeNumber,
-                "abandoned": badge.abandoned,
-            })
+            order = badge.orderitem_set.all()[0].order
+            data.append(
+                {
+                    "id": badge.id,
+                    "editUrl": reverse(
+                        "admin:registration_badge_change", args=(badge.id,)
+                    ),
+                    "orderReference": order.reference,
+                    "checkedInDate": order.checkedInDate,
+                    "wristBandCountPickedUp": order.wristBandCountPickedUp,
+                    "cabinAssignment": order.cabinAssignment,
+                    "campsiteAssignment": order.campsiteAssignment,
+                    "attendee": {
+                        "firstName": badge.attendee.firstName,
+                        "lastName": badge.attendee.lastName,
+                        "preferredName": badge.attendee.preferredName,
+                    },
+                    "badgeName": badge.badgeName,
+                    "badgeNumber": badge.badgeNumber,
+                    "abandoned": badge.statusAssociation,
+                }
+            )
 
     query = query.strip()
 
@@ -307,20 +481,31 @@ def onsite_admin_search(request):
         badges = Badge.objects.filter(event=event, badgeNumber__in=fields.badge_ids)
         collectBadges(badges)
 
-    fullName = Func(F("attendee__firstName"), Value(" "), F("attendee__lastName"), function="CONCAT")
+    if not fields.query:
+        return JsonResponse({"success": True, "results": data})
+
     greaterSimilarity = Func("name_similarity", "badge_similarity", function="GREATEST")
 
-    filters = (Q(name_similarity__gte=0.4) | Q(badge_similarity__gte=0.6) | Q(attendee__lastName__iexact=fields.query))
+    # The similarity thresholds narrow the indexed candidates.
+    filters = (
+        Q(name_similarity__gte=0.4)
+        | Q(badge_similarity__gte=0.6)
+        | Q(attendee__lastName__iexact=fields.query)
+    )
 
     if fields.birthday:
         filters = filters & Q(attendee__birthdate=fields.birthday)
 
-    results = Badge.objects.annotate(
-        name_similarity=TrigramSimilarity(fullName, fields.query),
-        badge_similarity=TrigramSimilarity("badgeName", fields.query),
-    ).filter(
-        Q(event=event) & filters
-    ).order_by(greaterSimilarity).reverse().prefetch_related("attendee")[:50]
+    results = (
+        Badge.objects.filter(event=event, pk__in=get_search_candidates(fields.query))
+        .annotate(
+            name_similarity=TrigramSimilarity("attendee__fullName", fields.query),
+            badge_similarity=TrigramSimilarity("badgeName", fields.query),
+        )
+        .filter(filters)
+        .order_by(greaterSimilarity)
+        .reverse()[:50]
+    )
 
     collectBadges(results)
 
@@ -330,19 +515,27 @@ def onsite_admin_search(request):
 def update_terminal_status(request, status: str) -> JsonResponse:
     active = get_terminal_from_request(request)
     if not active:
-        return JsonResponse({"success": False, "reason": "No terminal associated with request"}, status=400)
+        return JsonResponse(
+            {"success": False, "reason": "No terminal associated with request"},
+            status=400,
+        )
 
     stateCommand = status
     if stateCommand == "close":
         stateCommand = "closed"
-    mqtt.send_mqtt_message(f"{mqtt.get_topic('admin', active.name)}/terminal/state", stateCommand)
+    mqtt.send_mqtt_message(
+        f"{mqtt.get_topic('admin', active.name)}/terminal/state", stateCommand
+    )
 
     if status not in ("close", "open", "ready"):
         return JsonResponse({"success": True})
 
-    return send_mqtt_message_to_terminal(active, {
-        status: {},
-    })
+    return send_mqtt_message_to_terminal(
+        active,
+        {
+            status: {},
+        },
+    )
 
 
 @staff_member_required
@@ -353,14 +546,14 @@ def set_terminal_status(request):
 
 def get_terminal_from_request(request) -> Optional[Firebase]:
     url_terminal = request.GET.get("terminal", None)
-    session_terminal = request.session.get("terminal", None)
+    session_terminal = get_onsite_state(request, "terminal")
 
     active = None
 
     if url_terminal:
         try:
             active = Firebase.objects.get(id=int(url_terminal))
-            request.session["terminal"] = active.id
+            set_onsite_state(request, "terminal", active.id)
         except (ValueError, Firebase.DoesNotExist):
             return None
 
@@ -373,31 +566,36 @@ def get_terminal_from_request(request) -> Optional[Firebase]:
     return active
 
 
-def send_mqtt_message_to_terminal(request: Union[HttpRequest, Firebase], data: dict) -> JsonResponse:
+def send_mqtt_message_to_terminal(
+    request: Union[HttpRequest, Firebase], data: dict
+) -> JsonResponse:
     if isinstance(request, Firebase):
         active = request
     else:
         active = get_terminal_from_request(request)
         if not active:
-            return JsonResponse({"sucess": False, "reason": "No terminal associated with request"}, status=400)
+            return JsonResponse(
+                {"sucess": False, "reason": "No terminal associated with request"},
+                status=400,
+            )
 
     name = active.name
     topic = f'{mqtt.get_topic("terminal", name)}/action'
 
-    try:
-        mqtt.send_mqtt_message(topic, data)
-    except Exception as ex:
-        logger.error("could not send mqtt message: %s", ex)
-        return JsonResponse({"success": False, "reason": "Could not send MQTT message"}, status=500)
+    if not mqtt.send_mqtt_message(topic, data):
+        logger.error("could not send mqtt message to %s", topic)
+        return JsonResponse(
+            {"success": False, "reason": "Could not send MQTT message"}, status=500
+        )
 
     return JsonResponse({"success": True})
 
 
 @staff_member_required
 def enable_payment(request):
-    cart = request.session.get("cart", None)
+    cart = get_onsite_state(request, "cart")
     if cart is None:
-        request.session["cart"] = []
+        set_onsite_state(request, "cart", [])
         return JsonResponse(
             {"success": False, "message": "Cart not initialized"}, status=200
         )
@@ -433,38 +631,54 @@ def enable_payment(request):
 
     terminal = get_terminal_from_request(request)
     if not terminal:
-        return JsonResponse({"sucess": False, "reason": "No terminal associated with request."})
+        return JsonResponse(
+            {"sucess": False, "reason": "No terminal associated with request."}
+        )
 
     order_id = payments.create_square_order(str(terminal.name), data)
 
-    if (terminal.payment_type == Firebase.SQUARE_TERMINAL or request.GET.get("fallback", None) == "true") and terminal.square_terminal_id:
+    if (
+        terminal.payment_type == Firebase.SQUARE_TERMINAL
+        or request.GET.get("fallback", None) == "true"
+    ) and terminal.square_terminal_id:
         resp = payments.prompt_terminal_payment(
             request,
             str(terminal.square_terminal_id),
             int(data["total"] * 100),
             data["reference"],
             render_to_string("registration/customer-note.txt", data),
-            order_id
+            order_id,
         )
 
-        return JsonResponse({
-            "success": resp.is_success(),
-            "reason": ", ".join([error["detail"] for error in resp.errors]) if resp.errors else None,
-        })
-    elif terminal.payment_type == Firebase.MQTT_REGISTER_APP:
-        return send_mqtt_message_to_terminal(terminal, {
-            "processPayment": {
-                "orderId": order_id,
-                "total": int(data["total"] * 100),
-                "reference": data["reference"],
-                "note": render_to_string("registration/customer-note.txt", data),
+        return JsonResponse(
+            {
+                "success": resp.is_success(),
+                "reason": (
+                    ", ".join([error["detail"] for error in resp.errors])
+                    if resp.errors
+                    else None
+                ),
             }
-        })
+        )
+    elif terminal.payment_type == Firebase.MQTT_REGISTER_APP:
+        return send_mqtt_message_to_terminal(
+            terminal,
+            {
+                "processPayment": {
+                    "orderId": order_id,
+                    "total": int(data["total"] * 100),
+                    "reference": data["reference"],
+                    "note": render_to_string("registration/customer-note.txt", data),
+                }
+            },
+        )
     else:
-        return JsonResponse({
-            "success": False,
-            "reason": "Terminal does not have payment type",
-        })
+        return JsonResponse(
+            {
+                "success": False,
+                "reason": "Terminal does not have payment type",
+            }
+        )
 
 
 @staff_member_required
@@ -482,7 +696,7 @@ def assign_badge_number(request):
             {"success": False, "errors": errors, "message": "\n".join(errors)},
             status=400,
         )
-    return JsonResponse({"success": True})
+    return JsonResponse({"success": True, "update": admin_push_cart_refresh(request)})
 
 
 @staff_member_required
@@ -500,11 +714,13 @@ def mark_checked_in(request):
     print(order)
 
     if not order:
-        return JsonResponse({
-            "success": False,
-            "errors": ["Order not found"],
-            "message": "Order not found",
-        })
+        return JsonResponse(
+            {
+                "success": False,
+                "errors": ["Order not found"],
+                "message": "Order not found",
+            }
+        )
 
     order.checkedInDate = timezone.now()
     order.wristBandCountPickedUp = wristband_count
@@ -513,7 +729,13 @@ def mark_checked_in(request):
     order.attendingDinner = attending_dinner
     order.save()
 
-    return JsonResponse({"success": True, "message": "Guest has been checked in"})
+    return JsonResponse(
+        {
+            "success": True,
+            "message": "Guest has been checked in",
+            "update": admin_push_cart_refresh(request),
+        }
+    )
 
 
 def get_messages_list(request):
@@ -525,14 +747,31 @@ def get_messages_list(request):
 def onsite_print_badges(request):
     badge_list = request.GET.getlist("id")
 
+    if print_jobs.use_print_jobs():
+        job = print_jobs.enqueue(
+            [int(badge_id) for badge_id in badge_list],
+            terminal=get_active_terminal(request),
+            request=request,
+        )
+        return JsonResponse(
+            {
+                "success": True,
+                "next": request.get_full_path(),
+                "job": print_jobs.get_job_status(job),
+                "status_url": reverse("registration:onsite_print_job", args=(job.pk,)),
+            }
+        )
+
     if getattr(settings, "PRINT_RENDERER", "wkhtmltopdf") == "gotenberg":
         terminal = get_active_terminal(request)
 
         signer = TimestampSigner()
-        data = signer.sign_object({
-            "badge_ids": [int(badge_id) for badge_id in badge_list],
-            "terminal": terminal.name if terminal else None,
-        })
+        data = signer.sign_object(
+            {
+                "badge_ids": [int(badge_id) for badge_id in badge_list],
+                "terminal": terminal.name if terminal else None,
+            }
+        )
 
         pdf_path = reverse("registration:pdf") + f"?data={data}"
     else:
@@ -557,11 +796,170 @@ def onsite_print_badges(request):
     )
 
 
-def admin_push_cart_refresh(request):
-    terminal = get_active_terminal(request)
-    if terminal:
-        topic = f"{mqtt.get_topic('admin', terminal.name)}/refresh"
-        mqtt.send_mqtt_message(topic, None)
+@staff_member_required
+def onsite_print_job(request, job_id):
+    try:
+        job = PrintJob.objects.get(pk=job_id)
+    except PrintJob.DoesNotExist:
+        return JsonResponse({"success": False, "reason": "Job not found"}, status=404)
+    return JsonResponse({"success": True, "job": print_jobs.get_job_status(job)})
+
+
+# How long a terminal's last pushed cart is kept to diff against.
+CART_STATE_TIMEOUT = 60 * 60 * 12
+
+
+def get_cart_state_key(terminal):
+    return f"onsite:cart:{terminal.pk}"
+
+
+def get_cart_version_key(terminal):
+    return f"onsite:cart:{terminal.pk}:version"
+
+
+def next_cart_version(terminal):
+    """
+    A new cart version for the terminal, from a counter that never expires
+    and is incremented atomically.  The counter starts from the clock, so
+    versions keep going up even if it is evicted.
+    """
+    key = get_cart_version_key(terminal)
+    for _ in range(2):
+        cache.add(key, int(time.time() * 1000), None)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr.
+            continue
+    return int(time.time() * 1000)
+
+
+def diff_cart(old, new):
+    """
+    The fields of new that differ from old, with badges matched by id.
+    Returns None if nothing changed.
+    """
+    changes = {
+        key: value
+        for key, value in new.items()
+        if key != "result" and old.get(key) != value
+    }
+    old_badges = {badge["id"]: badge for badge in old["result"]}
+    badges = []
+    for badge in new["result"]:
+        before = old_badges.get(badge["id"])
+        if before is None:
+            badges.append(badge)
+            continue
+        fields = {
+            key: value for key, value in badge.items() if before.get(key) != value
+        }
+        if fields:
+            badges.append(dict(fields, id=badge["id"]))
+    order = [badge["id"] for badge in new["result"]]
+
+    if not changes and not badges and order == list(old_badges):
+        return None
+    return {"changes": changes, "badges": badges, "order": order}
+
+
+def store_cart_state(terminal, cart, data):
+    """
+    Remember data as the terminal's cart and push what changed since the
+    last one over MQTT.  Returns the update, or None if nothing changed.
+
+    Each update carries the version it was diffed against, so a frontend
+    that missed one refetches the whole cart instead of applying it.  If the
+    stored cart was evicted the update has no base and replaces whatever the
+    frontend had.
+    """
+    key = get_cart_state_key(terminal)
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    state = cache.get(key)
+    if state is not None:
+        diff = diff_cart(state["data"], data)
+        if diff is None:
+            return None
+        base = state["version"]
+    else:
+        diff = {
+            "changes": data,
+            "badges": data["result"],
+            "order": [badge["id"] for badge in data["result"]],
+        }
+        base = None
+    version = next_cart_version(terminal)
+
+    cache.set(
+        key, {"version": version, "cart": list(cart), "data": data}, CART_STATE_TIMEOUT
+    )
+
+    update = dict(diff, version=version, base=base)
+    mqtt.send_mqtt_message(f"{mqtt.get_topic('admin', terminal.name)}/cart", update)
+    return update
+
+
+def get_cart_version(terminal):
+    state = cache.get(get_cart_state_key(terminal))
+    return state["version"] if state else None
+
+
+def get_terminal_cart_message(data):
+    return {
+        "updateCart": {
+            "cart": {
+                "badges": list(
+                    map(
+                        lambda badge: {
+                            "id": badge["id"],
+                            "firstName": badge["firstName"],
+                            "lastName": badge["lastName"],
+                            "badgeName": badge["badgeName"],
+                            "effectiveLevel": {
+                                "name": badge["effectiveLevel"]["name"],
+                                "price": str(badge["level_subtotal"]),
+                            },
+                            "discountedPrice": str(badge["level_total"]),
+                        },
+                        data["result"],
+                    )
+                ),
+                "charityDonation": str(data["charityDonation"]),
+                "organizationDonation": str(data["orgDonation"]),
+                "totalDiscount": str(data["total_discount"]),
+                "total": str(data["total"]),
+                "paid": str(data["paid"]),
+            }
+        }
+    }
+
+
+def push_cart_update(terminal, cart=None):
+    """
+    Rebuild the terminal's cart after something in it changed and push the
+    difference to its onsite admin page and the terminal itself.  Without
+    a cart, the badges from the last update are used.
+    """
+    if terminal is None:
+        return None
+    if cart is None:
+        state = cache.get(get_cart_state_key(terminal))
+        if state is None:
+            return None
+        cart = state["cart"]
+
+    cart = list(cart)
+    data = build_result(cart)
+    update = store_cart_state(terminal, cart, data)
+    if update is not None:
+        send_mqtt_message_to_terminal(terminal, get_terminal_cart_message(data))
+    return update
+
+
+def admin_push_cart_refresh(request, cart=None):
+    if cart is None:
+        cart = get_onsite_state(request, "cart")
+    return push_cart_update(get_active_terminal(request), cart)
 
 
 # TODO: update for square SDK data type (fetch txn from square API and store in order.apiData)
@@ -570,11 +968,13 @@ def complete_square_transaction(request):
     try:
         token = request.headers.get("authorization").removeprefix("Bearer ")
     except:
-        return JsonResponse({"success": False, "reason": "Invalid authorization"}, status=401)
+        return JsonResponse(
+            {"success": False, "reason": "Invalid authorization"}, status=401
+        )
 
     try:
         terminal = Firebase.objects.get(token=token)
-        request.session["terminal"] = terminal.id
+        set_onsite_state(request, "terminal", terminal.id)
     except Firebase.DoesNotExist:
         return JsonResponse(
             {
@@ -703,7 +1103,7 @@ def no_sale(request):
 @permission_required("order.cash_admin")
 def print_audit_receipt(request, audit_type, cash_ledger, cashdraw=True):
     position = get_active_terminal(request)
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     payload = {
         "v": 1,
         "event": event.name,
@@ -784,7 +1184,7 @@ def cash_receipt_payload(order: Order, tendered: str, total: str) -> dict:
                 {"item": "Discount", "price": "-%{0}".format(order.discount.percentOff)}
             )
 
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     payload = {
         "v": 1,
         "event": event.name,
@@ -851,13 +1251,13 @@ def complete_cash_transaction(request):
 
     payload = cash_receipt_payload(order, tendered, total)
 
-    term = request.session.get("terminal", None)
+    term = get_onsite_state(request, "terminal")
     active = Firebase.objects.get(id=term)
     topic = f"{mqtt.get_topic('receipts', active.name)}/print_cash"
 
     mqtt.send_mqtt_message(topic, payload)
 
-    return JsonResponse({"success": True})
+    return JsonResponse({"success": True, "update": admin_push_cart_refresh(request)})
 
 
 @csrf_exempt
@@ -966,16 +1366,49 @@ def get_line_items(attendee_options):
 
 
 def build_result(cart):
+    # Everything the cart needs is loaded up front, in a fixed number of queries.
+    order_items = (
+        OrderItem.objects.filter(order__isnull=False)
+        .select_related("priceLevel", "order__discount")
+        .prefetch_related(
+            Prefetch(
+                "attendeeoptions_set",
+                queryset=AttendeeOptions.objects.select_related("option").order_by(
+                    "option__optionName"
+                ),
+                to_attr="options",
+            )
+        )
+        .order_by("pk")
+    )
+    badges_by_id = (
+        Badge.objects.select_related("attendee__holdType")
+        .prefetch_related(
+            Prefetch("orderitem_set", queryset=order_items, to_attr="cart_order_items")
+        )
+        .in_bulk(cart)
+    )
+
     badges = []
-    for pk in cart:
-        try:
-            badge = Badge.objects.get(id=pk)
-            badges.append(badge)
-        except Badge.DoesNotExist:
+    for pk in list(cart):
+        badge = badges_by_id.get(pk)
+        if badge is None:
             cart.remove(pk)
             logger.error(
                 "ID {0} was in cart but doesn't exist in the database".format(pk)
             )
+        else:
+            badges.append(badge)
+
+    staff_by_attendee = {}
+    staff_badges = [badge for badge in badges if badge.statusAssociation == Badge.STAFF]
+    if staff_badges:
+        staff_rows = Staff.objects.filter(
+            attendee_id__in={badge.attendee_id for badge in staff_badges},
+            event_id__in={badge.event_id for badge in staff_badges},
+        ).select_related("shirtsize")
+        for staff in staff_rows:
+            staff_by_attendee.setdefault((staff.attendee_id, staff.event_id), staff)
 
     order = None
     subtotal = 0
@@ -983,23 +1416,22 @@ def build_result(cart):
     result = []
     orders = set()
     for badge in badges:
-        oi = badge.getOrderItems()
+        oi = badge.cart_order_items
         level = None
         level_subtotal = 0
         attendee_options = []
         effectiveLevel = None
         for item in oi:
             level = item.priceLevel
-            attendee_options.append(get_line_items(item.getOptions()))
-            level_subtotal += get_order_item_option_total(item.getOptions())
+            attendee_options.append(get_line_items(item.options))
+            level_subtotal += LineItem.for_order_item(item, item.options).subtotal
 
             if level:
                 effectiveLevel = {"name": level.name, "price": level.basePrice}
-                level_subtotal += level.basePrice
 
         subtotal += level_subtotal
 
-        order = badge.getOrder()
+        order = oi[0].order
         orders.add(order)
 
         holdType = None
@@ -1007,15 +1439,14 @@ def build_result(cart):
             holdType = badge.attendee.holdType.name
 
         level_discount = (
-            Decimal(get_discount_total(order.discount, level_subtotal) * 100)
-            * TWOPLACES
+            Decimal(discount_total(order.discount, level_subtotal) * 100) * TWOPLACES
         )
         total_discount += level_discount
 
         staff_data = None
 
-        if badge.abandoned == Badge.STAFF:
-            staff = Staff.objects.get(event=badge.event, attendee=badge.attendee)
+        if badge.statusAssociation == Badge.STAFF:
+            staff = staff_by_attendee[(badge.attendee_id, badge.event_id)]
 
             staff_data = {
                 "shirtSize": staff.shirtsize.name if staff.shirtsize else None,
@@ -1027,7 +1458,7 @@ def build_result(cart):
             "lastName": badge.attendee.lastName,
             "badgeName": badge.badgeName,
             "badgeNumber": badge.badgeNumber,
-            "abandoned": badge.abandoned,
+            "abandoned": badge.statusAssociation,
             "effectiveLevel": effectiveLevel,
             "discount": get_discount_dict(order.discount),
             "age": get_attendee_age(badge.attendee),
@@ -1054,7 +1485,12 @@ def build_result(cart):
 
     for order in orders:
         total += order.orgDonation + order.charityDonation
-        paid += order.total if order.billingType != Order.UNPAID and order.status in (Order.CAPTURED, Order.COMPLETED) else 0
+        paid += (
+            order.total
+            if order.billingType != Order.UNPAID
+            and order.status in (Order.CAPTURED, Order.COMPLETED)
+            else 0
+        )
 
         charityDonation += order.charityDonation
         orgDonation += order.orgDonation
@@ -1083,35 +1519,17 @@ def build_result(cart):
 @staff_member_required
 def onsite_admin_cart(request):
     # Returns dataset to render onsite cart preview
-    request.session["heartbeat"] = time.time()  # Keep session alive
-    cart = request.session.get("cart", [])
+    keep_session_alive(request)
+    cart = get_onsite_state(request, "cart", [])
 
     data = build_result(cart)
 
-    terminal_data = {
-        "updateCart": {
-            "cart": {
-                "badges": list(map(lambda badge: {
-                    "id": badge["id"],
-                    "firstName": badge["firstName"],
-                    "lastName": badge["lastName"],
-                    "badgeName": badge["badgeName"],
-                    "effectiveLevel": {
-                        "name": badge["effectiveLevel"]["name"],
-                        "price": str(badge["level_subtotal"]),
-                    },
-                    "discountedPrice": str(badge["level_total"]),
-                }, data["result"])),
-                "charityDonation": str(data["charityDonation"]),
-                "organizationDonation": str(data["orgDonation"]),
-                "totalDiscount": str(data["total_discount"]),
-                "total": str(data["total"]),
-                "paid": str(data["paid"]),
-            }
-        }
-    }
-
-    send_mqtt_message_to_terminal(request, terminal_data)
+    terminal = get_terminal_from_request(request)
+    if terminal:
+        # Polls of an unchanged cart don't go out to the terminal again.
+        if store_cart_state(terminal, cart, data) is not None:
+            send_mqtt_message_to_terminal(terminal, get_terminal_cart_message(data))
+        data["version"] = get_cart_version(terminal)
 
     return JsonResponse(data)
 
@@ -1135,18 +1553,26 @@ def onsite_add_id_to_cart(request, id):
             {"success": False, "reason": "ID parameter must be integer"}, status=400
         )
 
-    cart = request.session.get("cart", [])
+    cart = get_onsite_state(request, "cart", [])
 
     order_item = OrderItem.objects.filter(badge=badge, order__isnull=False).first()
     if order_item:
-        order_items = OrderItem.objects.filter(order=order_item.order, badge__isnull=False)
+        order_items = OrderItem.objects.filter(
+            order=order_item.order, badge__isnull=False
+        )
         for order_item in order_items:
             if order_item.badge_id not in cart:
                 cart.append(order_item.badge_id)
 
-    request.session["cart"] = cart
+    set_onsite_state(request, "cart", cart)
 
-    return JsonResponse({"success": True, "cart": cart})
+    return JsonResponse(
+        {
+            "success": True,
+            "cart": cart,
+            "update": admin_push_cart_refresh(request, cart),
+        }
+    )
 
 
 @staff_member_required
@@ -1164,24 +1590,32 @@ def onsite_remove_from_cart(request):
             {"success": False, "reason": "ID parameter must be integer"}, status=400
         )
 
-    cart = request.session.get("cart", None)
+    cart = get_onsite_state(request, "cart")
     if cart is None:
         return JsonResponse({"success": False, "reason": "Cart is empty"})
 
     try:
         cart.remove(id)
-        request.session["cart"] = cart
+        set_onsite_state(request, "cart", cart)
     except ValueError:
         return JsonResponse({"success": False, "cart": cart, "reason": "Not in cart"})
 
-    return JsonResponse({"success": True, "cart": cart})
+    return JsonResponse(
+        {
+            "success": True,
+            "cart": cart,
+            "update": admin_push_cart_refresh(request, cart),
+        }
+    )
 
 
 @staff_member_required
 def onsite_admin_clear_cart(request):
-    request.session["cart"] = []
+    set_onsite_state(request, "cart", [])
     send_mqtt_message_to_terminal(request, {"clearCart": {}})
-    return JsonResponse({"success": True, "cart": []})
+    terminal = get_active_terminal(request)
+    update = store_cart_state(terminal, [], build_result([])) if terminal else None
+    return JsonResponse({"success": True, "cart": [], "update": update})
 
 
 @staff_member_required
@@ -1192,9 +1626,12 @@ def onsite_admin_transfer_cart(request):
     firebase = Firebase.objects.get(id=terminal_id)
 
     topic = f'{mqtt.get_topic("admin", firebase.name)}/transfer'
-    mqtt.send_mqtt_message(topic, {
-        "badgeIds": [int(badge_id) for badge_id in badge_ids],
-    })
+    mqtt.send_mqtt_message(
+        topic,
+        {
+            "badgeIds": [int(badge_id) for badge_id in badge_ids],
+        },
+    )
 
     return JsonResponse({"success": True})
 
@@ -1220,13 +1657,15 @@ def create_discount(request):
         elif amount.endswith("%"):
             percent_off = int(amount[:-1])
         else:
-            return JsonResponse({"success": False, "reason": "Unknown discount type"}, status=400)
+            return JsonResponse(
+                {"success": False, "reason": "Unknown discount type"}, status=400
+            )
     except ValueError as e:
         return JsonResponse({"success": False, "reason": str(e)}, status=400)
 
-    cart = request.session.get("cart", None)
+    cart = get_onsite_state(request, "cart")
     if cart is None:
-        request.session["cart"] = []
+        set_onsite_state(request, "cart", [])
         return JsonResponse(
             {"success": False, "reason": "Cart not initialized"}, status=400
         )
@@ -1252,7 +1691,7 @@ def create_discount(request):
     orders[0].discount = discount
     orders[0].save()
 
-    return JsonResponse({"success": True})
+    return JsonResponse({"success": True, "update": admin_push_cart_refresh(request)})
 
 
 @staff_member_required
@@ -1274,7 +1713,7 @@ def onsite_print_clear(request):
     badge.printed = False
     badge.save()
 
-    return JsonResponse({"success": True})
+    return JsonResponse({"success": True, "update": admin_push_cart_refresh(request)})
 
 
 @csrf_exempt
@@ -1298,36 +1737,48 @@ def terminal_square_token(request):
     url = f"{base_url}/oauth2/authorize?client_id={settings.SQUARE_APPLICATION_ID}&state={state}&scope={'+'.join(scopes)}"
 
     topic = f"{mqtt.get_topic('admin', terminal.name)}/authorize_terminal"
-    mqtt.send_mqtt_message(topic, payload={
-        "url": url,
-        "state": state,
-    })
+    mqtt.send_mqtt_message(
+        topic,
+        payload={
+            "url": url,
+            "state": state,
+        },
+    )
 
     return JsonResponse(True, safe=False)
 
+
 def oauth_square(request):
     url_state = request.GET.get("state")
     cookie_state = request.COOKIES.get("square_oauth_state")
 
     if url_state != cookie_state:
-        return JsonResponse({"success": False, "reason": "Saved state did not match URL state"}, status=400)
+        return JsonResponse(
+            {"success": False, "reason": "Saved state did not match URL state"},
+            status=400,
+        )
 
     code = request.GET.get("code")
 
-    result = payments.client.o_auth.obtain_token({
-        "client_id": settings.SQUARE_APPLICATION_ID,
-        "client_secret": settings.SQUARE_APPLICATION_SECRET,
-        "code": code,
-        "grant_type": "authorization_code"
-    })
+    result = payments.client.o_auth.obtain_token(
+        {
+            "client_id": settings.SQUARE_APPLICATION_ID,
+            "client_secret": settings.SQUARE_APPLICATION_SECRET,
+            "code": code,
+            "grant_type": "authorization_code",
+        }
+    )
 
     if result.is_success():
-        send_mqtt_message_to_terminal(request, {
-            "updateToken": {
-                "accessToken": result.body["access_token"],
-                "refreshToken": result.body["refresh_token"]
-            }
-        })
+        send_mqtt_message_to_terminal(
+            request,
+            {
+                "updateToken": {
+                    "accessToken": result.body["access_token"],
+                    "refreshToken": result.body["refresh_token"],
+                }
+            },
+        )
         resp = HttpResponseRedirect(reverse("registration:onsite_admin"))
     else:
         print(result.errors)
@@ -1340,7 +1791,9 @@ def oauth_square(request):
 def print_receipts(request):
     terminal = get_active_terminal(request)
     if not terminal:
-        return JsonResponse({"success": False, "reason": "No terminal attached to session"}, status=400)
+        return JsonResponse(
+            {"success": False, "reason": "No terminal attached to session"}, status=400
+        )
 
     references = request.GET.getlist("reference", [])
     orders = Order.objects.filter(reference__in=references).prefetch_related()
@@ -1353,7 +1806,9 @@ def print_receipts(request):
             try:
                 note_data = json.loads(order.notes)
             except:
-                return JsonResponse({"success": False, "reason": "Cash order was missing note data"})
+                return JsonResponse(
+                    {"success": False, "reason": "Cash order was missing note data"}
+                )
 
             payload = cash_receipt_payload(order, note_data["tendered"], order.total)
             topic = f"{mqtt.get_topic('receipts', terminal.name)}/print_cash"
@@ -1361,9 +1816,21 @@ def print_receipts(request):
 
         elif order.billingType == Order.CREDIT:
             if not order.apiData or "payment" not in order.apiData:
-                return JsonResponse({"success": False, "reason": "Missing payment data on credit transaction"})
-
-            if not payments.print_payment_receipt(request, terminal.square_terminal_id, order.apiData["payment"]["id"]):
-                return JsonResponse({"success": False, "reason": "Got error attempting to print receipt"})
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "reason": "Missing payment data on credit transaction",
+                    }
+                )
+
+            if not payments.print_payment_receipt(
+                request, terminal.square_terminal_id, order.apiData["payment"]["id"]
+            ):
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "reason": "Got error attempting to print receipt",
+                    }
+                )
 
     return JsonResponse({"success": True})
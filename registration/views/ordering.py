@@ -3,16 +3,26 @@ import logging
 import time
 from json import JSONDecodeError
 
+from django.db import transaction
 from django.http import JsonResponse
 from idempotency_key.decorators import idempotency_key
 
 import registration.emails
+from registration.catalog import release_option, reserve_option
+from registration.events import get_default_event
 from registration.models import *
 from registration.payments import charge_payment
+from registration.pricing import (
+    CartPricing,
+    PriceCatalog,
+    discount_total,
+    get_discount,
+    option_price,
+)
 
-from .attendee import check_if_option_is_sold_out
-from .cart import saveCart
 from . import cart, common
+from .attendee import check_if_option_is_sold_out
+from .cart import load_carts, save_carts
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +37,7 @@ def do_checkout(
     donationCharity,
     request=None,
 ):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     reference = common.get_unique_confirmation_token(Order)
 
     order = Order(
@@ -59,27 +69,43 @@ def do_checkout(
                 ),
             )
 
+    try:
+        entries = load_carts(cartItems) if cartItems else []
+    except ValueError as e:
+        logger.error(e)
+        return False, str(e), order
+
     status, response = charge_payment(order, billingData, request)
 
     if status:
+        save_order(order, discount, entries, orderItems)
+        return True, "", order
+
+    return False, response, order
+
+
+def save_order(order, discount, entries, orderItems):
+    """
+    Save an order along with its new registrations (entries from
+    load_carts) or existing order items, in one transaction.  Limited
+    options in entries must already be reserved.
+    """
+    with transaction.atomic():
         order.save()
 
-        if cartItems:
-            for item in cartItems:
-                order_item = saveCart(item)
-                order_item.order = order
-                order_item.save()
+        if entries:
+            save_carts(entries, order, reserved=True)
         elif orderItems:
+            OrderItem.objects.filter(pk__in=[item.pk for item in orderItems]).update(
+                order=order
+            )
             for order_item in orderItems:
                 order_item.order = order
-                order_item.save()
+            Badge.objects.filter(orderitem__order=order).distinct().refresh_status()
 
         if discount:
             discount.used = discount.used + 1
             discount.save()
-        return True, "", order
-
-    return False, response, order
 
 
 def doZeroCheckout(discount, cartItems, orderItems):
@@ -94,6 +120,12 @@ def doZeroCheckout(discount, cartItems, orderItems):
         billingName = "{0} {1}".format(attendee.firstName, attendee.lastName)
         billingEmail = attendee.email
 
+    try:
+        entries = load_carts(cartItems) if cartItems else []
+    except ValueError as e:
+        logger.error(e)
+        return False, str(e), None
+
     reference = common.get_unique_confirmation_token(Order)
 
     order = Order(
@@ -107,103 +139,40 @@ def doZeroCheckout(discount, cartItems, orderItems):
         billingEmail=billingEmail,
         billingName=billingName,
     )
-    order.save()
-
-    if cartItems:
-        for item in cartItems:
-            orderItem = saveCart(item)
-            orderItem.order = order
-            orderItem.save()
-    elif orderItems:
-        for oitem in orderItems:
-            oitem.order = order
-            oitem.save()
-
-    if discount:
-        discount.used = discount.used + 1
-        discount.save()
+    save_order(order, discount, entries, orderItems)
     return True, "", order
 
 
 def getCartItemOptionTotal(options):
+    catalog = PriceCatalog.load(option_ids=[option["id"] for option in options])
     optionTotal = 0
     for option in options:
-        optionData = PriceLevelOption.objects.get(id=option["id"])
-        if optionData.optionExtraType == "int":
-            if option["value"]:
-                optionTotal += optionData.optionPrice * Decimal(option["value"])
-        else:
-            optionTotal += optionData.optionPrice
+        optionTotal += option_price(catalog.option(option["id"]), option["value"])
     return optionTotal
 
 
 def get_order_item_option_total(options):
     optionTotal = 0
     for option in options:
-        if option.option.optionExtraType == "int":
-            if option.optionValue:
-                optionTotal += option.option.optionPrice * Decimal(option.optionValue)
-        else:
-            optionTotal += option.option.optionPrice
+        optionTotal += option_price(option.option, option.optionValue)
     return optionTotal
 
 
 def get_discount_total(disc, subtotal):
-    try:
-        discount = Discount.objects.get(codeName=disc)
-    except Discount.DoesNotExist:
+    if disc is None:
         return 0
-    if discount.isValid():
-        if discount.amountOff:
-            return discount.amountOff
-        elif discount.percentOff:
-            return Decimal(float(subtotal) * float(discount.percentOff) / 100)
-    return 0
+    discount = get_discount(disc)
+    if discount is None:
+        return 0
+    return discount_total(discount, subtotal)
 
 
 def get_total(cartItems, orderItems, disc=""):
-    total = 0
-    total_discount = 0
     if not cartItems and not orderItems:
         return 0, 0
 
-    for item in cartItems:
-        post_data = json.loads(item.formData)
-        pdp = post_data["priceLevel"]
-        price_level = PriceLevel.objects.get(id=pdp["id"])
-        item_total = price_level.basePrice
-
-        options = pdp["options"]
-        item_total += getCartItemOptionTotal(options)
-
-        if disc:
-            discount = get_discount_total(disc, item_total)
-            total_discount += discount
-            item_total -= discount
-
-        if item_total > 0:
-            total += item_total
-
-    for item in orderItems:
-        item_sub_total = item.priceLevel.basePrice
-        eff_level = item.badge.effectiveLevel()
-
-        if eff_level:
-            item_total = item_sub_total - eff_level.basePrice
-        else:
-            item_total = item_sub_total
-
-        item_total += get_order_item_option_total(item.attendeeoptions_set.all())
-
-        if disc:
-            discount = get_discount_total(disc, item_total)
-            total_discount += discount
-            item_total -= discount
-
-        if item_total > 0:
-            total += item_total
-
-    return total, total_discount
+    pricing = CartPricing(cartItems, orderItems, disc)
+    return pricing.total, pricing.total_discount
 
 
 def apply_discount(request):
@@ -235,6 +204,25 @@ def apply_discount(request):
     return JsonResponse({"success": True})
 
 
+def reserve_options(event, options):
+    """
+    Reserve one unit of each limited option, all or nothing.  Returns the
+    option that sold out, or None once everything is reserved.
+    """
+    reserved = []
+    for option in options:
+        if not reserve_option(event.pk, option):
+            release_options(event, reserved)
+            return option
+        reserved.append(option)
+    return None
+
+
+def release_options(event, options):
+    for option in options:
+        release_option(event.pk, option)
+
+
 def add_attendee_to_assistant(request, attendee):
     assistant_id = request.session.get("assistant_id")
     if assistant_id:
@@ -249,7 +237,7 @@ def add_attendee_to_assistant(request, attendee):
 
 @idempotency_key(optional=False)
 def checkout(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     session_items = request.session.get("cart_items", [])
     cart_items = list(Cart.objects.filter(id__in=session_items))
     order_items = request.session.get("order_items", [])
@@ -275,49 +263,67 @@ def checkout(request):
     if order_items:
         order_items = list(OrderItem.objects.filter(id__in=order_items))
 
-    subtotal, _ = get_total(cart_items, order_items, discount)
+    pricing = CartPricing(cart_items, order_items, discount)
+    subtotal = pricing.total
 
     if not cart_items and not order_items:
         return common.abort(400, "There is nothing in your cart!")
 
-    minimum_org_donation = 0.00
-    for item in order_items:
-        effective_level = item.badge.effectiveLevel()
-
-        if effective_level.minimumOrgDonation and effective_level.minimumOrgDonation > minimum_org_donation:
-            minimum_org_donation = effective_level.minimumOrgDonation
-
-    for cart in (cart_items or []):
-        postData = json.loads(cart.formData)
-        priceLevel = postData["priceLevel"]
-
-        for postDataOption in priceLevel["options"]:
-            option = PriceLevelOption.objects.get(id=int(postDataOption["id"]))
-
-            if option.quantity is None:
-                continue
-
-            if not check_if_option_is_sold_out(option):
-                continue
-
-            return common.abort(400, {
+    minimum_org_donation = pricing.minimum_org_donation
+
+    # Limited options that saveCart will create AttendeeOptions rows for.
+    limited_options = [
+        option
+        for line in pricing.lines
+        if isinstance(line.item, Cart)
+        for option, value in line.options
+        if option.quantity is not None
+        and (value != "" or option.optionExtraType == "int")
+    ]
+
+    for option in limited_options:
+        if not check_if_option_is_sold_out(option):
+            continue
+
+        return common.abort(
+            400,
+            {
                 "apisError": f"{option.optionName} is sold out. Please remove it from your cart."
-            })
+            },
+        )
 
     porg = Decimal(post_data.get("orgDonation") or "0.00")
 
-    if discount and discount.waiveRequiredDonation:
-        minimum_org_donation = 0.00
-
     if porg < 0:
         porg = 0
 
     if porg < minimum_org_donation:
-        return common.abort(400, {"apisError": f"A minimum of ${minimum_org_donation} donation is required."})
+        return common.abort(
+            400,
+            {
+                "apisError": f"A minimum of ${minimum_org_donation} donation is required."
+            },
+        )
+
+    # The check above is against cached counts; this is the one that holds
+    # under concurrent checkouts.
+    sold_out = reserve_options(event, limited_options)
+    if sold_out:
+        return common.abort(
+            400,
+            {
+                "apisError": f"{sold_out.optionName} is sold out. Please remove it from your cart."
+            },
+        )
 
     if subtotal == 0 and not porg:
-        status, message, order = doZeroCheckout(discount, cart_items, order_items)
+        try:
+            status, message, order = doZeroCheckout(discount, cart_items, order_items)
+        except Exception:
+            release_options(event, limited_options)
+            raise
         if not status:
+            release_options(event, limited_options)
             return common.abort(400, message)
 
         existing_order_item = order.orderitem_set.first()
@@ -349,34 +355,39 @@ def checkout(request):
 
     onsite = post_data["onsite"]
     if onsite:
-        reference = common.get_unique_confirmation_token(Order)
-        order = Order(
-            total=Decimal(total),
-            reference=reference,
-            discount=discount,
-            orgDonation=porg,
-            charityDonation=pcharity,
-            billingType=Order.UNPAID,
-        )
-        order.status = "Onsite Pending"
-        order.save()
-
-        if cart_items:
-            for item in cart_items:
-                order_item = saveCart(item)
-                order_item.order = order
-                order_item.save()
-
-        if discount:
-            discount.used = discount.used + 1
-            discount.save()
+        try:
+            entries = load_carts(cart_items) if cart_items else []
+
+            reference = common.get_unique_confirmation_token(Order)
+            order = Order(
+                total=Decimal(total),
+                reference=reference,
+                discount=discount,
+                orgDonation=porg,
+                charityDonation=pcharity,
+                billingType=Order.UNPAID,
+            )
+            order.status = "Onsite Pending"
+            save_order(order, discount, entries, [])
+        except ValueError as e:
+            release_options(event, limited_options)
+            return common.abort(400, str(e))
+        except Exception:
+            release_options(event, limited_options)
+            raise
 
         status = True
         message = "Onsite success"
     else:
-        status, message, order = do_checkout(
-            pbill, total, discount, cart_items, order_items, porg, pcharity, request
-        )
+        try:
+            status, message, order = do_checkout(
+                pbill, total, discount, cart_items, order_items, porg, pcharity, request
+            )
+        except Exception:
+            release_options(event, limited_options)
+            raise
+        if not status:
+            release_options(event, limited_options)
 
     if status:
         existing_order_item = order.orderitem_set.first()
@@ -389,7 +400,7 @@ def checkout(request):
         try:
             registration.emails.send_registration_email(order, order.billingEmail)
         except Exception as e:
-            event = Event.objects.get(default=True)
+            event = get_default_event()
             registration_email = common.get_registration_email(event)
 
             logger.error("Error sending RegistrationEmail.")
@@ -1,13 +1,18 @@
+import functools
 import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Union
 
 from django.conf import settings
 from django.contrib import messages
 from django.core.signing import TimestampSigner
+from django.db.models import F
 from django.http import FileResponse, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.template import Context, Template
+from django.utils.http import parse_etags
 from gotenberg_client import GotenbergClient
 from gotenberg_client.options import (
     MarginType,
@@ -16,11 +21,17 @@ from gotenberg_client.options import (
     PageSize,
 )
 
-from registration import mqtt
-from registration.models import Badge, Dealer, Staff
+from registration import pdf_cache
+from registration.models import Badge, Firebase
+from registration.views import onsite_admin
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on concurrent Gotenberg renders for one print request.
+GOTENBERG_WORKERS = getattr(settings, "GOTENBERG_WORKERS", 4)
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
 
 def printNametag(request):
     context = {
@@ -45,17 +56,83 @@ def pdfFromDisk(request: HttpRequest) -> Union[FileResponse, JsonResponse]:
         )
 
     root_dir = getattr(settings, "PDF_DIRECTORY", "/tmp")
+    path = Path(root_dir).joinpath(Path(name).name)
+    if not path.is_file():
+        return JsonResponse({"success": False, "reason": "IO error"}, status=404)
+    return serve_pdf_file(request, path)
+
+
+def serve_pdf_file(
+    request: HttpRequest, path: Path
+) -> Union[FileResponse, HttpResponse]:
+    """Serves a PDF with ETag validation and single byte-range support."""
     try:
-        path = Path(root_dir).joinpath(Path(name).name)
-        f = open(path, "rb")
-    except IOError:
+        stat = path.stat()
+    except OSError:
         return JsonResponse({"success": False, "reason": "IO error"}, status=404)
 
-    response = FileResponse(f, content_type="application/pdf")
+    if pdf_cache.is_cached_name(path.name):
+        # Cache entries are named after the hash of their content.
+        etag = f'"{path.stem[len(pdf_cache.PREFIX):]}"'
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (
+        etag in parse_etags(if_none_match) or if_none_match.strip() == "*"
+    ):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            response["Access-Control-Allow-Origin"] = "*"
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type="application/pdf")
+    else:
+        start, end = byte_range
+        with open(path, "rb") as f:
+            f.seek(start)
+            content = f.read(end - start + 1)
+        response = HttpResponse(content, status=206, content_type="application/pdf")
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
     response["Access-Control-Allow-Origin"] = "*"
     return response
 
 
+def parse_range(header, size):
+    """
+    Returns the inclusive (start, end) of a single "bytes=" range, or None if
+    it can't be satisfied.  Multiple ranges aren't supported.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start == "":
+        if end == "" or int(end) == 0:
+            return None
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = size - 1 if end == "" else min(int(end), size - 1)
+    if start > end:
+        return None
+    return start, end
+
+
 def pdfFromGotenberg(request: HttpRequest) -> Union[HttpResponse, JsonResponse]:
     data = request.GET.get("data", None)
     if not data:
@@ -68,17 +145,38 @@ def pdfFromGotenberg(request: HttpRequest) -> Union[HttpResponse, JsonResponse]:
         return JsonResponse({"success": False, "reason": "Invalid data"}, status=401)
 
     badge_ids = data_obj.get("badge_ids", [])
-    queryset = Badge.objects.filter(id__in=badge_ids)
+    path = generate_gotenberg_labels(Badge.objects.filter(id__in=badge_ids), request)
+    if path is None:
+        return JsonResponse(
+            {"success": False, "reason": "No PDFs were generated"}, status=404
+        )
 
+    if terminal := data_obj.get("terminal", None):
+        onsite_admin.push_cart_update(Firebase.objects.filter(name=terminal).first())
+
+    return serve_pdf_file(request, path)
+
+
+def generate_gotenberg_labels(queryset, request=None, mark_printed=True):
+    """
+    Renders the badges in queryset through Gotenberg and, unless mark_printed
+    is False, marks them printed.  Returns the path of the PDF in the cache, or None if nothing was
+    printable.  Skipped badges are reported through messages when there's a
+    request, and logged otherwise.
+    """
     badge_groups = {}
     badge_templates = {}
+    printed_ids = []
 
-    for badge in queryset:
-        level = badge.effectiveLevel()
+    # with_status() annotates level and staff/dealer association in one query.
+    for badge in queryset.with_status().select_related("event__defaultBadgeTemplate"):
+        level = badge.effective_level_name
         if not level or level == Badge.UNPAID:
-            messages.warning(
-                request, f"skipped printing {badge} because level is {level}"
-            )
+            warning = f"skipped printing {badge} because level is {level}"
+            if request is None:
+                logger.warning(warning)
+            else:
+                messages.warning(request, warning)
             continue
 
         badge_template = badge.event.defaultBadgeTemplate
@@ -86,13 +184,12 @@ def pdfFromGotenberg(request: HttpRequest) -> Union[HttpResponse, JsonResponse]:
             badge_groups[badge_template.id] = []
             badge_templates[badge_template.id] = (
                 badge_template,
-                Template(badge_template.template),
+                compile_badge_template(badge_template.id, badge_template.template),
             )
 
-        level = str(level)
-        if Staff.objects.filter(attendee=badge.attendee, event=badge.event).exists():
+        if badge.is_staff:
             level = "Staff"
-        elif Dealer.objects.filter(attendee=badge.attendee, event=badge.event).exists():
+        elif badge.is_dealer:
             level = "Dealer"
 
         badge_groups[badge_template.id].append(
@@ -102,68 +199,104 @@ def pdfFromGotenberg(request: HttpRequest) -> Union[HttpResponse, JsonResponse]:
                 "number": badge.badgeNumber,
             }
         )
+        printed_ids.append(badge.id)
+
+    if not badge_groups:
+        return None
+
+    # Identical reprints are served from the cache without calling Gotenberg.
+    key = pdf_cache.get_key(
+        "gotenberg",
+        [
+            get_badge_template_version(badge_templates[badge_template_id][0])
+            for badge_template_id in badge_groups
+        ],
+        list(badge_groups.values()),
+    )
+    path = pdf_cache.lookup(key)
+    if path is None:
+        path = pdf_cache.store(key, render_badge_groups(badge_groups, badge_templates))
+
+    if mark_printed:
+        Badge.objects.filter(id__in=printed_ids).update(
+            printed=True, printCount=F("printCount") + 1
+        )
+    return path
 
-    with GotenbergClient(settings.GOTENBERG_HOST) as client:
-        pdfs = []
 
+def render_badge_groups(badge_groups, badge_templates):
+    """Renders each template group and merges them into one PDF."""
+    with GotenbergClient(settings.GOTENBERG_HOST) as client:
+        # Render templates here rather than in the pool; only the HTTP round
+        # trips to Gotenberg happen concurrently.
+        jobs = []
         for badge_template_id, badges in badge_groups.items():
             (badge_template, template) = badge_templates[badge_template_id]
             context = Context({"badges": badges})
-            rendered = str(template.render(context))
-
-            with client.chromium.html_to_pdf() as route:
-                response = (
-                    route.size(
-                        PageSize(badge_template.paperWidth, badge_template.paperHeight)
-                    )
-                    .margins(
-                        PageMarginsType(
-                            MarginType(badge_template.marginTop),
-                            MarginType(badge_template.marginBottom),
-                            MarginType(badge_template.marginLeft),
-                            MarginType(badge_template.marginRight),
-                        )
-                    )
-                    .orient(
-                        PageOrientation(
-                            PageOrientation.Landscape
-                            if badge_template.landscape
-                            else PageOrientation.Portrait
-                        )
-                    )
-                    .scale(badge_template.scale)
-                    .string_resource(rendered, "index.html")
-                    .render_expr("window.badgeReady === true")
-                    .run()
-                )
-                pdfs.append(response.content)
+            jobs.append((badge_template, str(template.render(context))))
+
+        workers = min(len(jobs), GOTENBERG_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pdfs = list(pool.map(lambda job: render_gotenberg_pdf(client, *job), jobs))
+
+        if len(pdfs) == 1:
+            return pdfs[0]
 
-        finalPdf = None
+        with client.merge.merge() as route:
+            req = route
+            for index, badgePdf in enumerate(pdfs):
+                req._add_in_memory_file(badgePdf, name=f"{index}.pdf")
+            response = req.run()
+            return response.content
 
-        if len(pdfs) == 0:
-            return JsonResponse(
-                {"success": False, "reason": "No PDFs were generated"}, status=404
+
+def get_badge_template_version(badge_template):
+    """Everything about a BadgeTemplate that affects its rendered output."""
+    return [
+        badge_template.id,
+        badge_template.template,
+        badge_template.paperWidth,
+        badge_template.paperHeight,
+        badge_template.marginTop,
+        badge_template.marginBottom,
+        badge_template.marginLeft,
+        badge_template.marginRight,
+        badge_template.landscape,
+        badge_template.scale,
+    ]
+
+
+@functools.lru_cache(maxsize=32)
+def compile_badge_template(badge_template_id, source):
+    """
+    Compiled Template for a BadgeTemplate.  Keyed on the source as well as
+    the id so edits in the admin take effect immediately.
+    """
+    return Template(source)
+
+
+def render_gotenberg_pdf(client, badge_template, rendered):
+    with client.chromium.html_to_pdf() as route:
+        response = (
+            route.size(PageSize(badge_template.paperWidth, badge_template.paperHeight))
+            .margins(
+                PageMarginsType(
+                    MarginType(badge_template.marginTop),
+                    MarginType(badge_template.marginBottom),
+                    MarginType(badge_template.marginLeft),
+                    MarginType(badge_template.marginRight),
+                )
+            )
+            .orient(
+                PageOrientation(
+                    PageOrientation.Landscape
+                    if badge_template.landscape
+                    else PageOrientation.Portrait
+                )
             )
-        elif len(pdfs) == 1:
-            finalPdf = pdfs[0]
-        else:
-            with client.merge.merge() as route:
-                req = route
-                for index, badgePdf in enumerate(pdfs):
-                    req._add_in_memory_file(badgePdf, name=f"{index}.pdf")
-                response = req.run()
-                finalPdf = response.content
-
-        http_resp = HttpResponse()
-        http_resp.headers["content-type"] = "application/pdf"
-        http_resp.write(finalPdf)
-
-        for badge in queryset:
-            badge.printed = True
-            badge.save()
-
-        if terminal := data_obj.get("terminal", None):
-            topic = f"{mqtt.get_topic('admin', terminal)}/refresh"
-            mqtt.send_mqtt_message(topic, None)
-
-        return http_resp
+            .scale(badge_template.scale)
+            .string_resource(rendered, "index.html")
+            .render_expr("window.badgeReady === true")
+            .run()
+        )
+        return response.content
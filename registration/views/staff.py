@@ -11,7 +11,9 @@ from django.urls import reverse
 from django.views.decorators.http import require_POST
 
 import registration.emails
+from registration.events import get_default_event, get_event_by_name
 from registration.models import *
+from registration.pricing import CartPricing
 
 from .common import (
     abort,
@@ -21,14 +23,14 @@ from .common import (
     logger,
     success,
 )
-from .ordering import do_checkout, doZeroCheckout, get_total
+from .ordering import do_checkout, doZeroCheckout
 
 logger = logging.getLogger(__name__)
 form_type = "staff"
 
 
 def new_staff(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     invite = TempToken.objects.get(token=guid)
     tz = timezone.get_current_timezone()
     today = tz.localize(datetime.now())
@@ -39,10 +41,15 @@ def new_staff(request, guid):
     else:
         context["homeRedirect"] = reverse("registration:index")
 
-    if event.staffRegStart <= today <= event.staffRegEnd or invite.ignore_time_window is True:
+    if (
+        event.staffRegStart <= today <= event.staffRegEnd
+        or invite.ignore_time_window is True
+    ):
         return render(request, "registration/staff/staff-new.html", context)
     elif event.staffRegStart >= today:
-        context["message"] = "is not yet open. Please stay tuned to slack and email for updates!"
+        context["message"] = (
+            "is not yet open. Please stay tuned to slack and email for updates!"
+        )
         return render(request, "registration/staff/staff-closed.html", context)
     elif event.staffRegEnd <= today:
         context["message"] = "has ended."
@@ -73,7 +80,7 @@ def find_new_staff(request):
 
 
 def info_new_staff(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     token_value = request.session.get("new_staff")
     context = {"staff": None, "event": event, "form_type": form_type}
     try:
@@ -112,9 +119,9 @@ def add_new_staff(request):
     evt = postData.get("event")
 
     if evt:
-        event = Event.objects.get(name=evt)
+        event = get_event_by_name(evt)
     else:
-        event = Event.objects.get(default=True)
+        event = get_default_event()
 
     tz = timezone.get_current_timezone()
     birthdate = tz.localize(datetime.strptime(pda["birthdate"], "%Y-%m-%d"))
@@ -178,7 +185,7 @@ def add_new_staff(request):
 
 
 def staff_index(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     tz = timezone.get_current_timezone()
     today = tz.localize(datetime.now())
     context = {"token": guid, "event": event, "form_type": form_type}
@@ -191,7 +198,9 @@ def staff_index(request, guid):
     if event.staffRegStart <= today <= event.staffRegEnd:
         return render(request, "registration/staff/staff-locate.html", context)
     elif event.staffRegStart >= today:
-        context["message"] = "is not yet open. Please stay tuned to slack and email for updates!"
+        context["message"] = (
+            "is not yet open. Please stay tuned to slack and email for updates!"
+        )
         return render(request, "registration/staff/staff-closed.html", context)
     elif event.staffRegEnd <= today:
         context["message"] = "has ended."
@@ -199,7 +208,7 @@ def staff_index(request, guid):
 
 
 def staff_done(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event, "form_type": form_type}
     return render(request, "registration/staff/staff-done.html", context)
 
@@ -226,7 +235,7 @@ def find_staff(request):
 
 
 def info_staff(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"staff": None, "event": event, "form_type": form_type}
 
     staff_id = request.session.get("staff_id")
@@ -271,9 +280,9 @@ def add_staff(request):
     evt = postData.get("event")
 
     if evt:
-        event = Event.objects.get(name=evt)
+        event = get_event_by_name(evt)
     else:
-        event = Event.objects.get(default=True)
+        event = get_default_event()
 
     attendee = Attendee.objects.get(id=pda["id"])
     if not attendee:
@@ -361,7 +370,7 @@ def get_staff_total(orderItems, discount, staff):
 
     if badge.effectiveLevel():
         discount = None
-    sub_total = get_total(orderItems, discount)
+    sub_total = CartPricing([], orderItems, discount).total
     already_paid = badge.paidTotal()
     total = sub_total - already_paid
 
@@ -378,7 +387,7 @@ def get_staff_email(event=None):
     default of APIS_DEFAULT_EMAIL in settings.py.
     """
     if event is None:
-        event = Event.objects.get(default=True)
+        event = get_default_event()
     if event.staffEmail == "":
         return settings.APIS_DEFAULT_EMAIL
     return event.staffEmail
@@ -11,6 +11,7 @@ from django.http import (
 from django.shortcuts import get_object_or_404, render
 
 import registration.emails
+from registration.events import get_default_event, get_event_by_name
 from registration.models import *
 
 from . import common
@@ -28,7 +29,7 @@ logger = logging.getLogger(__name__)
 
 
 def upgrade(request, guid):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"token": guid, "event": event}
     return render(request, "registration/attendee-locate.html", context)
 
@@ -57,7 +58,7 @@ def info_upgrade(request):
 
 
 def find_upgrade(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"attendee": None, "event": event}
     try:
         attendee_id = request.session["attendee_id"]
@@ -99,7 +100,7 @@ def add_upgrade(request):
     pdp = postData["priceLevel"]
     pdd = postData["badge"]
     evt = postData["event"]
-    event = Event.objects.get(name=evt)
+    event = get_event_by_name(evt)
 
     if "attendee_id" not in request.session:
         return HttpResponseServerError("Session expired")
@@ -159,13 +160,13 @@ def invoice_upgrade(request):
 
 
 def done_upgrade(request):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     context = {"event": event}
     return render(request, "registration/upgrade-done.html", context)
 
 
 def send_upgrade_email(request, attendee, order):
-    event = Event.objects.get(default=True)
+    event = get_default_event()
     clear_session(request)
     try:
         registration.emails.send_upgrade_payment_email(attendee, order)
@@ -0,0 +1,205 @@
+"""
+Queue of payment webhook notifications.
+
+With WEBHOOK_QUEUE on, square_webhook only verifies and stores the
+notification before answering, so Square never waits on (and retries
+because of) our processing.  The webhook_worker command processes stored
+notifications oldest first.  A notification is held back while an earlier
+one for the same payment is still outstanding, so refunds and disputes are
+applied in the order they happened.  Failures are retried with backoff;
+types without a handler are stored but never queued.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from prometheus_client import Counter, Histogram
+
+from registration import payments, queues
+from registration.models import PaymentWebhookNotification
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LAG_SECONDS = Histogram(
+    "webhook_lag_seconds", "Time from receiving a webhook to processing it", ["type"]
+)
+WEBHOOK_PROCESS_SECONDS = Histogram(
+    "webhook_process_seconds", "Time spent processing a webhook", ["type"]
+)
+WEBHOOK_RESULTS = Counter(
+    "webhook_results", "Webhook processing runs", ["type", "result"]
+)
+
+BATCH_SIZE = getattr(settings, "WEBHOOK_BATCH_SIZE", 20)
+
+# Attempts before a notification is given up on, and the delay before the
+# first retry, which doubles each time.
+MAX_ATTEMPTS = getattr(settings, "WEBHOOK_ATTEMPTS", 5)
+RETRY_DELAY = getattr(settings, "WEBHOOK_RETRY_DELAY", 30)
+
+HANDLERS = {
+    "refund.created": payments.process_webhook_refund_created,
+    "refund.updated": payments.process_webhook_refund_update,
+    "payment.updated": payments.process_webhook_payment_updated,
+    "dispute.created": payments.process_webhook_dispute_created_or_updated,
+    "dispute.state.updated": payments.process_webhook_dispute_created_or_updated,
+}
+
+
+def use_queue():
+    return getattr(settings, "WEBHOOK_QUEUE", False)
+
+
+def is_handled(body):
+    return body.get("type") in HANDLERS
+
+
+def skip(notification):
+    """Takes a notification without a handler out of the queue."""
+    notification.nextAttempt = None
+    notification.error = f"No handler for {notification.event_type}"
+    WEBHOOK_RESULTS.labels(notification.event_type, "skipped").inc()
+
+
+def get_payment_id(body):
+    """
+    The id of the payment a notification is about, or "".  Types without a
+    handler have none, so they never hold back anything else.
+    """
+    if not is_handled(body):
+        return ""
+    data = body.get("data") or {}
+    data_object = data.get("object") or {}
+    if data.get("type") == "payment":
+        return data.get("id") or ""
+    if "refund" in data_object:
+        return data_object["refund"].get("payment_id") or ""
+    if "dispute" in data_object:
+        disputed = data_object["dispute"].get("disputed_payment") or {}
+        return disputed.get("payment_id") or ""
+    return ""
+
+
+def process(notification):
+    """Runs the handler for a notification, returning whether it succeeded."""
+    handler = HANDLERS.get(notification.body.get("type"))
+    if handler is None:
+        return False
+    return bool(handler(notification))
+
+
+def process_now(notification):
+    """Processes a notification inline, as when the queue is off."""
+    if not is_handled(notification.body):
+        skip(notification)
+        notification.save()
+        return False
+    notification.processed = process(notification)
+    notification.attempts += 1
+    if notification.processed:
+        notification.processedAt = timezone.now()
+    notification.nextAttempt = None
+    notification.save()
+    return notification.processed
+
+
+def get_due(now=None):
+    """
+    Unprocessed notifications that are due, oldest first, leaving out any
+    with an earlier notification for the same payment still outstanding.
+    """
+    now = now or timezone.now()
+    earlier = PaymentWebhookNotification.objects.filter(
+        paymentId=OuterRef("paymentId"),
+        processed=False,
+        nextAttempt__isnull=False,
+        pk__lt=OuterRef("pk"),
+    ).exclude(paymentId="")
+    return (
+        PaymentWebhookNotification.objects.filter(processed=False, nextAttempt__lte=now)
+        .exclude(Exists(earlier))
+        .order_by("timestamp", "pk")
+    )
+
+
+def run_one(notification):
+    """Processes a locked notification and records the outcome."""
+    event_type = notification.event_type
+    if not is_handled(notification.body):
+        skip(notification)
+        notification.save(update_fields=["nextAttempt", "error"])
+        return
+    notification.attempts += 1
+    start = time.monotonic()
+    try:
+        # Roll back a handler's partial changes if it fails.
+        with transaction.atomic():
+            result = process(notification)
+            if not result:
+                raise WebhookError(f"No handler succeeded for {event_type}")
+    except Exception as e:
+        logger.exception(f"Processing webhook {notification} failed")
+        notification.error = str(e)
+        notification.nextAttempt = queues.get_next_attempt(
+            notification.attempts, MAX_ATTEMPTS, RETRY_DELAY
+        )
+        result = "failed" if notification.nextAttempt is None else "retry"
+        WEBHOOK_RESULTS.labels(event_type, result).inc()
+    else:
+        notification.processed = True
+        notification.processedAt = timezone.now()
+        notification.nextAttempt = None
+        notification.error = ""
+        WEBHOOK_RESULTS.labels(event_type, "processed").inc()
+        WEBHOOK_LAG_SECONDS.labels(event_type).observe(
+            (notification.processedAt - notification.timestamp).total_seconds()
+        )
+    WEBHOOK_PROCESS_SECONDS.labels(event_type).observe(time.monotonic() - start)
+    notification.save(
+        update_fields=["processed", "processedAt", "attempts", "nextAttempt", "error"]
+    )
+
+
+def run_batch(size=BATCH_SIZE):
+    """
+    Processes up to size due notifications, returning how many were run.
+    Each is processed while its row is locked, so other workers skip it and
+    anything later for the same payment stays held back until it commits.
+    """
+    count = 0
+    now = timezone.now()
+    for pk in get_due(now).values_list("pk", flat=True)[:size]:
+        with transaction.atomic():
+            # Checked again under the lock, in case another worker got here first.
+            notification = (
+                get_due(now).select_for_update(skip_locked=True).filter(pk=pk).first()
+            )
+            if notification is None:
+                continue
+            run_one(notification)
+            count += 1
+    return count
+
+
+def run_pending(limit=None):
+    """Processes due notifications until none are left, returning the count."""
+    return queues.run_until_empty(run_batch, BATCH_SIZE, limit)
+
+
+def replay(queryset):
+    """Queues notifications to be processed again, returning the count."""
+    return queryset.update(
+        processed=False,
+        attempts=0,
+        nextAttempt=timezone.now(),
+        processedAt=None,
+        error="",
+    )
+
+
+class WebhookError(Exception):
+    pass